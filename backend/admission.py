@@ -0,0 +1,181 @@
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from llm_policy import LLMError
+
+
+class Overloaded(LLMError):
+    """Raised instead of queueing when the LLM is at capacity"""
+
+    status_code = 429
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message, retry_after)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key onto one execution.
+
+    ``do`` runs the work as a task and every caller with the same key awaits
+    that task, shielded: a caller that goes away does not cancel it, so a
+    retry arriving meanwhile joins it rather than starting over. Work driven
+    by a generator registers a plain future with ``claim`` and resolves it
+    with ``settle``; if that work is abandoned, waiting callers take over.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+
+        # Metrics
+        self.started = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def get(self, key: Hashable) -> Optional[asyncio.Future]:
+        return self._flights.get(key)
+
+    def _register(self, key: Hashable, future: asyncio.Future) -> asyncio.Future:
+        self._flights[key] = future
+        self.started += 1
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def _forget(self, key: Hashable, future: asyncio.Future):
+        if self._flights.get(key) is future:
+            del self._flights[key]
+        # Nobody may be waiting; the callers that are see the error themselves
+        if not future.cancelled():
+            future.exception()
+
+    def start(self, key: Hashable, coro: Awaitable[Any]) -> asyncio.Task:
+        """Run ``coro`` as a task that is the flight for ``key`` (which must be free)"""
+        return self._register(key, asyncio.get_running_loop().create_task(coro))
+
+    async def follow(self, future: asyncio.Future) -> Any:
+        """Wait for another caller's flight; raises CancelledError if it was abandoned"""
+        self.coalesced += 1
+        return await asyncio.shield(future)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the result of the in-flight call for ``key``, starting ``fn()`` if there is none"""
+        while True:
+            future = self._flights.get(key)
+            if future is None:
+                return await asyncio.shield(self.start(key, fn()))
+            try:
+                return await self.follow(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+
+    def claim(self, key: Hashable) -> asyncio.Future:
+        """Become the flight for ``key`` (which must be free); resolve it with ``settle``"""
+        return self._register(key, asyncio.get_running_loop().create_future())
+
+    def settle(self, future: asyncio.Future, result: Any = None, error: Optional[BaseException] = None):
+        if future.done():
+            return
+        if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            future.cancel()
+        elif error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def metrics(self) -> dict:
+        return {
+            "in_flight": len(self._flights),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
+
+
+class ConcurrencyLimiter:
+    """
+    Caps outstanding LLM requests at ``max_concurrent``. Up to ``max_queued``
+    more wait for a slot (at most ``queue_timeout`` seconds); beyond that a
+    request fails at once with Overloaded rather than piling up behind the
+    others. Retry-After is the average time a slot is held.
+    """
+
+    def __init__(self, max_concurrent: int = 8, max_queued: int = 16, queue_timeout: float = 30.0):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queued = max(0, max_queued)
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self.active = 0
+        self.waiting = 0
+
+        # Metrics
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.hold_seconds = 0.0
+        self.completed = 0
+
+    @property
+    def has_capacity(self) -> bool:
+        """Whether a slot is free right now"""
+        return self.active < self.max_concurrent and self.waiting == 0
+
+    @property
+    def retry_after(self) -> int:
+        average = self.hold_seconds / self.completed if self.completed else 1.0
+        return max(1, math.ceil(average))
+
+    def check(self):
+        """Raise Overloaded if a request arriving now would be turned away"""
+        if self.active + self.waiting >= self.max_concurrent + self.max_queued:
+            self.rejected += 1
+            raise Overloaded(
+                f"Too many AI requests in progress ({self.active} running, {self.waiting} queued); try again shortly",
+                self.retry_after
+            )
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the ``max_concurrent`` slots for the duration of the block"""
+        self.check()
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise Overloaded(f"Timed out after {self.queue_timeout:.0f}s waiting for an AI request slot", self.retry_after)
+        finally:
+            self.waiting -= 1
+        acquired = time.perf_counter()
+        waited = acquired - start
+        self.wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        self.admitted += 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+            self.hold_seconds += time.perf_counter() - acquired
+            self.completed += 1
+
+    def metrics(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "wait_time_avg_ms": round(self.wait_seconds / self.admitted * 1000, 2) if self.admitted else 0.0,
+            "wait_time_max_ms": round(self.max_wait_seconds * 1000, 2),
+            "retry_after": self.retry_after,
+        }
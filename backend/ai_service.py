@@ -1,18 +1,37 @@
 import os
+import asyncio
+import json
 import logging
-from emergentintegrations.llm.chat import LlmChat, UserMessage
-from dotenv import load_dotenv
 from pathlib import Path
 import base64
 import io
-from PIL import Image
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Optional
+from image_processing import ImagePreprocessor
+from context_builder import ContextBuilder
+from response_cache import ResponseCache
+from admission import ConcurrencyLimiter, SingleFlight
+from llm_policy import LLMError, LLMPolicy
+from llm_transport import SharedTransport
+from model_router import DEFAULT_MODELS, DEFAULT_SIMPLE_TARGETS, ModelRouter
+from speech import SpeechTranscriber
 
-# Load .env from backend directory
-env_path = Path(__file__).parent / '.env'
-load_dotenv(dotenv_path=env_path)
+if TYPE_CHECKING:
+    from emergentintegrations.llm.chat import LlmChat, UserMessage
 
 logger = logging.getLogger(__name__)
 
+NOT_CONFIGURED_MESSAGE = "AI service is not configured. Please set EMERGENT_LLM_KEY in the .env file."
+
+
+def _llm_sdk():
+    """
+    The LLM SDK, imported on first use: it pulls in the provider clients and
+    takes longer to import than the rest of the backend together, so it is
+    kept off the startup path.
+    """
+    from emergentintegrations.llm import chat
+    return chat
+
 
 class AIService:
     def __init__(self):
@@ -25,9 +44,186 @@ class AIService:
         Provide clear, concise, and helpful answers to interview questions. 
         Focus on practical advice, code examples where relevant, and industry best practices.
         Be supportive and encouraging while being honest and accurate."""
+        
+        # Opt-in cache of answers to repeated questions, stored beside in_app.db
+        self.response_cache = ResponseCache(
+            Path(os.environ.get('RESPONSE_CACHE_PATH', Path(__file__).parent / 'response_cache.db')),
+            enabled=os.environ.get('RESPONSE_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes'),
+            max_entries=int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '1000')),
+            ttl=float(os.environ.get('RESPONSE_CACHE_TTL', str(7 * 24 * 3600)))
+        )
+        
+        # Screenshots are downsized and re-encoded off the event loop before upload
+        self.image_preprocessor = ImagePreprocessor(
+            workers=int(os.environ.get('IMAGE_WORKERS', '2')),
+            image_format=os.environ.get('IMAGE_FORMAT', 'JPEG'),
+            quality=int(os.environ.get('IMAGE_QUALITY', '82'))
+        )
+        
+        # Audio messages are transcribed on this machine with a local Whisper model
+        self.transcriber = SpeechTranscriber(
+            model=os.environ.get('STT_MODEL', 'base.en'),
+            workers=int(os.environ.get('STT_WORKERS', '1')),
+            cpu_threads=int(os.environ.get('STT_CPU_THREADS', '2')),
+            compute_type=os.environ.get('STT_COMPUTE_TYPE', 'int8'),
+            language=os.environ.get('STT_LANGUAGE')
+        )
+        
+        # Prior turns are replayed within a fixed token budget
+        self.context_builder = ContextBuilder(
+            budget_tokens=int(os.environ.get('CONTEXT_TOKEN_BUDGET', '3000')),
+            summary_tokens=int(os.environ.get('CONTEXT_SUMMARY_TOKENS', '500'))
+        )
+        
+        # A prompt identical to one already in flight for the session shares
+        # its LLM call, and outstanding calls are capped with a bounded queue
+        self.flights = SingleFlight()
+        self.limiter = ConcurrencyLimiter(
+            max_concurrent=int(os.environ.get('LLM_MAX_CONCURRENT', '8')),
+            max_queued=int(os.environ.get('LLM_MAX_QUEUED', '16')),
+            queue_timeout=float(os.environ.get('LLM_QUEUE_TIMEOUT', '30'))
+        )
+        
+        # Deadlines, retries, circuit breaking and hedging for provider calls
+        self.policy = LLMPolicy(
+            attempt_timeout=float(os.environ.get('LLM_ATTEMPT_TIMEOUT', '60')),
+            deadline=float(os.environ.get('LLM_DEADLINE', '120')),
+            stream_idle_timeout=float(os.environ.get('LLM_STREAM_IDLE_TIMEOUT', '30')),
+            max_attempts=int(os.environ.get('LLM_MAX_ATTEMPTS', '3')),
+            base_delay=float(os.environ.get('LLM_RETRY_BASE_DELAY', '0.5')),
+            max_delay=float(os.environ.get('LLM_RETRY_MAX_DELAY', '8')),
+            breaker_threshold=int(os.environ.get('LLM_BREAKER_THRESHOLD', '5')),
+            breaker_reset=float(os.environ.get('LLM_BREAKER_RESET', '30')),
+            hedge=os.environ.get('LLM_HEDGE', 'true').lower() in ('1', 'true', 'yes'),
+            hedge_percentile=float(os.environ.get('LLM_HEDGE_PERCENTILE', '95')),
+            hedge_min_delay=float(os.environ.get('LLM_HEDGE_MIN_DELAY', '2'))
+        )
+        
+        # LLM calls share one pool of keep-alive HTTP connections
+        self.transport = SharedTransport(
+            max_connections=int(os.environ.get('LLM_HTTP_MAX_CONNECTIONS', '20')),
+            max_keepalive=int(os.environ.get('LLM_HTTP_KEEPALIVE_CONNECTIONS', '10')),
+            keepalive_expiry=float(os.environ.get('LLM_HTTP_KEEPALIVE_SECONDS', '60'))
+        )
+        
+        # Requested models map to provider/model targets; simple questions go
+        # to a cheaper model and slow or failing providers to their fallbacks
+        simple_models = os.environ.get('LLM_SIMPLE_MODELS', ','.join(DEFAULT_SIMPLE_TARGETS))
+        self.router = ModelRouter(
+            self.policy,
+            models=json.loads(os.environ['LLM_MODELS']) if os.environ.get('LLM_MODELS') else DEFAULT_MODELS,
+            default_model=os.environ.get('LLM_DEFAULT_MODEL', 'GPT-5.2'),
+            simple_targets=[target.strip() for target in simple_models.split(',') if target.strip()],
+            simple_max_tokens=int(os.environ.get('LLM_SIMPLE_MAX_TOKENS', '32')),
+            latency_slo=float(os.environ.get('LLM_LATENCY_SLO', '30')),
+            answer_deadline=float(os.environ.get('LLM_FALLBACK_DEADLINE', '90')),
+            count_tokens=self.context_builder.count_tokens
+        )
+        
+        # "idle" until preload() runs, then "loading", "loaded" or "unavailable"
+        self.sdk_state = "idle"
+    
+    def preload(self):
+        """
+        Import the LLM SDK ahead of the first request and hand it the shared
+        HTTP client; blocking, so run it off the event loop
+        """
+        if not self.api_key or self.sdk_state != "idle":
+            return
+        self.sdk_state = "loading"
+        try:
+            _llm_sdk()
+            self.transport.install()
+            self.sdk_state = "loaded"
+        except Exception as e:
+            self.sdk_state = "unavailable"
+            logger.error(f"Failed to load the LLM SDK: {str(e)}")
+    
+    def _create_chat(self, session_id: str, provider: str, model_name: str) -> "LlmChat":
+        """
+        Create an LLM chat client for one call. LlmChat keeps a transcript of
+        everything sent through it, so a reused client would replay past
+        turns on top of the context builder's budgeted history; a fresh one
+        sends exactly the built prompt.
+        """
+        chat = _llm_sdk().LlmChat(
+            api_key=self.api_key,
+            session_id=session_id,
+            system_message=self.system_message
+        )
+        chat.with_model(provider, model_name)
+        return chat
+    
+    async def _send(self, session_id: str, target: str, user_msg: "UserMessage",
+                    deadline: Optional[float] = None) -> str:
+        """One non-streaming request to a "provider/model" target under the timeout, retry, breaker and hedging policy"""
+        provider, model_name = target.split("/", 1)
+        
+        def attempt(hedged: bool) -> Awaitable[str]:
+            # Retries and hedges get their own client too, so no attempt sees another's transcript
+            return self._create_chat(session_id, provider, model_name).send_message(user_msg)
+        return await self.policy.call(target, attempt, can_hedge=lambda: self.limiter.has_capacity,
+                                      deadline=deadline)
+    
+    async def _stream(self, session_id: str, target: str, user_msg: "UserMessage",
+                      deadline: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        Stream from a target; ``deadline`` bounds the wait for the first
+        chunk. Clients without a streaming API produce the whole completion
+        as one chunk, so they get the router's deadline for whole answers.
+        """
+        provider, model_name = target.split("/", 1)
+        if not hasattr(_llm_sdk().LlmChat, "stream_message"):
+            answer_deadline = self.router.answer_deadline if deadline is not None else None
+            yield await self._send(session_id, target, user_msg, answer_deadline)
+            return
+        
+        def open_stream():
+            return self._create_chat(session_id, provider, model_name).stream_message(user_msg)
+        async for chunk in self.policy.stream(target, open_stream, deadline):
+            if chunk:
+                yield chunk
+    
+    async def _build_message(self, session_id: str, user_message: str,
+                             image_data: str = None, audio_data: str = None) -> "UserMessage":
+        """Build the user message sent to the LLM"""
+        sdk = _llm_sdk()
+        message_content = user_message
+        file_contents = None
+        
+        # If image data is provided, add it to the message
+        if image_data:
+            # GPT-5.2 supports vision, so we can pass image
+            message_content = f"{user_message}\n\n[Image provided for analysis]"
+            logger.info(f"Processing message with image for session {session_id}")
+            file_contents = [sdk.ImageContent(image_base64=await self.image_preprocessor.process(image_data))]
+        
+        # If audio data is provided, send its transcript along with the text
+        if audio_data:
+            logger.info(f"Processing message with audio for session {session_id}")
+            try:
+                transcript = await self.transcribe_audio(audio_data)
+                message_content = f"{message_content}\n\n[Audio transcript]: {transcript or '(no speech)'}"
+            except Exception as e:
+                logger.warning(f"Could not transcribe audio for session {session_id}: {str(e)}")
+                message_content = f"{message_content}\n\n[Audio message provided]"
+        
+        if file_contents:
+            return sdk.UserMessage(text=message_content, file_contents=file_contents)
+        return sdk.UserMessage(text=message_content)
+    
+    def _use_cache(self, bypass_cache: bool, image_data: str, audio_data: str) -> bool:
+        """Only plain-text prompts are cacheable"""
+        if not self.response_cache.enabled or image_data or audio_data:
+            return False
+        if bypass_cache:
+            self.response_cache.record_bypass()
+            return False
+        return True
     
     async def get_response(self, session_id: str, user_message: str, model: str = "GPT-5.2", 
-                          image_data: str = None, audio_data: str = None) -> str:
+                          image_data: str = None, audio_data: str = None,
+                          bypass_cache: bool = False) -> str:
         """
         Get AI response for a user message with optional image or audio input
         
@@ -37,49 +233,136 @@ class AIService:
             model: The AI model to use (default: GPT-5.2)
             image_data: Base64 encoded image data (optional)
             audio_data: Base64 encoded audio data (optional)
+            bypass_cache: Skip the response cache for this request
         
         Returns:
             AI response as string
         """
         if not self.api_key:
-            return "AI service is not configured. Please set EMERGENT_LLM_KEY in the .env file."
+            return NOT_CONFIGURED_MESSAGE
         
         try:
-            # Initialize chat with session ID
-            chat = LlmChat(
-                api_key=self.api_key,
-                session_id=session_id,
-                system_message=self.system_message
-            )
+            use_cache = self._use_cache(bypass_cache, image_data, audio_data)
+            prompt = None
+            if use_cache:
+                prompt = await self.context_builder.build(session_id, user_message)
+                cached = await self.response_cache.get(prompt, model, self.system_message)
+                if cached is not None:
+                    logger.info(f"Served cached AI response for session {session_id}")
+                    self.context_builder.record_exchange(session_id, user_message, cached)
+                    return cached
             
-            # Configure with OpenAI GPT-5.2
-            chat.with_model("openai", "gpt-5.2")
-            
-            # Create user message
-            message_content = user_message
+            return await self.flights.do(
+                (session_id, model, user_message, image_data, audio_data),
+                lambda: self._complete(session_id, user_message, model, image_data, audio_data, prompt)
+            )
             
-            # If image data is provided, add it to the message
-            if image_data:
-                # GPT-5.2 supports vision, so we can pass image
-                message_content = f"{user_message}\n\n[Image provided for analysis]"
-                logger.info(f"Processing message with image for session {session_id}")
+        except LLMError:
+            raise
+        except Exception as e:
+            logger.error(f"Error getting AI response: {str(e)}")
+            raise Exception(f"Failed to get AI response: {str(e)}")
+    
+    async def _complete(self, session_id: str, user_message: str, model: str,
+                        image_data: str, audio_data: str, cache_prompt: Optional[str]) -> str:
+        """
+        One LLM round trip for get_response, run once per set of coalesced
+        callers. ``cache_prompt`` is the prompt already built for a cache
+        lookup, in which case the reply is cached under it.
+        """
+        # Turn the request away before preparing images if there is no room for it
+        self.limiter.check()
+        targets = self.router.route(model, user_message, bool(image_data or audio_data))
+        prompt = cache_prompt or await self.context_builder.build(session_id, user_message)
+        user_msg = await self._build_message(session_id, prompt, image_data, audio_data)
+        
+        # Send message and get response
+        async with self.limiter.slot():
+            response = await self.router.call(
+                targets, prompt, lambda target, deadline: self._send(session_id, target, user_msg, deadline)
+            )
+        self.context_builder.record_exchange(session_id, user_message, response)
+        
+        if cache_prompt is not None:
+            await self.response_cache.put(cache_prompt, model, self.system_message, response)
+        
+        logger.info(f"Successfully got AI response for session {session_id}")
+        return response
+    
+    async def stream_response(self, session_id: str, user_message: str, model: str = "GPT-5.2",
+                              image_data: str = None, audio_data: str = None,
+                              bypass_cache: bool = False) -> AsyncIterator[str]:
+        """
+        Stream the AI response for a user message as text chunks
+        
+        Chunks are forwarded as soon as the LLM client yields them. A target
+        that fails before its first chunk falls back to the next one.
+        
+        Args:
+            Same as get_response
+        
+        Yields:
+            Response text chunks in order
+        """
+        if not self.api_key:
+            yield NOT_CONFIGURED_MESSAGE
+            return
+        
+        try:
+            use_cache = self._use_cache(bypass_cache, image_data, audio_data)
+            if use_cache:
+                prompt = await self.context_builder.build(session_id, user_message)
+                cached = await self.response_cache.get(prompt, model, self.system_message)
+                if cached is not None:
+                    logger.info(f"Served cached AI response for session {session_id}")
+                    self.context_builder.record_exchange(session_id, user_message, cached)
+                    yield cached
+                    return
             
-            # If audio data is provided, add note (audio would need transcription first)
-            if audio_data:
-                message_content = f"{user_message}\n\n[Audio message provided]"
-                logger.info(f"Processing message with audio for session {session_id}")
+            # A duplicate of a prompt already streaming gets the finished reply as one chunk
+            key = (session_id, model, user_message, image_data, audio_data)
+            while (flight := self.flights.get(key)) is not None:
+                try:
+                    text = await self.flights.follow(flight)
+                except asyncio.CancelledError:
+                    if not flight.cancelled():
+                        raise
+                    # The stream it was waiting on was abandoned: run this one instead
+                    continue
+                yield text
+                return
             
-            # Create user message object
-            user_msg = UserMessage(text=message_content)
+            flight = self.flights.claim(key)
+            chunks = []
+            try:
+                self.limiter.check()
+                targets = self.router.route(model, user_message, bool(image_data or audio_data))
+                if not use_cache:
+                    prompt = await self.context_builder.build(session_id, user_message)
+                user_msg = await self._build_message(session_id, prompt, image_data, audio_data)
+                
+                async with self.limiter.slot():
+                    replies = self.router.stream(
+                        targets, prompt, lambda target, deadline: self._stream(session_id, target, user_msg, deadline)
+                    )
+                    async for chunk in replies:
+                        chunks.append(chunk)
+                        yield chunk
+            except BaseException as e:
+                self.flights.settle(flight, error=e)
+                raise
+            self.flights.settle(flight, "".join(chunks))
             
-            # Send message and get response
-            response = await chat.send_message(user_msg)
+            self.context_builder.record_exchange(session_id, user_message, "".join(chunks))
+            if use_cache:
+                await self.response_cache.put(prompt, model, self.system_message, "".join(chunks))
             
-            logger.info(f"Successfully got AI response for session {session_id}")
-            return response
+            logger.info(f"Finished streaming AI response for session {session_id}")
             
+        except LLMError:
+            raise
         except Exception as e:
-            logger.error(f"Error getting AI response: {str(e)}")
+            logger.error(f"Error streaming AI response: {str(e)}")
             raise Exception(f"Failed to get AI response: {str(e)}")
     
     async def analyze_image(self, session_id: str, image_data: str, question: str = None) -> str:
@@ -99,17 +382,18 @@ class AIService:
     
     async def transcribe_audio(self, audio_data: str) -> str:
         """
-        Transcribe audio to text (placeholder for now)
+        Transcribe audio to text on this machine (cached by audio hash)
         
         Args:
             audio_data: Base64 encoded audio
         
         Returns:
-            Transcribed text
+            Transcribed text, empty if no speech was found
+        
+        Raises:
+            SpeechUnavailable: faster-whisper is not installed
         """
-        # This would need a speech-to-text service like Whisper API
-        # For now, return placeholder
-        return "[Audio transcription would be implemented here with Whisper API or similar service]"
+        return (await self.transcriber.transcribe(audio_data))["text"]
 
 
 # Global AI service instance
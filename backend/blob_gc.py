@@ -0,0 +1,72 @@
+import asyncio
+import logging
+import os
+from typing import List
+from blob_store import blob_store
+from database import BlobDB
+from job_queue import job_queue
+
+logger = logging.getLogger(__name__)
+
+# Blobs looked at per write, so the writer is not held for long
+CHUNK_SIZE = 500
+# A blob stored within this long may be about to be referenced by a message
+# still on its way to the database (BlobStore.put touches existing files),
+# so it is left for a later sweep
+GRACE_SECONDS = 300.0
+
+
+def _settled(blob_hashes: List[str]) -> List[str]:
+    ages = ((blob_hash, blob_store.age(blob_hash)) for blob_hash in blob_hashes)
+    return [blob_hash for blob_hash, age in ages if age is None or age >= GRACE_SECONDS]
+
+
+@job_queue.handler("blobs.gc", priority=-10)
+async def collect_blobs(payload: dict) -> dict:
+    """
+    Remove blobs no message refers to any more. ``blobs.refs`` is kept by
+    triggers on messages, so this only has to sweep the ones at zero.
+    """
+    deleted = kept = 0
+    after = ""
+    while True:
+        candidates = await BlobDB.get_unreferenced(after, CHUNK_SIZE)
+        if not candidates:
+            break
+        after = candidates[-1]
+        settled = await asyncio.to_thread(_settled, candidates)
+        kept += len(candidates) - len(settled)
+        for blob_hash in await BlobDB.delete_unreferenced(settled) if settled else []:
+            # Re-checked: a row forgotten just as the blob was stored again is
+            # recreated by the write that references it, so its file stays
+            if await asyncio.to_thread(blob_store.delete, blob_hash, GRACE_SECONDS):
+                deleted += 1
+    orphans = await _collect_orphans()
+    if deleted or orphans:
+        logger.info(f"Removed {deleted} unreferenced blobs and {orphans} files without a row")
+    return {"deleted": deleted, "kept": kept, "orphans": orphans}
+
+
+async def _collect_orphans() -> int:
+    """
+    Remove files without a row: stored for a message whose write then failed
+    or was rolled back (a failed exchange, a migration that did not commit),
+    or kept above while too young. A message's blob always has a row, so
+    these are not referenced; one stored again meanwhile is too young to go.
+    """
+    removed = 0
+    files = await asyncio.to_thread(blob_store.settled, GRACE_SECONDS)
+    for start in range(0, len(files), CHUNK_SIZE):
+        chunk = files[start:start + CHUNK_SIZE]
+        known = set(await BlobDB.get_known(chunk))
+        for blob_hash in chunk:
+            if blob_hash not in known and await asyncio.to_thread(blob_store.delete, blob_hash, GRACE_SECONDS):
+                removed += 1
+    return removed
+
+job_queue.every("blobs.gc", float(os.environ.get('BLOB_GC_INTERVAL_MINUTES', '60')) * 60)
+
+
+async def collect_blobs_soon():
+    """Sweep blobs once messages were deleted; sweeps asked for meanwhile share one run"""
+    await job_queue.enqueue("blobs.gc", key="blobs.gc:deleted", replace=True)
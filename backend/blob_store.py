@@ -0,0 +1,132 @@
+import os
+import re
+import base64
+import hashlib
+import tempfile
+import time
+import logging
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+_DATA_URL_RE = re.compile(r"^data:(?P<type>[\w.+-]+/[\w.+-]+)?(?P<params>(;[^,;]+)*?);base64,", re.IGNORECASE)
+
+BLOB_URL_PREFIX = "/api/blobs/"
+
+
+def decode_data_url(value: str) -> Tuple[bytes, str]:
+    """Decode a base64 data URL (or bare base64) into bytes and a content type"""
+    match = _DATA_URL_RE.match(value)
+    if match:
+        content_type = match.group("type") or "application/octet-stream"
+        payload = value[match.end():]
+    else:
+        content_type = "application/octet-stream"
+        payload = value
+    return base64.b64decode(payload, validate=False), content_type.lower()
+
+
+def blob_url(blob_hash: str) -> str:
+    """Reference stored on a message in place of the inline payload"""
+    return f"{BLOB_URL_PREFIX}{blob_hash}"
+
+
+def is_inline_data(value: Optional[str]) -> bool:
+    return bool(value) and value.startswith("data:")
+
+
+class BlobStore:
+    """
+    Content-addressed file store. Each blob lives at ``<root>/<aa>/<sha256>``
+    so identical payloads are written once no matter how often they are sent.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def path_for(self, blob_hash: str) -> Path:
+        if not _HASH_RE.match(blob_hash):
+            raise ValueError(f"Invalid blob hash: {blob_hash}")
+        return self.root / blob_hash[:2] / blob_hash
+
+    def exists(self, blob_hash: str) -> bool:
+        return self.path_for(blob_hash).is_file()
+
+    def put(self, data: bytes) -> str:
+        """Store ``data`` and return its SHA-256 hash; a no-op if already present"""
+        blob_hash = hashlib.sha256(data).hexdigest()
+        path = self.path_for(blob_hash)
+        try:
+            # Touch the existing copy so a concurrent ``delete`` leaves it alone
+            os.utime(path)
+            return blob_hash
+        except FileNotFoundError:
+            pass
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial blob
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        logger.info(f"Stored blob {blob_hash} ({len(data)} bytes)")
+        return blob_hash
+
+    def put_data_url(self, value: str) -> Tuple[str, str, int]:
+        """Store a base64 data URL; returns (hash, content type, size)"""
+        data, content_type = decode_data_url(value)
+        return self.put(data), content_type, len(data)
+
+    def read(self, blob_hash: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        """Read bytes ``start`` through ``end`` inclusive"""
+        with open(self.path_for(blob_hash), "rb") as f:
+            f.seek(start)
+            return f.read() if end is None else f.read(end - start + 1)
+
+    def size(self, blob_hash: str) -> int:
+        return self.path_for(blob_hash).stat().st_size
+
+    def age(self, blob_hash: str) -> Optional[float]:
+        """Seconds since the blob was last stored, None if it is not in the store"""
+        try:
+            return time.time() - self.path_for(blob_hash).stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def settled(self, min_age: float) -> List[str]:
+        """Hashes of the blobs stored at least ``min_age`` seconds ago"""
+        cutoff = time.time() - min_age
+        hashes = []
+        for directory in self.root.glob("[0-9a-f][0-9a-f]"):
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    # Skips temp files of writes in progress
+                    if _HASH_RE.match(entry.name) and entry.stat().st_mtime <= cutoff:
+                        hashes.append(entry.name)
+        return hashes
+
+    def delete(self, blob_hash: str, min_age: float = 0.0) -> bool:
+        """Remove a blob unless it was stored in the last ``min_age`` seconds; whether it is gone"""
+        age = self.age(blob_hash)
+        if age is not None and age < min_age:
+            return False
+        try:
+            self.path_for(blob_hash).unlink()
+        except FileNotFoundError:
+            pass
+        return True
+
+
+# Global blob store beside the database
+_db_dir = Path(os.environ.get('IN_DB_PATH', Path(__file__).parent / "in_app.db")).parent
+blob_store = BlobStore(Path(os.environ.get('BLOB_DIR', _db_dir / "blobs")))
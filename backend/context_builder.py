@@ -0,0 +1,172 @@
+import hashlib
+import logging
+import os
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Callable, Deque, List, Optional, Tuple
+from database import MessageDB
+
+logger = logging.getLogger(__name__)
+
+# tiktoken looks for encodings in TIKTOKEN_CACHE_DIR, named by the SHA-1 of
+# their download URL; the build puts o200k_base there so it ships with the app
+TOKENIZER_DIR = Path(os.environ.get('TIKTOKEN_CACHE_DIR', Path(__file__).parent / "tokenizers"))
+O200K_URL = "https://openaipublic.blob.core.windows.net/encodings/o200k_base.tiktoken"
+O200K_SHA256 = "446a9538cb6c348e3516120d7c08b09f57c36495e2acfffe59a5bf8b0cfb1a2d"
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def _load_tokenizer() -> Callable[[str], int]:
+    """
+    tiktoken's o200k_base from the local copy in TOKENIZER_DIR, else ~4
+    chars per token. Never downloads: without a valid local copy tiktoken
+    would fetch the encoding from the network.
+    """
+    path = TOKENIZER_DIR / hashlib.sha1(O200K_URL.encode()).hexdigest()
+    try:
+        if hashlib.sha256(path.read_bytes()).hexdigest() != O200K_SHA256:
+            raise ValueError(f"{path} is not the o200k_base encoding")
+        os.environ['TIKTOKEN_CACHE_DIR'] = str(TOKENIZER_DIR)
+        import tiktoken
+        encoding = tiktoken.get_encoding("o200k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception as e:
+        logger.info(f"tiktoken unavailable, estimating token counts: {str(e)}")
+        return _estimate_tokens
+
+
+class SessionContext:
+    """Rolling context for one session: an extractive summary plus the most recent turns"""
+
+    def __init__(self):
+        self.summary: Deque[Tuple[str, int]] = deque()  # (line, tokens)
+        self.summary_tokens = 0
+        self.turns: Deque[Tuple[str, str, int]] = deque()  # (role, content, tokens)
+        self.turn_tokens = 0
+
+
+class ContextBuilder:
+    """
+    Builds the conversation context sent with each message within a token
+    budget. Turns that no longer fit are folded into a short extractive
+    summary, oldest first, and the summary itself is capped. Contexts are
+    cached per session and updated incrementally after every exchange, so
+    the database is only read when a session is first seen.
+    """
+
+    def __init__(self, budget_tokens: int = 3000, summary_tokens: int = 500,
+                 summary_line_chars: int = 160, load_limit: int = 200, max_sessions: int = 128):
+        self.budget_tokens = budget_tokens
+        self.summary_budget = summary_tokens
+        self.summary_line_chars = summary_line_chars
+        self.load_limit = load_limit
+        self.max_sessions = max_sessions
+        self._contexts: "OrderedDict[str, SessionContext]" = OrderedDict()
+        self._count_tokens: Optional[Callable[[str], int]] = None
+
+        # Metrics
+        self.builds = 0
+        self.cold_loads = 0
+        self.turns_summarised = 0
+
+    def load_tokenizer(self):
+        """Load the tokenizer; blocking, so run it off the event loop"""
+        if self._count_tokens is None:
+            self._count_tokens = _load_tokenizer()
+
+    def count_tokens(self, text: str) -> int:
+        # Estimated until load_tokenizer has run, so counting never reads files on the event loop
+        return (self._count_tokens or _estimate_tokens)(text)
+
+    def _summarise_turn(self, role: str, content: str) -> str:
+        """One short line per folded turn: its first sentence, truncated"""
+        text = " ".join(content.split())
+        for end in (". ", "? ", "! ", "\n"):
+            if end in text:
+                text = text[:text.index(end) + 1]
+                break
+        if len(text) > self.summary_line_chars:
+            text = text[:self.summary_line_chars - 3].rstrip() + "..."
+        return f"- {role}: {text}"
+
+    def _append(self, context: SessionContext, role: str, content: str):
+        tokens = self.count_tokens(content)
+        context.turns.append((role, content, tokens))
+        context.turn_tokens += tokens
+
+    def _fit(self, context: SessionContext, available: int):
+        """Fold the oldest turns into the summary until the context fits ``available`` tokens"""
+        while context.turns and context.turn_tokens + context.summary_tokens > available:
+            role, content, tokens = context.turns.popleft()
+            context.turn_tokens -= tokens
+            line = self._summarise_turn(role, content)
+            line_tokens = self.count_tokens(line)
+            context.summary.append((line, line_tokens))
+            context.summary_tokens += line_tokens
+            self.turns_summarised += 1
+            summary_cap = min(self.summary_budget, available)
+            while context.summary and context.summary_tokens > summary_cap:
+                _, dropped = context.summary.popleft()
+                context.summary_tokens -= dropped
+
+    async def _load(self, session_id: str, current_message: str) -> SessionContext:
+        context = SessionContext()
+        messages, _ = await MessageDB.get_page(session_id, self.load_limit)
+        # Chat requests save the user message together with the reply, but a
+        # queued reply (chat.reply job) runs after its user message was saved;
+        # the current message is sent separately, so leave it out here
+        if messages and messages[-1]["type"] == "user" and messages[-1]["content"] == current_message:
+            messages = messages[:-1]
+        for message in messages:
+            self._append(context, message["type"], message["content"])
+        self.cold_loads += 1
+        return context
+
+    async def build(self, session_id: str, user_message: str) -> str:
+        """Return the prompt for ``user_message`` with as much prior context as the budget allows"""
+        self.builds += 1
+        context = self._contexts.get(session_id)
+        if context is None:
+            context = await self._load(session_id, user_message)
+            self._contexts[session_id] = context
+            while len(self._contexts) > self.max_sessions:
+                self._contexts.popitem(last=False)
+        self._contexts.move_to_end(session_id)
+
+        available = max(0, self.budget_tokens - self.count_tokens(user_message))
+        self._fit(context, available)
+        if not context.turns and not context.summary:
+            return user_message
+
+        parts: List[str] = []
+        if context.summary:
+            parts.append("[Earlier in this conversation]\n" + "\n".join(line for line, _ in context.summary))
+        if context.turns:
+            parts.append("[Recent conversation]\n" + "\n\n".join(
+                f"{'User' if role == 'user' else 'Assistant'}: {content}" for role, content, _ in context.turns
+            ))
+        parts.append(f"[Current message]\n{user_message}")
+        return "\n\n".join(parts)
+
+    def record_exchange(self, session_id: str, user_message: str, response: str):
+        """Add a completed exchange to the cached context"""
+        context = self._contexts.get(session_id)
+        if context is None:
+            return
+        self._append(context, "user", user_message)
+        self._append(context, "assistant", response)
+
+    def invalidate(self, session_id: str):
+        self._contexts.pop(session_id, None)
+
+    def metrics(self) -> dict:
+        return {
+            "sessions_cached": len(self._contexts),
+            "budget_tokens": self.budget_tokens,
+            "builds": self.builds,
+            "cold_loads": self.cold_loads,
+            "turns_summarised": self.turns_summarised,
+        }
@@ -1,75 +1,199 @@
 import sqlite3
 import json
-from datetime import datetime
-from typing import List, Optional
+import asyncio
+import base64
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
 import uuid
 import os
+import re
 from pathlib import Path
+from db_pool import ConnectionPool
+from migrations import migrate
 
 # Database file location
-DB_PATH = Path(__file__).parent / "in_app.db"
+DB_PATH = Path(os.environ.get('IN_DB_PATH', Path(__file__).parent / "in_app.db"))
+
+# PRAGMAs applied once to every pooled connection. WAL is persistent and is
+# enabled by init_db(); synchronous=NORMAL is durable across crashes in WAL mode.
+CONNECTION_PRAGMAS = {
+    "busy_timeout": 5000,
+    "synchronous": "NORMAL",
+    "foreign_keys": "ON",
+    "temp_store": "MEMORY",
+    "cache_size": -int(os.environ.get('DB_CACHE_SIZE_KB', '16384')),
+    "mmap_size": int(os.environ.get('DB_MMAP_SIZE', str(256 * 1024 * 1024))),
+}
+
+_pool: Optional[ConnectionPool] = None
+_read_executor: Optional[ThreadPoolExecutor] = None
+_write_executor: Optional[ThreadPoolExecutor] = None
 
 def get_connection():
-    """Get database connection"""
+    """Get a standalone database connection (not pooled)"""
     conn = sqlite3.connect(str(DB_PATH))
     conn.row_factory = sqlite3.Row
     return conn
 
+def open_pool(on_connect=None) -> ConnectionPool:
+    """Create the shared connection pool; called from the app lifespan"""
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool(
+            DB_PATH,
+            size=int(os.environ.get('DB_POOL_SIZE', '4')),
+            timeout=float(os.environ.get('DB_POOL_TIMEOUT', '5')),
+            pragmas=CONNECTION_PRAGMAS,
+            on_connect=on_connect,
+        )
+    _pool.open()
+    return _pool
+
+def close_pool():
+    """Drain the DB executors and close the shared connection pool"""
+    global _pool, _read_executor, _write_executor
+    for executor in (_write_executor, _read_executor):
+        if executor is not None:
+            executor.shutdown(wait=True)
+    _read_executor = _write_executor = None
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+
+def get_pool() -> ConnectionPool:
+    """Return the shared pool, opening it on first use outside the app lifespan"""
+    return _pool if _pool is not None else open_pool()
+
+def pool_metrics() -> dict:
+    return _pool.metrics() if _pool is not None else {}
+
+def _get_executor(write: bool) -> ThreadPoolExecutor:
+    """
+    Writes are funnelled through a single writer thread so they queue in order
+    instead of contending for the SQLite write lock; reads share the remaining
+    pooled connections.
+    """
+    global _read_executor, _write_executor
+    if write:
+        if _write_executor is None:
+            _write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        return _write_executor
+    if _read_executor is None:
+        _read_executor = ThreadPoolExecutor(max_workers=max(1, get_pool().size - 1), thread_name_prefix="db-reader")
+    return _read_executor
+
+def run_sync(fn, *args, **kwargs):
+    """
+    Run ``fn(conn, *args)`` with a pooled connection on the calling thread and
+    commit whatever it wrote. DB functions never commit themselves, so several
+    of them can be composed into one transaction.
+    """
+    with get_pool().connection() as conn:
+        result = fn(conn, *args, **kwargs)
+        if conn.in_transaction:
+            conn.commit()
+        return result
+
+async def run_db(fn, *args, write: bool = False, **kwargs):
+    """Run ``fn(conn, *args)`` on a DB executor thread without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(write), functools.partial(run_sync, fn, *args, **kwargs))
+
+def _db_task(fn, write: bool):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run_db(fn, *args, write=write, **kwargs)
+    # Keep the blocking version reachable so it can be composed in one transaction
+    wrapper.sync = fn
+    return wrapper
+
+def db_reader(fn):
+    """Run a blocking ``fn(conn, *args)`` query as a coroutine on a reader thread"""
+    return _db_task(fn, write=False)
+
+def db_writer(fn):
+    """Run a blocking ``fn(conn, *args)`` statement as a coroutine on the writer thread"""
+    return _db_task(fn, write=True)
+
 def init_db():
-    """Initialize database tables"""
+    """Enable WAL and bring the schema up to date; run once at startup, before the pool opens"""
     conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Sessions table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS sessions (
-            id TEXT PRIMARY KEY,
-            title TEXT NOT NULL,
-            date TEXT NOT NULL,
-            duration TEXT DEFAULT '0 mins',
-            questionsAsked INTEGER DEFAULT 0,
-            model TEXT DEFAULT 'GPT-5.2',
-            createdAt TEXT NOT NULL,
-            updatedAt TEXT NOT NULL
-        )
-    """)
-    
-    # Messages table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS messages (
-            id TEXT PRIMARY KEY,
-            sessionId TEXT NOT NULL,
-            type TEXT NOT NULL,
-            content TEXT NOT NULL,
-            timestamp TEXT NOT NULL,
-            messageType TEXT DEFAULT 'text',
-            audioUrl TEXT,
-            imageUrl TEXT,
-            FOREIGN KEY (sessionId) REFERENCES sessions (id)
-        )
-    """)
-    
-    # Input history table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS input_history (
-            id TEXT PRIMARY KEY,
-            sessionId TEXT NOT NULL,
-            input TEXT NOT NULL,
-            timestamp TEXT NOT NULL,
-            FOREIGN KEY (sessionId) REFERENCES sessions (id)
-        )
-    """)
-    
-    conn.commit()
-    conn.close()
+    try:
+        # Readers keep working while the single writer commits
+        conn.execute("PRAGMA journal_mode = WAL")
+        version = migrate(conn)
+    finally:
+        conn.close()
+    return version
+
+@db_reader
+def ping(conn) -> bool:
+    """Readiness check: a pooled reader can query the database"""
+    return conn.execute("SELECT 1").fetchone()[0] == 1
+
+def encode_cursor(key: str, rowid: int) -> str:
+    """Opaque keyset cursor for a (sort key, rowid) position"""
+    raw = json.dumps([key, rowid], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key, rowid = json.loads(raw)
+        return str(key), int(rowid)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def _keyset_page(rows: list, limit: int, key_column: str, reverse: bool,
+                 keep_key: bool = True) -> Tuple[List[dict], Optional[str]]:
+    """
+    Trim a ``limit + 1`` keyset fetch to one page. The cursor points at the
+    last row in fetch order and is only set when more rows exist.
+    """
+    has_more = len(rows) > limit
+    items = []
+    for row in rows[:limit]:
+        item = dict(row)
+        item['_rowid'] = item.pop('rowid')
+        items.append(item)
+    next_cursor = encode_cursor(items[-1][key_column], items[-1]['_rowid']) if has_more else None
+    if reverse:
+        items.reverse()
+    for item in items:
+        del item['_rowid']
+        if not keep_key:
+            del item[key_column]
+    return items, next_cursor
+
+def _json_object(*columns: str) -> str:
+    return "json_object(" + ", ".join(f"'{column}', {column}" for column in columns) + ")"
 
-# Initialize database on import
-init_db()
+# SQL expressions rendering a row as its API JSON, so list endpoints can send
+# rows as-is instead of building dicts and models for them
+SESSION_JSON = _json_object('id', 'title', 'date', 'duration', 'questionsAsked', 'model', 'createdAt', 'updatedAt')
+MESSAGE_JSON = _json_object('id', 'sessionId', 'type', 'content', 'timestamp', 'messageType', 'audioUrl', 'imageUrl')
+INPUT_HISTORY_JSON = _json_object('id', 'sessionId', 'input', 'timestamp')
+
+def fts_query(text: str) -> Optional[str]:
+    """
+    Turn free text into a safe FTS5 query: every word must match, and the
+    last word also matches as a prefix so results appear while typing.
+    Returns None if the text has nothing searchable.
+    """
+    terms = re.findall(r"\w+", text)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
 
 class SessionDB:
     @staticmethod
-    async def create(session_data: dict) -> dict:
-        conn = get_connection()
+    @db_writer
+    def create(conn, session_data: dict) -> dict:
         cursor = conn.cursor()
         cursor.execute("""
             INSERT INTO sessions (id, title, date, duration, questionsAsked, model, createdAt, updatedAt)
@@ -84,56 +208,145 @@ class SessionDB:
             session_data['createdAt'].isoformat() if isinstance(session_data['createdAt'], datetime) else session_data['createdAt'],
             session_data['updatedAt'].isoformat() if isinstance(session_data['updatedAt'], datetime) else session_data['updatedAt']
         ))
-        conn.commit()
-        conn.close()
         return session_data
     
     @staticmethod
-    async def get_all() -> List[dict]:
-        conn = get_connection()
+    @db_reader
+    def get_all(conn) -> List[dict]:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM sessions ORDER BY createdAt DESC")
+        cursor.execute("SELECT * FROM sessions WHERE deletedAt IS NULL ORDER BY createdAt DESC")
         rows = cursor.fetchall()
-        conn.close()
         return [dict(row) for row in rows]
     
     @staticmethod
-    async def get_by_id(session_id: str) -> Optional[dict]:
-        conn = get_connection()
+    @db_reader
+    def get_page(conn, limit: int = 50, before: Optional[str] = None,
+                 after: Optional[str] = None, as_json: bool = False) -> Tuple[List[dict], Optional[str]]:
+        """
+        Newest-first page of sessions. ``before`` continues towards older
+        sessions, ``after`` towards newer ones; the returned cursor continues
+        in the same direction. With ``as_json`` each item only has a 'json'
+        key holding the serialised session.
+        """
+        cursor = conn.cursor()
+        columns = f"rowid, createdAt, {SESSION_JSON} AS json" if as_json else "rowid, *"
+        if after:
+            created_at, rowid = decode_cursor(after)
+            cursor.execute(f"""
+                SELECT {columns} FROM sessions
+                WHERE (createdAt, rowid) > (?, ?) AND deletedAt IS NULL
+                ORDER BY createdAt ASC, rowid ASC LIMIT ?
+            """, (created_at, rowid, limit + 1))
+        elif before:
+            created_at, rowid = decode_cursor(before)
+            cursor.execute(f"""
+                SELECT {columns} FROM sessions
+                WHERE (createdAt, rowid) < (?, ?) AND deletedAt IS NULL
+                ORDER BY createdAt DESC, rowid DESC LIMIT ?
+            """, (created_at, rowid, limit + 1))
+        else:
+            cursor.execute(f"""
+                SELECT {columns} FROM sessions
+                WHERE deletedAt IS NULL
+                ORDER BY createdAt DESC, rowid DESC LIMIT ?
+            """, (limit + 1,))
+        return _keyset_page(cursor.fetchall(), limit, 'createdAt', reverse=bool(after), keep_key=not as_json)
+    
+    @staticmethod
+    @db_reader
+    def get_by_id(conn, session_id: str) -> Optional[dict]:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM sessions WHERE id = ?", (session_id,))
+        cursor.execute("SELECT * FROM sessions WHERE id = ? AND deletedAt IS NULL", (session_id,))
         row = cursor.fetchone()
-        conn.close()
         return dict(row) if row else None
     
     @staticmethod
-    async def delete(session_id: str) -> bool:
-        conn = get_connection()
+    @db_reader
+    def get_version(conn, session_id: str) -> Optional[int]:
+        """Changes whenever the session or its messages change; None if there is no such session"""
         cursor = conn.cursor()
-        cursor.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
-        cursor.execute("DELETE FROM messages WHERE sessionId = ?", (session_id,))
-        cursor.execute("DELETE FROM input_history WHERE sessionId = ?", (session_id,))
-        conn.commit()
-        deleted = cursor.rowcount > 0
-        conn.close()
-        return deleted
+        cursor.execute("SELECT version FROM sessions WHERE id = ? AND deletedAt IS NULL", (session_id,))
+        row = cursor.fetchone()
+        return row['version'] if row else None
     
     @staticmethod
-    async def update_stats(session_id: str, questions_asked: int, duration: str):
-        conn = get_connection()
+    @db_reader
+    def get_list_version(conn) -> int:
+        """Changes whenever any session is created, updated or deleted"""
+        cursor = conn.cursor()
+        cursor.execute("SELECT version FROM versions WHERE name = 'sessions'")
+        return cursor.fetchone()['version']
+    
+    @staticmethod
+    @db_writer
+    def delete_many(conn, session_ids: List[str], chunk_size: int = 500) -> Tuple[List[str], List[str]]:
+        """
+        Delete sessions in one transaction; messages and input history go with
+        them via ON DELETE CASCADE. Sessions with more than ``chunk_size``
+        child rows are only marked deleted here so the writer is not held for
+        long; purge_chunk removes them afterwards.
+        
+        Returns:
+            (ids deleted now, ids marked for a chunked purge)
+        """
+        cursor = conn.cursor()
+        deleted, deferred = [], []
+        now = datetime.utcnow().isoformat()
+        for session_id in dict.fromkeys(session_ids):
+            cursor.execute("SELECT 1 FROM sessions WHERE id = ? AND deletedAt IS NULL", (session_id,))
+            if not cursor.fetchone():
+                continue
+            large = any(
+                cursor.execute(f"SELECT 1 FROM {table} WHERE sessionId = ? LIMIT 1 OFFSET ?", (session_id, chunk_size)).fetchone()
+                for table in ("messages", "input_history")
+            )
+            if large:
+                cursor.execute("UPDATE sessions SET deletedAt = ? WHERE id = ?", (now, session_id))
+                deferred.append(session_id)
+            else:
+                cursor.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+                deleted.append(session_id)
+        return deleted, deferred
+    
+    @staticmethod
+    @db_writer
+    def purge_chunk(conn, session_id: str, chunk_size: int = 500) -> bool:
+        """Delete up to ``chunk_size`` child rows of a session marked deleted; True once it is gone"""
+        cursor = conn.cursor()
+        removed = 0
+        for table in ("messages", "input_history"):
+            cursor.execute(f"""
+                DELETE FROM {table} WHERE rowid IN (
+                    SELECT rowid FROM {table} WHERE sessionId = ? LIMIT ?
+                )
+            """, (session_id, chunk_size))
+            removed += cursor.rowcount
+        if removed:
+            return False
+        cursor.execute("DELETE FROM sessions WHERE id = ? AND deletedAt IS NOT NULL", (session_id,))
+        return True
+    
+    @staticmethod
+    @db_reader
+    def get_pending_purges(conn) -> List[str]:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM sessions WHERE deletedAt IS NOT NULL")
+        return [row['id'] for row in cursor.fetchall()]
+    
+    @staticmethod
+    @db_writer
+    def update_stats(conn, session_id: str, questions_asked: int, duration: str):
         cursor = conn.cursor()
         cursor.execute("""
             UPDATE sessions 
             SET questionsAsked = ?, duration = ?, updatedAt = ?
             WHERE id = ?
         """, (questions_asked, duration, datetime.utcnow().isoformat(), session_id))
-        conn.commit()
-        conn.close()
 
 class MessageDB:
     @staticmethod
-    async def create(message_data: dict) -> dict:
-        conn = get_connection()
+    @db_writer
+    def create(conn, message_data: dict) -> dict:
         cursor = conn.cursor()
         cursor.execute("""
             INSERT INTO messages (id, sessionId, type, content, timestamp, messageType, audioUrl, imageUrl)
@@ -148,45 +361,91 @@ class MessageDB:
             message_data.get('audioUrl'),
             message_data.get('imageUrl')
         ))
-        conn.commit()
-        conn.close()
         return message_data
     
     @staticmethod
-    async def get_by_session(session_id: str) -> List[dict]:
-        conn = get_connection()
+    @db_reader
+    def exists(conn, message_id: str) -> bool:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM messages WHERE id = ?", (message_id,))
+        return cursor.fetchone() is not None
+    
+    @staticmethod
+    @db_reader
+    def get_by_session(conn, session_id: str) -> List[dict]:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM messages WHERE sessionId = ? ORDER BY timestamp ASC", (session_id,))
         rows = cursor.fetchall()
-        conn.close()
         return [dict(row) for row in rows]
     
     @staticmethod
-    async def delete_by_session(session_id: str) -> int:
-        conn = get_connection()
+    @db_reader
+    def get_page(conn, session_id: str, limit: int = 100, before: Optional[str] = None,
+                 after: Optional[str] = None, as_json: bool = False) -> Tuple[List[dict], Optional[str]]:
+        """
+        Page of a session's messages, always returned oldest-first. Without a
+        cursor this is the most recent ``limit`` messages; ``before`` continues
+        towards older messages and ``after`` towards newer ones. With
+        ``as_json`` each item only has a 'json' key holding the serialised message.
+        """
+        cursor = conn.cursor()
+        columns = f"rowid, timestamp, {MESSAGE_JSON} AS json" if as_json else "rowid, *"
+        if after:
+            timestamp, rowid = decode_cursor(after)
+            cursor.execute(f"""
+                SELECT {columns} FROM messages
+                WHERE sessionId = ? AND (timestamp, rowid) > (?, ?)
+                ORDER BY timestamp ASC, rowid ASC LIMIT ?
+            """, (session_id, timestamp, rowid, limit + 1))
+        elif before:
+            timestamp, rowid = decode_cursor(before)
+            cursor.execute(f"""
+                SELECT {columns} FROM messages
+                WHERE sessionId = ? AND (timestamp, rowid) < (?, ?)
+                ORDER BY timestamp DESC, rowid DESC LIMIT ?
+            """, (session_id, timestamp, rowid, limit + 1))
+        else:
+            cursor.execute(f"""
+                SELECT {columns} FROM messages
+                WHERE sessionId = ?
+                ORDER BY timestamp DESC, rowid DESC LIMIT ?
+            """, (session_id, limit + 1))
+        return _keyset_page(cursor.fetchall(), limit, 'timestamp', reverse=not after, keep_key=not as_json)
+    
+    @staticmethod
+    @db_writer
+    def delete_by_session(conn, session_id: str) -> int:
         cursor = conn.cursor()
         cursor.execute("DELETE FROM messages WHERE sessionId = ?", (session_id,))
-        conn.commit()
         deleted = cursor.rowcount
-        conn.close()
         return deleted
     
     @staticmethod
-    async def increment_question_count(session_id: str):
-        conn = get_connection()
+    @db_writer
+    def increment_question_count(conn, session_id: str):
         cursor = conn.cursor()
         cursor.execute("""
             UPDATE sessions 
             SET questionsAsked = questionsAsked + 1, updatedAt = ?
             WHERE id = ?
         """, (datetime.utcnow().isoformat(), session_id))
-        conn.commit()
-        conn.close()
+    
+    @staticmethod
+    @db_writer
+    def refresh_question_count(conn, session_id: str):
+        """Recount the session's questions; unlike incrementing, safe to run more than once"""
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE sessions
+            SET questionsAsked = (SELECT COUNT(*) FROM messages WHERE sessionId = ? AND type = 'user'),
+                updatedAt = ?
+            WHERE id = ?
+        """, (session_id, datetime.utcnow().isoformat(), session_id))
 
 class InputHistoryDB:
     @staticmethod
-    async def create(input_data: dict) -> dict:
-        conn = get_connection()
+    @db_writer
+    def create(conn, input_data: dict) -> dict:
         cursor = conn.cursor()
         cursor.execute("""
             INSERT INTO input_history (id, sessionId, input, timestamp)
@@ -197,24 +456,451 @@ class InputHistoryDB:
             input_data['input'],
             input_data['timestamp'].isoformat() if isinstance(input_data['timestamp'], datetime) else input_data['timestamp']
         ))
-        conn.commit()
-        conn.close()
         return input_data
     
     @staticmethod
-    async def get_all() -> List[str]:
-        conn = get_connection()
+    @db_reader
+    def get_all(conn) -> List[str]:
         cursor = conn.cursor()
-        cursor.execute("SELECT input FROM input_history ORDER BY timestamp DESC LIMIT 100")
+        cursor.execute("""
+            SELECT input FROM input_history
+            WHERE EXISTS (SELECT 1 FROM sessions WHERE sessions.id = input_history.sessionId AND deletedAt IS NULL)
+            ORDER BY timestamp DESC LIMIT 100
+        """)
         rows = cursor.fetchall()
-        conn.close()
         return [row['input'] for row in rows]
     
     @staticmethod
-    async def get_by_session(session_id: str) -> List[dict]:
-        conn = get_connection()
+    @db_reader
+    def get_by_session(conn, session_id: str) -> List[dict]:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM input_history WHERE sessionId = ? ORDER BY timestamp ASC", (session_id,))
         rows = cursor.fetchall()
-        conn.close()
         return [dict(row) for row in rows]
+    
+    @staticmethod
+    @db_reader
+    def get_by_session_json(conn, session_id: str) -> List[str]:
+        """get_by_session with each entry already serialised"""
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {INPUT_HISTORY_JSON} FROM input_history WHERE sessionId = ? ORDER BY timestamp ASC", (session_id,))
+        return [row[0] for row in cursor.fetchall()]
+    
+    @staticmethod
+    @db_reader
+    def get_inputs(conn) -> List[Tuple[str, str]]:
+        """Every stored input with its timestamp, for building the autocomplete index"""
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT input, timestamp FROM input_history
+            WHERE sessionId IN (SELECT id FROM sessions WHERE deletedAt IS NULL)
+        """)
+        return [(row['input'], row['timestamp']) for row in cursor.fetchall()]
+
+
+class ChangesDB:
+    @staticmethod
+    @db_reader
+    def get_session_messages_since(conn, session_id: str, since: int, limit: int = 500) -> Optional[dict]:
+        """
+        A session's messages changed after ``since`` in change order, already
+        serialised. If messages were deleted after ``since`` the client's copy
+        is stale: ``reset`` is set and the listing restarts from the beginning.
+        Returns None if there is no such session.
+        """
+        cursor = conn.cursor()
+        # One snapshot for both reads, so a deletion cannot slip between them
+        if not conn.in_transaction:
+            cursor.execute("BEGIN")
+        cursor.execute("SELECT messagesDeletedSeq FROM sessions WHERE id = ? AND deletedAt IS NULL", (session_id,))
+        session = cursor.fetchone()
+        if not session:
+            return None
+        reset = session['messagesDeletedSeq'] > since
+        start = 0 if reset else since
+        cursor.execute(f"""
+            SELECT seq, {MESSAGE_JSON} AS json FROM messages
+            WHERE sessionId = ? AND seq > ?
+            ORDER BY seq LIMIT ?
+        """, (session_id, start, limit + 1))
+        rows = cursor.fetchall()
+        return {
+            'items': [row['json'] for row in rows[:limit]],
+            'cursor': rows[:limit][-1]['seq'] if rows else max(since, session['messagesDeletedSeq']),
+            'reset': reset,
+            'hasMore': len(rows) > limit,
+        }
+    
+    @staticmethod
+    @db_reader
+    def get_changes(conn, since: int, limit: int = 200) -> dict:
+        """
+        Sessions and input history changed after ``since``, oldest change
+        first, each rendered as {seq, kind, id, data}. Kinds are 'session',
+        'session_deleted' (data null) and 'input'.
+        """
+        cursor = conn.cursor()
+        # One snapshot, so the sequence read below cannot include unseen changes
+        if not conn.in_transaction:
+            cursor.execute("BEGIN")
+        cursor.execute(f"""
+            SELECT seq, json FROM (
+                SELECT seq, json_object(
+                    'seq', seq, 'id', id,
+                    'kind', CASE WHEN deletedAt IS NULL THEN 'session' ELSE 'session_deleted' END,
+                    'data', CASE WHEN deletedAt IS NULL THEN json({SESSION_JSON}) END
+                ) AS json FROM sessions WHERE seq > ?
+                UNION ALL
+                SELECT seq, json_object('seq', seq, 'id', id, 'kind', 'session_deleted', 'data', NULL)
+                FROM session_tombstones WHERE seq > ?
+                UNION ALL
+                SELECT seq, json_object('seq', seq, 'id', id, 'kind', 'input', 'data', json({INPUT_HISTORY_JSON}))
+                FROM input_history WHERE seq > ?
+            )
+            ORDER BY seq LIMIT ?
+        """, (since, since, since, limit + 1))
+        rows = cursor.fetchall()
+        if rows:
+            next_cursor = rows[:limit][-1]['seq']
+        else:
+            # Nothing newer: jump to the current sequence so unrelated message writes are skipped next time
+            next_cursor = max(since, cursor.execute("SELECT version FROM versions WHERE name = 'seq'").fetchone()['version'])
+        return {
+            'items': [row['json'] for row in rows[:limit]],
+            'cursor': next_cursor,
+            'hasMore': len(rows) > limit,
+        }
+
+
+class IdempotencyDB:
+    @staticmethod
+    @db_writer
+    def create(conn, key: str, session_id: str, user_message_id: str, message_id: str):
+        # A plain INSERT: a key that is already taken fails the whole exchange
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO idempotency_keys (key, sessionId, userMessageId, messageId, createdAt)
+            VALUES (?, ?, ?, ?, ?)
+        """, (key, session_id, user_message_id, message_id, datetime.utcnow().isoformat()))
+    
+    @staticmethod
+    @db_reader
+    def get_exchange(conn, key: str) -> Optional[dict]:
+        """The stored exchange for ``key`` as {sessionId, user, reply}, or None"""
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT k.sessionId AS keySessionId, m.id = k.messageId AS isReply, m.*
+            FROM idempotency_keys k
+            JOIN messages m ON m.id IN (k.userMessageId, k.messageId)
+            WHERE k.key = ?
+        """, (key,))
+        rows = cursor.fetchall()
+        if not rows:
+            return None
+        exchange = {'sessionId': rows[0]['keySessionId'], 'user': None, 'reply': None}
+        for row in rows:
+            message = dict(row)
+            del message['keySessionId'], message['seq']
+            exchange['reply' if message.pop('isReply') else 'user'] = message
+        return exchange if exchange['user'] and exchange['reply'] else None
+    
+    @staticmethod
+    @db_writer
+    def prune(conn, max_age_seconds: float) -> int:
+        cursor = conn.cursor()
+        cutoff = (datetime.utcnow() - timedelta(seconds=max_age_seconds)).isoformat()
+        cursor.execute("DELETE FROM idempotency_keys WHERE createdAt < ?", (cutoff,))
+        return cursor.rowcount
+
+
+class BlobDB:
+    @staticmethod
+    @db_writer
+    def create(conn, blob_hash: str, content_type: str, size: int):
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT OR IGNORE INTO blobs (hash, contentType, size, createdAt)
+            VALUES (?, ?, ?, ?)
+        """, (blob_hash, content_type, size, datetime.utcnow().isoformat()))
+    
+    @staticmethod
+    @db_reader
+    def get(conn, blob_hash: str) -> Optional[dict]:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM blobs WHERE hash = ?", (blob_hash,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    
+    @staticmethod
+    @db_reader
+    def get_unreferenced(conn, after: str = "", limit: int = 500) -> List[str]:
+        """Hashes of blobs no message refers to, in hash order after ``after``"""
+        cursor = conn.cursor()
+        cursor.execute("SELECT hash FROM blobs WHERE refs = 0 AND hash > ? ORDER BY hash LIMIT ?", (after, limit))
+        return [row['hash'] for row in cursor.fetchall()]
+    
+    @staticmethod
+    @db_reader
+    def get_known(conn, blob_hashes: List[str]) -> List[str]:
+        """Those of ``blob_hashes`` that have a row"""
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT hash FROM blobs WHERE hash IN ({', '.join('?' * len(blob_hashes))})", blob_hashes)
+        return [row['hash'] for row in cursor.fetchall()]
+    
+    @staticmethod
+    @db_writer
+    def delete_unreferenced(conn, blob_hashes: List[str]) -> List[str]:
+        """Forget those of ``blob_hashes`` still unreferenced; returns them for removal from the store"""
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            DELETE FROM blobs WHERE refs = 0 AND hash IN ({", ".join("?" * len(blob_hashes))})
+            RETURNING hash
+        """, blob_hashes)
+        return [row['hash'] for row in cursor.fetchall()]
+
+
+class TranscriptDB:
+    @staticmethod
+    @db_writer
+    def put(conn, audio_hash: str, model: str, text: str, language: Optional[str], duration: float):
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT OR REPLACE INTO transcripts (hash, model, text, language, duration, createdAt)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (audio_hash, model, text, language, duration, datetime.utcnow().isoformat()))
+    
+    @staticmethod
+    @db_reader
+    def get(conn, audio_hash: str, model: str) -> Optional[dict]:
+        cursor = conn.cursor()
+        cursor.execute("SELECT text, language, duration FROM transcripts WHERE hash = ? AND model = ?",
+                       (audio_hash, model))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+
+class JobDB:
+    @staticmethod
+    @db_writer
+    def create(conn, job: dict, replace: bool = False) -> str:
+        """
+        Queue ``job`` and return its id. With a ``key`` already in use the
+        existing job's id is returned instead; ``replace`` also re-queues that
+        job with the new payload unless it is still waiting to run.
+        """
+        cursor = conn.cursor()
+        now = datetime.utcnow().isoformat()
+        # attempts carries over rather than resetting, so a replaced run's
+        # fencing token never matches the run that replaces it
+        on_conflict = """
+            DO UPDATE SET payload = excluded.payload, priority = excluded.priority, status = 'queued',
+                maxAttempts = jobs.attempts + excluded.maxAttempts, visibleAt = excluded.visibleAt,
+                lastError = NULL, result = NULL, updatedAt = excluded.updatedAt
+            WHERE jobs.status != 'queued'
+        """ if replace else "DO NOTHING"
+        cursor.execute(f"""
+            INSERT INTO jobs (id, kind, key, payload, priority, maxAttempts, visibleAt, createdAt, updatedAt)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (key) {on_conflict}
+        """, (job['id'], job['kind'], job.get('key'), job['payload'], job['priority'], job['maxAttempts'],
+              job['visibleAt'], now, now))
+        if job.get('key') is None:
+            return job['id']
+        return cursor.execute("SELECT id FROM jobs WHERE key = ?", (job['key'],)).fetchone()['id']
+    
+    @staticmethod
+    @db_reader
+    def get(conn, job_id: str) -> Optional[dict]:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    
+    @staticmethod
+    @db_reader
+    def get_by_key(conn, key: str) -> Optional[dict]:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM jobs WHERE key = ?", (key,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    
+    @staticmethod
+    @db_writer
+    def claim(conn, visible_at: str) -> Optional[dict]:
+        """
+        Take the most urgent visible job and hide it until ``visible_at``. A
+        running job is visible again once its lease has lapsed; if it has no
+        attempts left it is failed instead.
+        """
+        cursor = conn.cursor()
+        now = datetime.utcnow().isoformat()
+        cursor.execute("""
+            UPDATE jobs SET status = 'failed', lastError = 'Lease expired on the last attempt', updatedAt = ?
+            WHERE status = 'running' AND visibleAt <= ? AND attempts >= maxAttempts
+        """, (now, now))
+        cursor.execute("""
+            UPDATE jobs SET status = 'running', attempts = attempts + 1, visibleAt = ?, updatedAt = ?
+            WHERE id = (
+                SELECT id FROM jobs
+                WHERE status IN ('queued', 'running') AND visibleAt <= ?
+                ORDER BY priority DESC, visibleAt
+                LIMIT 1
+            )
+            RETURNING *
+        """, (visible_at, now, now))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    
+    @staticmethod
+    @db_writer
+    def extend(conn, job_id: str, attempt: int, visible_at: str) -> bool:
+        """Extend a running job's lease; False if the claim was lost"""
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE jobs SET visibleAt = ?, updatedAt = ?
+            WHERE id = ? AND attempts = ? AND status = 'running'
+        """, (visible_at, datetime.utcnow().isoformat(), job_id, attempt))
+        return cursor.rowcount == 1
+    
+    @staticmethod
+    @db_writer
+    def complete(conn, job_id: str, attempt: int, result: Optional[str]) -> bool:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE jobs SET status = 'done', result = ?, lastError = NULL, updatedAt = ?
+            WHERE id = ? AND attempts = ? AND status = 'running'
+        """, (result, datetime.utcnow().isoformat(), job_id, attempt))
+        return cursor.rowcount == 1
+    
+    @staticmethod
+    @db_writer
+    def fail(conn, job_id: str, attempt: int, error: str, retry_at: Optional[str]) -> bool:
+        """Record a failed attempt: queued again from ``retry_at``, or failed for good if None"""
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE jobs SET status = ?, visibleAt = IFNULL(?, visibleAt), lastError = ?, updatedAt = ?
+            WHERE id = ? AND attempts = ? AND status = 'running'
+        """, ('queued' if retry_at else 'failed', retry_at, error, datetime.utcnow().isoformat(), job_id, attempt))
+        return cursor.rowcount == 1
+    
+    @staticmethod
+    @db_writer
+    def release(conn, job_id: str, attempt: int) -> bool:
+        """Give an interrupted job back without counting the attempt (on shutdown)"""
+        cursor = conn.cursor()
+        now = datetime.utcnow().isoformat()
+        cursor.execute("""
+            UPDATE jobs SET status = 'queued', attempts = attempts - 1, visibleAt = ?, updatedAt = ?
+            WHERE id = ? AND attempts = ? AND status = 'running'
+        """, (now, now, job_id, attempt))
+        return cursor.rowcount == 1
+    
+    @staticmethod
+    @db_reader
+    def next_visible_at(conn) -> Optional[str]:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MIN(visibleAt) AS visibleAt FROM jobs WHERE status IN ('queued', 'running')")
+        return cursor.fetchone()['visibleAt']
+    
+    @staticmethod
+    @db_writer
+    def prune(conn, max_age_seconds: float) -> int:
+        """Delete finished jobs older than ``max_age_seconds``"""
+        cursor = conn.cursor()
+        cutoff = (datetime.utcnow() - timedelta(seconds=max_age_seconds)).isoformat()
+        cursor.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updatedAt < ?", (cutoff,))
+        return cursor.rowcount
+
+
+class SearchDB:
+    SOURCES = {
+        "messages": "SELECT rowid, rowid * 2 AS ftsRowid, content, sessionId, type AS kind, id, timestamp FROM messages",
+        "input_history": "SELECT rowid, rowid * 2 + 1 AS ftsRowid, input AS content, sessionId, 'input' AS kind, id, timestamp FROM input_history",
+    }
+    
+    @staticmethod
+    @db_reader
+    def search(conn, query: str, limit: int = 20, session_id: Optional[str] = None,
+               kinds: Optional[List[str]] = None, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """
+        Best bm25 matches first with a highlighted snippet. ``cursor`` is the
+        X-Next-Cursor of the previous page (score, rowid keyset).
+        """
+        match = fts_query(query)
+        if match is None:
+            return [], None
+        
+        filters, params = ["search_index MATCH ?", "sessions.deletedAt IS NULL"], [match]
+        if session_id:
+            filters.append("search_index.sessionId = ?")
+            params.append(session_id)
+        if kinds:
+            filters.append(f"search_index.kind IN ({','.join('?' * len(kinds))})")
+            params.extend(kinds)
+        page_filter = ""
+        if cursor:
+            score, rowid = decode_cursor(cursor)
+            page_filter = "WHERE score > ? OR (score = ? AND rowid > ?)"
+            params.extend([float(score), float(score), rowid])
+        params.append(limit + 1)
+        
+        rows = conn.execute(f"""
+            SELECT * FROM (
+                SELECT search_index.rowid AS rowid, search_index.sourceId AS id,
+                       search_index.sessionId AS sessionId, sessions.title AS sessionTitle,
+                       search_index.kind AS kind, search_index.timestamp AS timestamp,
+                       snippet(search_index, 0, '[', ']', '...', 16) AS snippet,
+                       bm25(search_index) AS score
+                FROM search_index JOIN sessions ON sessions.id = search_index.sessionId
+                WHERE {' AND '.join(filters)}
+            ) {page_filter}
+            ORDER BY score ASC, rowid ASC LIMIT ?
+        """, params).fetchall()
+        
+        results = [dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = encode_cursor(repr(results[-1]['score']), results[-1]['rowid'])
+        for result in results:
+            del result['rowid']
+            # bm25 is lower-is-better; expose a higher-is-better relevance
+            result['score'] = round(-result['score'], 4)
+        return results, next_cursor
+    
+    @staticmethod
+    @db_writer
+    def backfill_chunk(conn, chunk_size: int = 500) -> int:
+        """
+        Index up to ``chunk_size`` rows that predate the search index.
+        Returns the number of rows indexed; 0 means the backfill is complete.
+        """
+        cursor = conn.cursor()
+        cursor.execute("SELECT source, lastRowid, maxRowid FROM search_backfill")
+        states = cursor.fetchall()
+        for state in states:
+            rows = cursor.execute(f"""
+                {SearchDB.SOURCES[state['source']]}
+                WHERE rowid > ? AND rowid <= ? ORDER BY rowid LIMIT ?
+            """, (state['lastRowid'], state['maxRowid'], chunk_size)).fetchall()
+            if not rows:
+                cursor.execute("DELETE FROM search_backfill WHERE source = ?", (state['source'],))
+                continue
+            # REPLACE: a trigger may already have indexed a row updated since the migration
+            cursor.executemany("""
+                INSERT OR REPLACE INTO search_index (rowid, content, sessionId, kind, sourceId, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [(row['ftsRowid'], row['content'], row['sessionId'], row['kind'], row['id'], row['timestamp']) for row in rows])
+            cursor.execute("UPDATE search_backfill SET lastRowid = ? WHERE source = ?", (rows[-1]['rowid'], state['source']))
+            return len(rows)
+        return 0
+    
+    @staticmethod
+    @db_reader
+    def backfill_remaining(conn) -> int:
+        remaining = 0
+        for state in conn.execute("SELECT source, lastRowid, maxRowid FROM search_backfill").fetchall():
+            remaining += conn.execute(
+                f"SELECT COUNT(*) FROM {state['source']} WHERE rowid > ? AND rowid <= ?",
+                (state['lastRowid'], state['maxRowid'])
+            ).fetchone()[0]
+        return remaining
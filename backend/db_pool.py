@@ -0,0 +1,216 @@
+import sqlite3
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the checkout timeout"""
+
+
+class PoolClosed(Exception):
+    """Raised when a connection is requested from a closed pool"""
+
+
+class ConnectionPool:
+    """
+    Bounded pool of long-lived SQLite connections.
+
+    Connections are opened lazily up to ``size``, configured once with the
+    given PRAGMAs and handed out with checkout/return semantics through
+    ``connection()``. Idle connections are health-checked before reuse and
+    replaced if they have gone bad.
+    """
+
+    def __init__(self, db_path: Path, size: int = 4, timeout: float = 5.0,
+                 pragmas: Optional[Dict[str, object]] = None,
+                 health_check_interval: float = 30.0,
+                 on_connect: Optional[Callable[[sqlite3.Connection], None]] = None):
+        self.db_path = db_path
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.pragmas = dict(pragmas or {})
+        self.health_check_interval = health_check_interval
+        self.on_connect = on_connect
+
+        self._idle = deque()  # (connection, last_used)
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._created = 0
+        self._in_use = 0
+        self._closed = False
+
+        # Metrics
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+        self._replaced = 0
+        self._peak_in_use = 0
+        self._busy_since = time.monotonic()
+        self._busy_area = 0.0  # integral of in_use over time, for utilisation
+        self._opened_at = time.monotonic()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        if self.on_connect:
+            self.on_connect(conn)
+        return conn
+
+    @staticmethod
+    def _is_healthy(conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _account_busy(self, now: float):
+        # Caller holds the lock
+        self._busy_area += self._in_use * (now - self._busy_since)
+        self._busy_since = now
+
+    def open(self):
+        with self._lock:
+            self._closed = False
+
+    def close(self):
+        """Close all idle connections and refuse further checkouts"""
+        with self._lock:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.popleft()
+                conn.close()
+                self._created -= 1
+            self._available.notify_all()
+        logger.info(f"Closed connection pool for {self.db_path}")
+
+    def acquire(self) -> sqlite3.Connection:
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise PoolClosed("Connection pool is closed")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    conn, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f"Timed out after {self.timeout}s waiting for a database connection")
+                waited = True
+                self._available.wait(remaining)
+
+            now = time.monotonic()
+            self._account_busy(now)
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+            self._checkouts += 1
+            if waited:
+                wait = now - start
+                self._waits += 1
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+
+        # Connect and health-check outside the lock
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif now - last_used > self.health_check_interval and not self._is_healthy(conn):
+                logger.warning("Replacing unhealthy database connection")
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+                conn = self._connect()
+                with self._lock:
+                    self._replaced += 1
+        except Exception:
+            with self._lock:
+                self._account_busy(time.monotonic())
+                self._in_use -= 1
+                self._created -= 1
+                self._available.notify()
+            raise
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._account_busy(time.monotonic())
+            self._in_use -= 1
+            if self._closed:
+                conn.close()
+                self._created -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._available.notify()
+
+    def discard(self, conn: sqlite3.Connection):
+        """Drop a checked-out connection instead of returning it to the pool"""
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._account_busy(time.monotonic())
+            self._in_use -= 1
+            self._created -= 1
+            self._available.notify()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of the ``with`` block"""
+        conn = self.acquire()
+        try:
+            yield conn
+        except sqlite3.DatabaseError as e:
+            if isinstance(e, (sqlite3.InterfaceError, sqlite3.OperationalError)) and not self._is_healthy(conn):
+                self.discard(conn)
+            else:
+                self.release(conn)
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            self._account_busy(now)
+            elapsed = max(now - self._opened_at, 1e-9)
+            return {
+                "size": self.size,
+                "open_connections": self._created,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "peak_in_use": self._peak_in_use,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_time_total_ms": round(self._wait_total * 1000, 3),
+                "wait_time_avg_ms": round(self._wait_total * 1000 / self._waits, 3) if self._waits else 0.0,
+                "wait_time_max_ms": round(self._wait_max * 1000, 3),
+                "timeouts": self._timeouts,
+                "replaced": self._replaced,
+                "utilisation": round(self._in_use / self.size, 3),
+                "utilisation_avg": round(self._busy_area / (elapsed * self.size), 4),
+            }
@@ -0,0 +1,28 @@
+from typing import Optional
+from fastapi import Request, Response
+
+# Clients may reuse a stored response only after revalidating it
+REVALIDATE = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    return '"' + ".".join(str(part) for part in parts) + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match covers ``etag`` (weak comparison, as RFC 9110 requires)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in header.split(",")]
+    return any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in tags)
+
+
+def etag_headers(etag: str, cache_control: str = REVALIDATE, extra: Optional[dict] = None) -> dict:
+    return {"ETag": etag, "Cache-Control": cache_control, **(extra or {})}
+
+
+def not_modified(etag: str, cache_control: str = REVALIDATE) -> Response:
+    return Response(status_code=304, headers=etag_headers(etag, cache_control))
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import os
+from typing import Iterable, Optional, Set
+import orjson
+from fastapi.encoders import jsonable_encoder
+from database import SessionDB
+from models import Session
+
+logger = logging.getLogger(__name__)
+
+# Sent in place of a backlog the client could not keep up with: it should
+# catch up through GET /api/changes and /api/chat/{id}/since/{cursor}
+RESYNC = orjson.dumps({"type": "resync", "data": {"reason": "client fell behind"}}).decode()
+# Tells a connection's sender to close the socket
+CLOSE = object()
+
+
+class Subscriber:
+    """One WebSocket connection: a bounded queue of serialised events and its session filter"""
+
+    def __init__(self, queue_size: int, sessions: Optional[Set[str]] = None):
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        # None means every session
+        self.sessions = sessions
+        self.lagging = False
+
+    def wants(self, session_id: Optional[str]) -> bool:
+        return session_id is None or self.sessions is None or session_id in self.sessions
+
+
+class EventHub:
+    """
+    Fans events out to WebSocket subscribers without ever blocking the
+    publisher. Each event is serialised once. Every subscriber has a bounded
+    queue: stream tokens are dropped first once a queue is half full (the
+    finished message follows as message.created), and a subscriber whose
+    queue overflows has its backlog replaced by a single resync event.
+    Memory per connection is therefore capped at ``queue_size`` events.
+    """
+
+    def __init__(self, queue_size: int = 256, token_high_water: float = 0.5):
+        self.queue_size = max(1, queue_size)
+        self.token_high_water = token_high_water
+        self._subscribers: Set[Subscriber] = set()
+
+        # Metrics
+        self.published = 0
+        self.tokens_dropped = 0
+        self.resyncs = 0
+
+    @property
+    def has_subscribers(self) -> bool:
+        return bool(self._subscribers)
+
+    def subscribe(self, sessions: Optional[Iterable[str]] = None) -> Subscriber:
+        subscriber = Subscriber(self.queue_size, set(sessions) if sessions else None)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+
+    def publish(self, event_type: str, data, session_id: Optional[str] = None, droppable: bool = False):
+        """Queue an event for every interested subscriber; ``data`` must be JSON-ready"""
+        if not self._subscribers:
+            return
+        self.published += 1
+        payload = orjson.dumps({"type": event_type, "data": data}).decode()
+        for subscriber in list(self._subscribers):
+            if subscriber.wants(session_id):
+                self._offer(subscriber, payload, droppable)
+
+    def _offer(self, subscriber: Subscriber, payload: str, droppable: bool):
+        if subscriber.lagging:
+            # A resync is already queued; the client refetches everything after it
+            return
+        queue = subscriber.queue
+        if droppable and queue.qsize() >= self.token_high_water * queue.maxsize:
+            self.tokens_dropped += 1
+            return
+        try:
+            queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RESYNC)
+            subscriber.lagging = True
+            self.resyncs += 1
+            logger.warning("WebSocket client fell behind; replaced its backlog with a resync")
+
+    def close(self):
+        """Ask every connection to close (on shutdown)"""
+        for subscriber in list(self._subscribers):
+            while not subscriber.queue.empty():
+                subscriber.queue.get_nowait()
+            subscriber.queue.put_nowait(CLOSE)
+
+    def metrics(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "queued": sum(subscriber.queue.qsize() for subscriber in self._subscribers),
+            "published": self.published,
+            "tokens_dropped": self.tokens_dropped,
+            "resyncs": self.resyncs,
+        }
+
+
+# Global hub shared by the routes that publish and the WebSocket endpoint
+event_hub = EventHub(queue_size=int(os.environ.get('WS_QUEUE_SIZE', '256')))
+
+
+async def publish_session_updated(session_id: str):
+    """Push the session's current row (stats, title, ...) to every subscriber"""
+    if not event_hub.has_subscribers:
+        return
+    session = await SessionDB.get_by_id(session_id)
+    if session:
+        event_hub.publish("session.updated", jsonable_encoder(Session(**session)))
@@ -0,0 +1,125 @@
+import io
+import time
+import base64
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+from blob_store import decode_data_url
+
+logger = logging.getLogger(__name__)
+
+# Vision models tile images after scaling them to fit 2048x2048 with the short
+# side at most 768px, so anything larger is uploaded only to be thrown away.
+MAX_LONG_SIDE = 2048
+MAX_SHORT_SIDE = 768
+
+
+def target_size(width: int, height: int, max_long: int = MAX_LONG_SIDE,
+                max_short: int = MAX_SHORT_SIDE) -> Tuple[int, int]:
+    """Largest size within the model's effective resolution, never upscaling"""
+    scale = min(1.0, max_long / max(width, height), max_short / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def preprocess_image(image_data: str, image_format: str = "JPEG", quality: int = 82) -> Tuple[str, dict]:
+    """
+    Decode, downsize, strip metadata and re-encode an image for a vision request.
+    Runs in a worker process, so it only takes and returns plain data.
+
+    Returns:
+        (base64 encoded image, stats)
+    """
+    # Imported here so the API process never pays for Pillow unless images are sent
+    from PIL import Image, ImageOps
+
+    start = time.perf_counter()
+    raw, _ = decode_data_url(image_data)
+    with Image.open(io.BytesIO(raw)) as img:
+        original_size = img.size
+        img = ImageOps.exif_transpose(img)
+        size = target_size(*img.size)
+        if size != img.size:
+            img = img.resize(size, Image.LANCZOS)
+
+        if image_format == "JPEG" and img.mode != "RGB":
+            # JPEG has no alpha channel: flatten transparent screenshots onto white
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel("A"))
+        elif img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+
+        # Saving without exif/icc_profile/info drops the source metadata
+        out = io.BytesIO()
+        img.save(out, format=image_format, quality=quality, optimize=True)
+
+    encoded = out.getvalue()
+    stats = {
+        "original_size": original_size,
+        "processed_size": size,
+        "bytes_in": len(raw),
+        "bytes_out": len(encoded),
+        "seconds": time.perf_counter() - start,
+    }
+    return base64.b64encode(encoded).decode(), stats
+
+
+class ImagePreprocessor:
+    """Runs preprocess_image in a process pool so encoding never holds the event loop's GIL"""
+
+    def __init__(self, workers: int = 2, image_format: str = "JPEG", quality: int = 82):
+        self.workers = max(1, workers)
+        self.image_format = image_format.upper()
+        self.quality = quality
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+        # Metrics
+        self.images = 0
+        self.failures = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def process(self, image_data: str) -> str:
+        """Return the preprocessed image as base64, or the original payload if it cannot be decoded"""
+        loop = asyncio.get_running_loop()
+        try:
+            encoded, stats = await loop.run_in_executor(
+                self._get_executor(), preprocess_image, image_data, self.image_format, self.quality
+            )
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Image preprocessing failed, sending original: {str(e)}")
+            return image_data.split(",", 1)[-1] if image_data.startswith("data:") else image_data
+
+        self.images += 1
+        self.bytes_in += stats["bytes_in"]
+        self.bytes_out += stats["bytes_out"]
+        self.seconds += stats["seconds"]
+        logger.info(
+            f"Preprocessed image {stats['original_size']} -> {stats['processed_size']}, "
+            f"{stats['bytes_in']} -> {stats['bytes_out']} bytes"
+        )
+        return encoded
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def metrics(self) -> dict:
+        return {
+            "images": self.images,
+            "failures": self.failures,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bytes_saved": self.bytes_in - self.bytes_out,
+            "avg_ms": round(self.seconds * 1000 / self.images, 2) if self.images else 0.0,
+        }
+
@@ -0,0 +1,224 @@
+import asyncio
+import heapq
+import logging
+import math
+import os
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from database import InputHistoryDB
+from write_behind import write_queue
+
+logger = logging.getLogger(__name__)
+
+# Sorts after every character, so [prefix, prefix + _MAX_CHAR) is the prefix range
+_MAX_CHAR = "\U0010ffff"
+
+
+def normalize_input(text: str) -> str:
+    """Case- and whitespace-insensitive key, so repeats of one input are counted together"""
+    return " ".join(text.split()).casefold()
+
+
+def normalize_prefix(prefix: str) -> str:
+    # Keep one trailing space: "what " should not match "whatever"
+    normalized = normalize_input(prefix)
+    if normalized and prefix[-1:].isspace():
+        normalized += " "
+    return normalized
+
+
+class InputSuggestions:
+    """
+    In-memory autocomplete over input history.
+
+    Distinct inputs are kept in a sorted list, so the inputs starting with a
+    prefix are one contiguous range found by bisection. Each input has a
+    frecency score: every use adds 2^(t / half_life), stored in log2 space.
+    Because the reference point grows with time instead of old uses
+    decaying, scores only ever increase and their order never changes by
+    itself. That lets broad prefixes (more than ``scan_limit`` inputs) keep
+    a cached top-k that is updated in place on each new input, while narrow
+    prefixes are simply ranked on the fly.
+    """
+
+    def __init__(self, half_life_days: float = 7.0, top_k: int = 20, scan_limit: int = 256):
+        self.half_life = half_life_days * 86400
+        self.top_k = top_k
+        self.scan_limit = scan_limit
+        self._keys: List[str] = []
+        self._entries: Dict[str, list] = {}  # key -> [latest text, score]
+        self._top: Dict[str, List[Tuple[float, str]]] = {}
+        self._built = False
+        self._building: Optional[List[Tuple[str, float]]] = None
+        self._lock = asyncio.Lock()
+        # Bumped by ``reset`` so a build that started before it is not published
+        self._generation = 0
+
+        # Metrics
+        self.queries = 0
+        self.builds = 0
+        self.build_ms = 0.0
+
+    def _bump(self, score: Optional[float], timestamp: float) -> float:
+        use = timestamp / self.half_life
+        if score is None:
+            return use
+        high, low = max(score, use), min(score, use)
+        return high + math.log2(1 + 2 ** (low - high))
+
+    def _record(self, text: str, timestamp: float) -> Optional[Tuple[str, float]]:
+        key = normalize_input(text)
+        if not key:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            self._entries[key] = [" ".join(text.split()), self._bump(None, timestamp)]
+            insort(self._keys, key)
+            return key, self._entries[key][1]
+        entry[0] = " ".join(text.split())
+        entry[1] = self._bump(entry[1], timestamp)
+        return key, entry[1]
+
+    def _rank(self, lo: int, hi: int, count: int) -> List[Tuple[float, str]]:
+        entries = self._entries
+        return heapq.nlargest(count, ((entries[key][1], key) for key in self._keys[lo:hi]))
+
+    def _range(self, prefix: str) -> Tuple[int, int]:
+        return bisect_left(self._keys, prefix), bisect_left(self._keys, prefix + _MAX_CHAR)
+
+    def _load(self, rows: List[Tuple[str, str]]):
+        self._keys, self._entries, self._top = [], {}, {}
+        entries: Dict[str, list] = {}
+        for text, timestamp in rows:
+            key = normalize_input(text)
+            if not key:
+                continue
+            entry = entries.get(key)
+            used = datetime.fromisoformat(timestamp).timestamp()
+            if entry is None:
+                entries[key] = [" ".join(text.split()), self._bump(None, used)]
+            else:
+                entry[0] = " ".join(text.split())
+                entry[1] = self._bump(entry[1], used)
+        self._entries = entries
+        self._keys = sorted(entries)
+        self._index_broad_prefixes("", 0, len(self._keys))
+
+    def _index_broad_prefixes(self, prefix: str, lo: int, hi: int) -> List[Tuple[float, str]]:
+        """
+        Cache the top-k of every prefix matching more than ``scan_limit``
+        inputs, bottom-up: a prefix's top-k is merged from its children's, so
+        each input is only scanned once, in its deepest narrow range.
+        """
+        keys, depth = self._keys, len(prefix)
+        candidates: List[Tuple[float, str]] = []
+        start = lo
+        if start < hi and keys[start] == prefix:
+            candidates.append((self._entries[prefix][1], prefix))
+            start += 1
+        while start < hi:
+            child = prefix + keys[start][depth]
+            end = bisect_left(keys, child + _MAX_CHAR, start, hi)
+            if end - start > self.scan_limit:
+                candidates.extend(self._index_broad_prefixes(child, start, end))
+            else:
+                candidates.extend(self._rank(start, end, self.top_k))
+            start = end
+        top = heapq.nlargest(self.top_k, candidates)
+        if prefix:
+            self._top[prefix] = top
+        return top
+
+    async def ensure_built(self):
+        """Load the index from the database on first use (or after ``reset``)"""
+        if self._built:
+            return
+        async with self._lock:
+            if self._built:
+                return
+            start = datetime.now()
+            while not self._built:
+                generation = self._generation
+                self._building = []
+                try:
+                    # Queued input-history writes must be visible to the load
+                    await write_queue.flush()
+                    rows = await InputHistoryDB.get_inputs()
+                finally:
+                    added, self._building = self._building, None
+                if generation != self._generation:
+                    # Reset while loading: the rows may include deleted inputs, and
+                    # anything added meanwhile is in the database for the next load
+                    continue
+                self._load(rows)
+                self._built = True
+            # Inputs added while loading are replayed on the new index
+            for text, timestamp in added:
+                self.add(text, timestamp)
+            self.builds += 1
+            self.build_ms = (datetime.now() - start).total_seconds() * 1000
+            logger.info(f"Built input suggestions from {len(rows)} inputs in {self.build_ms:.0f}ms")
+
+    def add(self, text: str, timestamp: Optional[float] = None):
+        """Record a new input; keeps cached top-k lists current"""
+        timestamp = datetime.utcnow().timestamp() if timestamp is None else timestamp
+        if self._building is not None:
+            self._building.append((text, timestamp))
+            return
+        if not self._built:
+            return
+        recorded = self._record(text, timestamp)
+        if recorded is None:
+            return
+        key, score = recorded
+        for length in range(1, len(key) + 1):
+            top = self._top.get(key[:length])
+            if top is None:
+                continue
+            # Scores only grow, so an input already in the list stays in it
+            for i, (_, other) in enumerate(top):
+                if other == key:
+                    del top[i]
+                    break
+            if len(top) < self.top_k or score > top[-1][0]:
+                top.append((score, key))
+                top.sort(reverse=True)
+                del top[self.top_k:]
+
+    def suggest(self, prefix: str, limit: int = 8) -> List[str]:
+        self.queries += 1
+        prefix = normalize_prefix(prefix)
+        if not prefix:
+            return []
+        limit = min(limit, self.top_k)
+        top = self._top.get(prefix)
+        if top is None:
+            lo, hi = self._range(prefix)
+            if hi - lo <= self.scan_limit:
+                top = self._rank(lo, hi, limit)
+            else:
+                top = self._top[prefix] = self._rank(lo, hi, self.top_k)
+        return [self._entries[key][0] for _, key in top[:limit]]
+
+    def reset(self):
+        """Drop the index (e.g. after sessions are deleted); it is rebuilt on next use"""
+        self._generation += 1
+        self._built = False
+        self._keys, self._entries, self._top = [], {}, {}
+
+    def metrics(self) -> dict:
+        return {
+            "built": self._built,
+            "inputs": len(self._keys),
+            "cached_prefixes": len(self._top),
+            "queries": self.queries,
+            "builds": self.builds,
+            "build_ms": round(self.build_ms, 2),
+        }
+
+
+# Global autocomplete index shared by the input-history routes
+input_suggestions = InputSuggestions(
+    half_life_days=float(os.environ.get('INPUT_SUGGEST_HALF_LIFE_DAYS', '7')),
+)
@@ -0,0 +1,243 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from database import JobDB
+from write_behind import write_queue, WriteOp
+
+logger = logging.getLogger(__name__)
+
+# A job handler: takes the job's payload, returns a JSON-serialisable result
+Handler = Callable[[dict], Awaitable[Any]]
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler for a failure that retrying cannot fix"""
+
+
+def _timestamp(delay: float = 0.0) -> str:
+    return (datetime.utcnow() + timedelta(seconds=delay)).isoformat()
+
+
+class JobQueue:
+    """
+    Durable background jobs in the ``jobs`` table, run by ``workers``
+    asyncio workers for work that should not hold up a request.
+
+    A worker claims the most urgent visible job (highest priority, then
+    oldest) and hides it for ``visibility_timeout`` seconds, extending the
+    lease while the handler runs. If the process dies, the job becomes
+    visible again when its lease lapses and is picked up on the next start.
+    A failed attempt is retried with exponential backoff (at least the
+    error's ``retry_after``) until the job's attempts run out.
+
+    Jobs with a ``key`` are unique: enqueueing the key again returns the
+    existing job, or with ``replace`` runs it again once the current run
+    finishes, which coalesces repeated requests for the same work.
+    Handlers must be safe to run more than once.
+    """
+
+    def __init__(self, workers: int = 4, visibility_timeout: float = 60.0, max_attempts: int = 5,
+                 base_delay: float = 1.0, max_delay: float = 300.0, retention: float = 7 * 24 * 3600,
+                 idle_wait: float = 30.0):
+        self.workers = max(1, workers)
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retention = retention
+        self.idle_wait = idle_wait
+        self._handlers: Dict[str, Tuple[Handler, int, int]] = {}
+        self._periodic: Dict[str, float] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._free: Optional[asyncio.Semaphore] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.enqueued = 0
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+        self.leases_lost = 0
+        self.run_seconds = 0.0
+
+        self.handler("jobs.prune", priority=-10)(self._prune)
+        self.every("jobs.prune", 3600)
+
+    def handler(self, kind: str, priority: int = 0, max_attempts: Optional[int] = None):
+        """Register the decorated coroutine function as the handler of ``kind`` jobs"""
+        def register(fn: Handler) -> Handler:
+            self._handlers[kind] = (fn, priority, max_attempts or self.max_attempts)
+            return fn
+        return register
+
+    def every(self, kind: str, interval: float):
+        """Run the ``kind`` job about every ``interval`` seconds while the queue is running"""
+        self._periodic[kind] = interval
+
+    def job_op(self, kind: str, payload: Optional[dict] = None, key: Optional[str] = None,
+               delay: float = 0.0, replace: bool = False) -> WriteOp:
+        """
+        The write that queues a job, for committing it in one unit with the
+        writes it follows from; its result is the job's id. Call ``notify``
+        once committed.
+        """
+        _, priority, max_attempts = self._handlers[kind]
+        job = {
+            "id": str(uuid.uuid4()),
+            "kind": kind,
+            "key": key,
+            "payload": json.dumps(payload or {}),
+            "priority": priority,
+            "maxAttempts": max_attempts,
+            "visibleAt": _timestamp(delay),
+        }
+        return JobDB.create, (job, replace)
+
+    async def enqueue(self, kind: str, payload: Optional[dict] = None, key: Optional[str] = None,
+                      delay: float = 0.0, replace: bool = False) -> str:
+        """Queue a job and return its id"""
+        job_id = (await write_queue.submit(self.job_op(kind, payload, key, delay, replace)))[0]
+        self.notify()
+        return job_id
+
+    def notify(self):
+        """Tell the dispatcher new jobs were committed"""
+        self.enqueued += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self):
+        self._free = asyncio.Semaphore(self.workers)
+        self._wakeup = asyncio.Event()
+        for kind in self._periodic:
+            await self.enqueue(kind, key=kind, replace=True)
+        self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def _dispatch(self):
+        while True:
+            await self._free.acquire()
+            self._wakeup.clear()
+            try:
+                job = await JobDB.claim(_timestamp(self.visibility_timeout))
+            except Exception as e:
+                logger.error(f"Error claiming a job: {str(e)}")
+                job = None
+            if job is None:
+                self._free.release()
+                await self._idle()
+                continue
+            self._running[job['id']] = asyncio.get_running_loop().create_task(self._run(job))
+
+    async def _idle(self):
+        """Wait until the next job becomes visible, or something is enqueued"""
+        timeout = self.idle_wait
+        try:
+            next_visible = await JobDB.next_visible_at()
+            if next_visible is not None:
+                wait = (datetime.fromisoformat(next_visible) - datetime.utcnow()).total_seconds()
+                timeout = min(timeout, max(wait, 0.0))
+        except Exception as e:
+            logger.error(f"Error checking for queued jobs: {str(e)}")
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _heartbeat(self, job: dict):
+        """Keep extending the lease of a running job"""
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            try:
+                if not await JobDB.extend(job['id'], job['attempts'], _timestamp(self.visibility_timeout)):
+                    # Re-queued by ``replace`` or, after a stall, claimed again; the run carries on
+                    self.leases_lost += 1
+                    return
+            except Exception as e:
+                logger.error(f"Error extending the lease of job {job['id']}: {str(e)}")
+
+    async def _run(self, job: dict):
+        job_id, kind, attempt = job['id'], job['kind'], job['attempts']
+        loop = asyncio.get_running_loop()
+        heartbeat = loop.create_task(self._heartbeat(job))
+        start = loop.time()
+        try:
+            if kind not in self._handlers:
+                raise PermanentJobError(f"No handler for {kind} jobs")
+            result = await self._handlers[kind][0](json.loads(job['payload']))
+            await JobDB.complete(job_id, attempt, json.dumps(result) if result is not None else None)
+            self.completed += 1
+            finished = True
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back without using up an attempt
+            await JobDB.release(job_id, attempt)
+            raise
+        except Exception as e:
+            finished = await self._failed(job, e)
+        finally:
+            heartbeat.cancel()
+            self.run_seconds += loop.time() - start
+            self._running.pop(job_id, None)
+            self._free.release()
+            # A retry may be due before whatever the dispatcher is waiting for
+            self._wakeup.set()
+        if finished and kind in self._periodic:
+            await self.enqueue(kind, key=kind, delay=self._periodic[kind], replace=True)
+
+    async def _failed(self, job: dict, error: Exception) -> bool:
+        """Record a failed attempt; whether the job is finished (no retry)"""
+        attempt = job['attempts']
+        retry_at = None
+        if attempt < job['maxAttempts'] and not isinstance(error, PermanentJobError):
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            delay = max(delay, getattr(error, "retry_after", None) or 0)
+            retry_at = _timestamp(delay)
+            self.retried += 1
+            logger.warning(f"Job {job['id']} ({job['kind']}) failed, retrying in {delay:.1f}s: {str(error)}")
+        else:
+            self.failed += 1
+            logger.error(f"Job {job['id']} ({job['kind']}) failed after {attempt} attempts: {str(error)}")
+        try:
+            await JobDB.fail(job['id'], attempt, str(error), retry_at)
+        except Exception as e:
+            # The lease lapses and the job is retried anyway
+            logger.error(f"Error recording the failure of job {job['id']}: {str(e)}")
+        return retry_at is None
+
+    async def _prune(self, payload: dict) -> dict:
+        return {"deleted": await JobDB.prune(self.retention)}
+
+    async def close(self):
+        """Stop claiming jobs; running ones are interrupted and run again on the next start"""
+        tasks = [task for task in (self._dispatcher, *self._running.values()) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._dispatcher = None
+
+    def metrics(self) -> dict:
+        runs = self.completed + self.retried + self.failed
+        return {
+            "workers": self.workers,
+            "running": len(self._running),
+            "enqueued": self.enqueued,
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "leases_lost": self.leases_lost,
+            "run_time_avg_ms": round(self.run_seconds / runs * 1000, 2) if runs else 0.0,
+        }
+
+
+# Global queue started with the app; handlers register on import
+job_queue = JobQueue(
+    workers=int(os.environ.get('JOB_WORKERS', '4')),
+    visibility_timeout=float(os.environ.get('JOB_VISIBILITY_TIMEOUT', '60')),
+    max_attempts=int(os.environ.get('JOB_MAX_ATTEMPTS', '5')),
+    retention=float(os.environ.get('JOB_RETENTION_HOURS', '168')) * 3600,
+)
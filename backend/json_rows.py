@@ -0,0 +1,28 @@
+from typing import Iterable, Mapping, Optional
+from fastapi import Response
+import orjson
+
+
+class JSONRowsResponse(Response):
+    """
+    JSON array assembled from rows SQLite already serialised (see the
+    *_JSON expressions in database.py). Returning a Response directly skips
+    response_model validation and re-encoding, which dominate the cost of
+    list endpoints; the rows come from our own schema, so both are redundant.
+    """
+    media_type = "application/json"
+
+    def __init__(self, rows: Iterable[str], status_code: int = 200, headers: Optional[Mapping[str, str]] = None):
+        super().__init__(content="[" + ",".join(rows) + "]", status_code=status_code, headers=headers)
+
+
+class JSONEnvelopeResponse(Response):
+    """A JSON object of plain ``fields`` plus pre-serialised rows under ``key``"""
+    media_type = "application/json"
+
+    def __init__(self, key: str, rows: Iterable[str], fields: Optional[dict] = None,
+                 status_code: int = 200, headers: Optional[Mapping[str, str]] = None):
+        head = orjson.dumps({**(fields or {}), key: []})
+        # Splice the rows into the empty array that closes the object
+        content = head[:-3] + b"[" + ",".join(rows).encode() + b"]}"
+        super().__init__(content=content, status_code=status_code, headers=headers)
@@ -0,0 +1,375 @@
+import asyncio
+import logging
+import math
+import random
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Upstream statuses worth another attempt: timeouts, rate limits, overload and gateway errors
+RETRYABLE_STATUSES = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+# Provider SDK exception names for transient failures, matched by name so the SDK stays lazily imported
+RETRYABLE_ERRORS = {
+    "APIConnectionError", "APITimeoutError", "Timeout", "RateLimitError",
+    "ServiceUnavailableError", "InternalServerError", "ServerDisconnectedError",
+    "ClientConnectionError",
+}
+
+
+class LLMError(Exception):
+    """An AI request that failed; ``status_code`` is the HTTP status to answer with"""
+
+    status_code = 502
+
+    def __init__(self, message: str, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMTimeout(LLMError):
+    """The request's deadline passed before the provider answered"""
+
+    status_code = 504
+
+
+class LLMUnavailable(LLMError):
+    """The provider's circuit is open: it has been failing, so requests fail fast"""
+
+    status_code = 503
+
+
+def _status(error: BaseException) -> Optional[int]:
+    for source in (error, getattr(error, "response", None)):
+        status = getattr(source, "status_code", None) or getattr(source, "status", None)
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether ``error`` is transient (network, timeout, 429, 5xx) rather than a rejected request"""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = _status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    return any(cls.__name__ in RETRYABLE_ERRORS for cls in type(error).__mro__)
+
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive transient failures; while
+    open, calls fail at once. After ``reset_timeout`` seconds one probe is
+    let through: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+        # Metrics
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self, name: str):
+        """Raise LLMUnavailable unless a call may go through now"""
+        state = self.state
+        if state == "closed":
+            return
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return
+        self.rejected += 1
+        retry_after = max(1, math.ceil(self.opened_at + self.reset_timeout - time.monotonic()))
+        raise LLMUnavailable(f"AI provider {name} is unavailable after repeated failures; try again shortly", retry_after)
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._probing:
+                self.times_opened += 1
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def abandon(self):
+        """The call ended without an answer either way (e.g. cancelled); let another probe through"""
+        self._probing = False
+
+    def metrics(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+class LLMPolicy:
+    """
+    Deadlines, retries, circuit breaking and hedging around provider calls.
+
+    Every attempt has its own timeout and the whole request has a deadline.
+    Transient failures are retried with full-jitter exponential backoff while
+    the deadline allows; other errors fail at once. Each provider/model has
+    a circuit breaker and its own latency history (the last
+    ``latency_window`` seconds). A non-streaming attempt still running after
+    the recent ``hedge_percentile`` latency gets a second, hedged attempt,
+    and the first answer wins. Streams are retried until their first chunk,
+    and then only need to keep producing chunks within ``stream_idle_timeout``.
+    """
+
+    def __init__(self, attempt_timeout: float = 60.0, deadline: float = 120.0,
+                 stream_idle_timeout: float = 30.0, max_attempts: int = 3,
+                 base_delay: float = 0.5, max_delay: float = 8.0,
+                 breaker_threshold: int = 5, breaker_reset: float = 30.0,
+                 hedge: bool = True, hedge_percentile: float = 95.0,
+                 hedge_min_delay: float = 2.0, hedge_min_samples: int = 20,
+                 latency_window: float = 300.0):
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.stream_idle_timeout = stream_idle_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.latency_window = latency_window
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[str, Deque[Tuple[float, float]]] = {}  # name -> (recorded at, seconds)
+
+        # Metrics
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = self._breakers[name] = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+        return breaker
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: uniform between 0 and the capped exponential delay"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def _record_latency(self, name: str, seconds: float):
+        samples = self._latencies.get(name)
+        if samples is None:
+            samples = self._latencies[name] = deque(maxlen=200)
+        samples.append((time.monotonic(), seconds))
+
+    def latency(self, name: str, pct: float, min_samples: int = 1) -> Optional[float]:
+        """
+        Recent ``pct`` percentile latency of ``name`` in seconds (time to the
+        answer, or to the first chunk of a stream), or None with fewer than
+        ``min_samples`` calls in the last ``latency_window`` seconds
+        """
+        cutoff = time.monotonic() - self.latency_window
+        ordered = sorted(seconds for at, seconds in self._latencies.get(name, ()) if at >= cutoff)
+        if not ordered or len(ordered) < min_samples:
+            return None
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    def hedge_delay(self, name: str) -> Optional[float]:
+        """How long an attempt runs before it is hedged, or None while there is too little history"""
+        if not self.hedge:
+            return None
+        latency = self.latency(name, self.hedge_percentile, self.hedge_min_samples)
+        return max(self.hedge_min_delay, latency) if latency is not None else None
+
+    def _fail(self, name: str, breaker: CircuitBreaker, error: BaseException,
+              attempt: int, deadline: float) -> float:
+        """Account for a failed attempt and return the delay before retrying, or raise"""
+        loop_time = asyncio.get_running_loop().time()
+        timed_out = isinstance(error, asyncio.TimeoutError)
+        if timed_out:
+            self.timeouts += 1
+        if not is_retryable(error):
+            # The provider answered, so it is up; the request itself was rejected
+            breaker.record_success()
+            self.failures += 1
+            raise LLMError(f"AI provider {name} rejected the request: {str(error)}") from error
+        breaker.record_failure()
+        delay = self.backoff(attempt)
+        retry_after = getattr(error, "retry_after", None)
+        if isinstance(retry_after, (int, float)):
+            delay = max(delay, retry_after)
+        if attempt >= self.max_attempts or loop_time + delay >= deadline:
+            self.failures += 1
+            if timed_out or loop_time >= deadline:
+                raise LLMTimeout(f"AI provider {name} did not answer in time") from error
+            raise LLMError(f"AI provider {name} failed after {attempt} attempts: {str(error) or type(error).__name__}") from error
+        self.retries += 1
+        logger.warning(f"AI request to {name} failed (attempt {attempt}), retrying in {delay:.2f}s: "
+                       f"{str(error) or type(error).__name__}")
+        return delay
+
+    async def _attempt(self, name: str, send: Callable[[bool], Awaitable[str]], timeout: float,
+                       can_hedge: Optional[Callable[[], bool]]) -> str:
+        hedge_after = self.hedge_delay(name)
+        if hedge_after is None or hedge_after >= timeout:
+            return await asyncio.wait_for(send(False), timeout)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        primary = loop.create_task(send(False))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done and (can_hedge is None or can_hedge()):
+                self.hedges += 1
+                tasks.add(loop.create_task(send(True)))
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                remaining = start + timeout - loop.time()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = error or task.exception()
+            if error is not None and not pending:
+                raise error
+            raise asyncio.TimeoutError()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def call(self, name: str, send: Callable[[bool], Awaitable[str]],
+                   can_hedge: Optional[Callable[[], bool]] = None,
+                   deadline: Optional[float] = None) -> str:
+        """
+        Return ``await send(hedged)`` under the policy. ``send`` is called
+        again for each retry, and with ``hedged=True`` for a hedged duplicate
+        (which should not share client state with the primary). ``can_hedge``
+        can veto a hedge, e.g. when there is no spare capacity. ``deadline``
+        (seconds) shortens the policy's deadline for this call.
+        """
+        self.calls += 1
+        breaker = self.breaker(name)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + min(self.deadline, deadline or self.deadline)
+        attempt = 0
+        while True:
+            breaker.before_call(name)
+            attempt += 1
+            self.attempts += 1
+            start = loop.time()
+            try:
+                result = await self._attempt(name, send, min(self.attempt_timeout, max(0.0, deadline - start)), can_hedge)
+            except asyncio.CancelledError:
+                breaker.abandon()
+                raise
+            except Exception as e:
+                await asyncio.sleep(self._fail(name, breaker, e, attempt, deadline))
+                continue
+            breaker.record_success()
+            self._record_latency(name, loop.time() - start)
+            return result
+
+    async def stream(self, name: str, open_stream: Callable[[], AsyncIterator[str]],
+                     deadline: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        Yield the chunks of ``open_stream()`` under the policy. Failures
+        before the first chunk are retried with a fresh stream; after it, a
+        failure or a gap longer than ``stream_idle_timeout`` ends the stream
+        with an LLMError, since the chunks already sent cannot be taken back.
+        ``deadline`` shortens the policy's deadline for the first chunk.
+        """
+        self.calls += 1
+        breaker = self.breaker(name)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + min(self.deadline, deadline or self.deadline)
+        attempt = 0
+        while True:
+            breaker.before_call(name)
+            attempt += 1
+            self.attempts += 1
+            start = loop.time()
+            chunks = open_stream().__aiter__()
+            started = False
+            try:
+                while True:
+                    timeout = (self.stream_idle_timeout if started
+                               else min(self.attempt_timeout, max(0.0, deadline - loop.time())))
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+                    except StopAsyncIteration:
+                        break
+                    if not started:
+                        started = True
+                        breaker.record_success()
+                        self._record_latency(name, loop.time() - start)
+                    yield chunk
+                if not started:
+                    breaker.record_success()
+                return
+            except (asyncio.CancelledError, GeneratorExit):
+                if not started:
+                    breaker.abandon()
+                raise
+            except Exception as e:
+                if started:
+                    self.failures += 1
+                    if isinstance(e, asyncio.TimeoutError):
+                        self.timeouts += 1
+                        raise LLMTimeout(f"AI provider {name} stopped responding mid-reply") from e
+                    raise LLMError(f"AI provider {name} failed mid-reply: {str(e)}") from e
+                delay = self._fail(name, breaker, e, attempt, deadline)
+            finally:
+                close = getattr(chunks, "aclose", None)
+                if close is not None:
+                    await close()
+            await asyncio.sleep(delay)
+
+    def _provider_metrics(self, name: str, breaker: CircuitBreaker) -> dict:
+        def milliseconds(seconds: Optional[float]) -> Optional[float]:
+            return round(seconds * 1000, 1) if seconds is not None else None
+
+        return {
+            **breaker.metrics(),
+            "latency_p50_ms": milliseconds(self.latency(name, 50)),
+            "latency_p95_ms": milliseconds(self.latency(name, 95)),
+            "hedge_after_ms": milliseconds(self.hedge_delay(name)),
+        }
+
+    def metrics(self) -> dict:
+        return {
+            "calls": self.calls,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "providers": {name: self._provider_metrics(name, breaker) for name, breaker in self._breakers.items()},
+        }
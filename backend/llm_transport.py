@@ -0,0 +1,115 @@
+import logging
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+
+def _counting_transport(owner: "SharedTransport") -> "httpx.AsyncHTTPTransport":
+    """Pooled transport that tells ``owner`` whether each request needed a new connection"""
+    # Imported here: httpx is only needed once the LLM SDK is, which is kept off the startup path
+    import httpx
+
+    class CountingTransport(httpx.AsyncHTTPTransport):
+        async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+            opened = False
+            outer_trace = request.extensions.get("trace")
+
+            async def trace(event: str, info: dict):
+                nonlocal opened
+                if event == "connection.connect_tcp.complete":
+                    opened = True
+                if outer_trace is not None:
+                    await outer_trace(event, info)
+
+            request.extensions = {**request.extensions, "trace": trace}
+            try:
+                return await super().handle_async_request(request)
+            finally:
+                owner._record(opened)
+
+        @property
+        def pooled(self) -> int:
+            return len(self._pool.connections)
+
+    return CountingTransport(limits=httpx.Limits(max_connections=owner.max_connections,
+                                                 max_keepalive_connections=owner.max_keepalive,
+                                                 keepalive_expiry=owner.keepalive_expiry))
+
+
+class SharedTransport:
+    """
+    One pooled HTTP client shared by every LLM call.
+
+    LlmChat clients are still created per call (each keeps a transcript of
+    what was sent through it), but their HTTP requests go through litellm,
+    which uses ``litellm.aclient_session`` when it is set. Handing it this
+    client keeps connections and TLS sessions alive across calls and
+    sessions instead of opening new ones for every message. At most
+    ``max_keepalive`` idle connections are kept, each for up to
+    ``keepalive_expiry`` seconds; the rest are closed (evicted).
+
+    A request served on a pooled connection is a hit, one that had to
+    connect is a miss.
+    """
+
+    def __init__(self, max_connections: int = 20, max_keepalive: int = 10, keepalive_expiry: float = 60.0):
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.client: Optional["httpx.AsyncClient"] = None
+        self._transport = None
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+
+    def open(self) -> "httpx.AsyncClient":
+        """The shared client, created on first use"""
+        import httpx
+        if self.client is None:
+            self._transport = _counting_transport(self)
+            # Attempt timeouts are enforced by LLMPolicy
+            self.client = httpx.AsyncClient(transport=self._transport, timeout=httpx.Timeout(None, connect=10.0))
+        return self.client
+
+    def install(self) -> bool:
+        """Route the SDK's requests through the shared client; whether its HTTP layer supports that"""
+        try:
+            import litellm
+        except ImportError:
+            logger.info("LLM SDK does not use litellm, its HTTP connections are not shared")
+            return False
+        litellm.aclient_session = self.open()
+        return True
+
+    def _record(self, opened: bool):
+        if opened:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+            self._transport = None
+
+    def metrics(self) -> dict:
+        requests = self.hits + self.misses
+        pooled = self._transport.pooled if self._transport is not None else 0
+        return {
+            "shared": self.client is not None,
+            "max_connections": self.max_connections,
+            "max_keepalive": self.max_keepalive,
+            "keepalive_seconds": self.keepalive_expiry,
+            "requests": requests,
+            "hits": self.hits,
+            "misses": self.misses,
+            # Every connection opened and no longer in the pool was closed: expired, over the bound or broken
+            "evictions": max(0, self.misses - pooled),
+            "pooled": pooled,
+            "hit_rate": round(self.hits / requests, 4) if requests else 0.0,
+        }
@@ -0,0 +1,456 @@
+import sqlite3
+import logging
+from datetime import datetime
+from typing import Callable, List, Tuple
+from blob_store import blob_store, blob_url, BLOB_URL_PREFIX
+
+logger = logging.getLogger(__name__)
+
+# Ordered list of (version, description, apply_fn). The schema version is
+# stored in PRAGMA user_version; each migration runs in its own transaction.
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = []
+
+
+def migration(version: int, description: str):
+    """Register a schema migration for ``version``"""
+    def register(fn):
+        if any(v == version for v, _, _ in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def get_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply all pending migrations and return the resulting schema version"""
+    current = get_version(conn)
+    for version, description, apply in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info(f"Applying database migration {version}: {description}")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            apply(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"Database migration {version} failed")
+            raise
+        current = version
+    return current
+
+
+@migration(1, "initial schema")
+def _initial_schema(conn: sqlite3.Connection):
+    # Sessions table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            date TEXT NOT NULL,
+            duration TEXT DEFAULT '0 mins',
+            questionsAsked INTEGER DEFAULT 0,
+            model TEXT DEFAULT 'GPT-5.2',
+            createdAt TEXT NOT NULL,
+            updatedAt TEXT NOT NULL
+        )
+    """)
+
+    # Messages table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS messages (
+            id TEXT PRIMARY KEY,
+            sessionId TEXT NOT NULL,
+            type TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            messageType TEXT DEFAULT 'text',
+            audioUrl TEXT,
+            imageUrl TEXT,
+            FOREIGN KEY (sessionId) REFERENCES sessions (id)
+        )
+    """)
+
+    # Input history table
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS input_history (
+            id TEXT PRIMARY KEY,
+            sessionId TEXT NOT NULL,
+            input TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            FOREIGN KEY (sessionId) REFERENCES sessions (id)
+        )
+    """)
+
+
+@migration(2, "indexes for hot session, message and input history queries")
+def _hot_query_indexes(conn: sqlite3.Connection):
+    # MessageDB.get_by_session / InputHistoryDB.get_by_session: WHERE sessionId = ? ORDER BY timestamp
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_session_timestamp ON messages (sessionId, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_input_history_session_timestamp ON input_history (sessionId, timestamp)")
+    # InputHistoryDB.get_all: ORDER BY timestamp DESC LIMIT 100
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_input_history_timestamp ON input_history (timestamp)")
+    # SessionDB.get_all: ORDER BY createdAt DESC
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_created_at ON sessions (createdAt)")
+
+
+@migration(3, "content-addressed blob store for message media")
+def _blob_store(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            contentType TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            createdAt TEXT NOT NULL
+        )
+    """)
+
+    # Move inline base64 payloads out of messages, a batch at a time to bound memory
+    now = datetime.utcnow().isoformat()
+    for column in ("imageUrl", "audioUrl"):
+        last_rowid = 0
+        moved = 0
+        while True:
+            rows = conn.execute(f"""
+                SELECT rowid, {column} FROM messages
+                WHERE rowid > ? AND {column} LIKE 'data:%'
+                ORDER BY rowid LIMIT 100
+            """, (last_rowid,)).fetchall()
+            if not rows:
+                break
+            for rowid, value in rows:
+                # Written (fsynced) before the commit that refers to it. If the migration
+                # rolls back, the retry writes the same content-addressed files again and
+                # blobs.gc removes any left without a row
+                blob_hash, content_type, size = blob_store.put_data_url(value)
+                conn.execute(
+                    "INSERT OR IGNORE INTO blobs (hash, contentType, size, createdAt) VALUES (?, ?, ?, ?)",
+                    (blob_hash, content_type, size, now)
+                )
+                conn.execute(f"UPDATE messages SET {column} = ? WHERE rowid = ?", (blob_url(blob_hash), rowid))
+            last_rowid = rows[-1][0]
+            moved += len(rows)
+        if moved:
+            logger.info(f"Moved {moved} inline {column} payloads to the blob store")
+
+
+@migration(4, "cascade session deletes and support deferred purges")
+def _cascade_session_deletes(conn: sqlite3.Connection):
+    # SQLite cannot alter a foreign key, so rebuild the child tables. Rowids are
+    # preserved because keyset pagination cursors refer to them.
+    conn.execute("""
+        CREATE TABLE messages_new (
+            id TEXT PRIMARY KEY,
+            sessionId TEXT NOT NULL,
+            type TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            messageType TEXT DEFAULT 'text',
+            audioUrl TEXT,
+            imageUrl TEXT,
+            FOREIGN KEY (sessionId) REFERENCES sessions (id) ON DELETE CASCADE
+        )
+    """)
+    conn.execute("""
+        INSERT INTO messages_new (rowid, id, sessionId, type, content, timestamp, messageType, audioUrl, imageUrl)
+        SELECT rowid, id, sessionId, type, content, timestamp, messageType, audioUrl, imageUrl FROM messages
+    """)
+    conn.execute("DROP TABLE messages")
+    conn.execute("ALTER TABLE messages_new RENAME TO messages")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_session_timestamp ON messages (sessionId, timestamp)")
+
+    conn.execute("""
+        CREATE TABLE input_history_new (
+            id TEXT PRIMARY KEY,
+            sessionId TEXT NOT NULL,
+            input TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            FOREIGN KEY (sessionId) REFERENCES sessions (id) ON DELETE CASCADE
+        )
+    """)
+    conn.execute("""
+        INSERT INTO input_history_new (rowid, id, sessionId, input, timestamp)
+        SELECT rowid, id, sessionId, input, timestamp FROM input_history
+    """)
+    conn.execute("DROP TABLE input_history")
+    conn.execute("ALTER TABLE input_history_new RENAME TO input_history")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_input_history_session_timestamp ON input_history (sessionId, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_input_history_timestamp ON input_history (timestamp)")
+
+    # Sessions too large to delete in one transaction are hidden first and purged in chunks
+    conn.execute("ALTER TABLE sessions ADD COLUMN deletedAt TEXT")
+
+
+@migration(5, "full-text search over messages and input history")
+def _search_index(conn: sqlite3.Connection):
+    # One index for both sources. The FTS rowid is derived from the source
+    # rowid (messages even, input history odd) so triggers and the backfill
+    # can address an entry directly.
+    conn.execute("""
+        CREATE VIRTUAL TABLE search_index USING fts5(
+            content,
+            sessionId UNINDEXED,
+            kind UNINDEXED,
+            sourceId UNINDEXED,
+            timestamp UNINDEXED,
+            tokenize = 'porter unicode61'
+        )
+    """)
+    for statement in (
+        """CREATE TRIGGER messages_search_insert AFTER INSERT ON messages BEGIN
+            INSERT OR REPLACE INTO search_index (rowid, content, sessionId, kind, sourceId, timestamp)
+            VALUES (new.rowid * 2, new.content, new.sessionId, new.type, new.id, new.timestamp);
+        END""",
+        """CREATE TRIGGER messages_search_update AFTER UPDATE OF content, sessionId, type, timestamp ON messages BEGIN
+            INSERT OR REPLACE INTO search_index (rowid, content, sessionId, kind, sourceId, timestamp)
+            VALUES (new.rowid * 2, new.content, new.sessionId, new.type, new.id, new.timestamp);
+        END""",
+        """CREATE TRIGGER messages_search_delete AFTER DELETE ON messages BEGIN
+            DELETE FROM search_index WHERE rowid = old.rowid * 2;
+        END""",
+        """CREATE TRIGGER input_history_search_insert AFTER INSERT ON input_history BEGIN
+            INSERT OR REPLACE INTO search_index (rowid, content, sessionId, kind, sourceId, timestamp)
+            VALUES (new.rowid * 2 + 1, new.input, new.sessionId, 'input', new.id, new.timestamp);
+        END""",
+        """CREATE TRIGGER input_history_search_update AFTER UPDATE OF input, sessionId, timestamp ON input_history BEGIN
+            INSERT OR REPLACE INTO search_index (rowid, content, sessionId, kind, sourceId, timestamp)
+            VALUES (new.rowid * 2 + 1, new.input, new.sessionId, 'input', new.id, new.timestamp);
+        END""",
+        """CREATE TRIGGER input_history_search_delete AFTER DELETE ON input_history BEGIN
+            DELETE FROM search_index WHERE rowid = old.rowid * 2 + 1;
+        END""",
+    ):
+        conn.execute(statement)
+
+    # Existing rows are indexed in the background (SearchDB.backfill_chunk) up
+    # to the high-water mark recorded here; the triggers cover everything newer.
+    conn.execute("""
+        CREATE TABLE search_backfill (
+            source TEXT PRIMARY KEY,
+            lastRowid INTEGER NOT NULL,
+            maxRowid INTEGER NOT NULL
+        )
+    """)
+    for source in ("messages", "input_history"):
+        conn.execute(
+            f"INSERT INTO search_backfill (source, lastRowid, maxRowid) SELECT ?, 0, IFNULL(MAX(rowid), 0) FROM {source}",
+            (source,)
+        )
+
+
+@migration(6, "version counters for conditional GETs")
+def _version_counters(conn: sqlite3.Connection):
+    # sessions.version changes whenever the session or any of its messages
+    # does; versions.sessions whenever the session list does. Triggers keep
+    # them exact for every write path, including cascades and purges.
+    conn.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+    conn.execute("CREATE TABLE versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+    conn.execute("INSERT INTO versions (name, version) VALUES ('sessions', 0)")
+    for statement in (
+        """CREATE TRIGGER messages_version_insert AFTER INSERT ON messages BEGIN
+            UPDATE sessions SET version = version + 1 WHERE id = new.sessionId;
+        END""",
+        """CREATE TRIGGER messages_version_update AFTER UPDATE ON messages BEGIN
+            UPDATE sessions SET version = version + 1 WHERE id IN (old.sessionId, new.sessionId);
+        END""",
+        """CREATE TRIGGER messages_version_delete AFTER DELETE ON messages BEGIN
+            UPDATE sessions SET version = version + 1 WHERE id = old.sessionId;
+        END""",
+        """CREATE TRIGGER sessions_version_insert AFTER INSERT ON sessions BEGIN
+            UPDATE versions SET version = version + 1 WHERE name = 'sessions';
+        END""",
+        """CREATE TRIGGER sessions_version_update
+        AFTER UPDATE OF title, date, duration, questionsAsked, model, createdAt, updatedAt, deletedAt ON sessions BEGIN
+            UPDATE sessions SET version = version + 1 WHERE id = new.id;
+            UPDATE versions SET version = version + 1 WHERE name = 'sessions';
+        END""",
+        """CREATE TRIGGER sessions_version_delete AFTER DELETE ON sessions BEGIN
+            UPDATE versions SET version = version + 1 WHERE name = 'sessions';
+        END""",
+    ):
+        conn.execute(statement)
+
+
+# Trigger snippets advancing and reading the global change sequence
+_NEXT_SEQ = "UPDATE versions SET version = version + 1 WHERE name = 'seq';"
+_CURRENT_SEQ = "(SELECT version FROM versions WHERE name = 'seq')"
+
+
+@migration(7, "change sequence for incremental sync")
+def _change_sequence(conn: sqlite3.Connection):
+    # Every insert or update of a session, message or input gets the next
+    # value of one global counter, so "everything after seq N" is an index
+    # range. Writes are serialised on one writer, so seq follows commit order.
+    conn.execute("ALTER TABLE sessions ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE messages ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE input_history ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+    # Deleted messages cannot be listed, so the session records when they went
+    conn.execute("ALTER TABLE sessions ADD COLUMN messagesDeletedSeq INTEGER NOT NULL DEFAULT 0")
+    conn.execute("CREATE TABLE session_tombstones (seq INTEGER PRIMARY KEY, id TEXT NOT NULL)")
+
+    # Only real changes to a message should bump its session's version, not seq bookkeeping
+    conn.execute("DROP TRIGGER messages_version_update")
+    conn.execute("""
+        CREATE TRIGGER messages_version_update
+        AFTER UPDATE OF sessionId, type, content, timestamp, messageType, audioUrl, imageUrl ON messages BEGIN
+            UPDATE sessions SET version = version + 1 WHERE id IN (old.sessionId, new.sessionId);
+        END
+    """)
+
+    # Number existing rows in a stable order
+    seq = 0
+    for table in ("sessions", "messages", "input_history"):
+        conn.execute(f"UPDATE {table} SET seq = rowid + ?", (seq,))
+        seq += conn.execute(f"SELECT IFNULL(MAX(rowid), 0) FROM {table}").fetchone()[0]
+    conn.execute("INSERT INTO versions (name, version) VALUES ('seq', ?)", (seq,))
+
+    session_columns = "title, date, duration, questionsAsked, model, createdAt, updatedAt, deletedAt"
+    message_columns = "sessionId, type, content, timestamp, messageType, audioUrl, imageUrl"
+    for statement in (
+        f"""CREATE TRIGGER sessions_seq_insert AFTER INSERT ON sessions BEGIN
+            {_NEXT_SEQ}
+            UPDATE sessions SET seq = {_CURRENT_SEQ} WHERE rowid = new.rowid;
+        END""",
+        f"""CREATE TRIGGER sessions_seq_update AFTER UPDATE OF {session_columns} ON sessions BEGIN
+            {_NEXT_SEQ}
+            UPDATE sessions SET seq = {_CURRENT_SEQ} WHERE rowid = new.rowid;
+        END""",
+        f"""CREATE TRIGGER sessions_seq_delete AFTER DELETE ON sessions BEGIN
+            {_NEXT_SEQ}
+            INSERT INTO session_tombstones (seq, id) VALUES ({_CURRENT_SEQ}, old.id);
+        END""",
+        f"""CREATE TRIGGER messages_seq_insert AFTER INSERT ON messages BEGIN
+            {_NEXT_SEQ}
+            UPDATE messages SET seq = {_CURRENT_SEQ} WHERE rowid = new.rowid;
+        END""",
+        f"""CREATE TRIGGER messages_seq_update AFTER UPDATE OF {message_columns} ON messages BEGIN
+            {_NEXT_SEQ}
+            UPDATE messages SET seq = {_CURRENT_SEQ} WHERE rowid = new.rowid;
+        END""",
+        f"""CREATE TRIGGER messages_seq_delete AFTER DELETE ON messages BEGIN
+            {_NEXT_SEQ}
+            UPDATE sessions SET messagesDeletedSeq = {_CURRENT_SEQ} WHERE id = old.sessionId;
+        END""",
+        f"""CREATE TRIGGER input_history_seq_insert AFTER INSERT ON input_history BEGIN
+            {_NEXT_SEQ}
+            UPDATE input_history SET seq = {_CURRENT_SEQ} WHERE rowid = new.rowid;
+        END""",
+    ):
+        conn.execute(statement)
+
+    conn.execute("CREATE INDEX idx_sessions_seq ON sessions (seq)")
+    conn.execute("CREATE INDEX idx_messages_session_seq ON messages (sessionId, seq)")
+    conn.execute("CREATE INDEX idx_input_history_seq ON input_history (seq)")
+
+
+@migration(8, "idempotency keys for chat requests")
+def _idempotency_keys(conn: sqlite3.Connection):
+    # Maps a client-chosen key to the exchange it produced, so a retried
+    # POST replays that exchange instead of storing a second one. Rows go
+    # with their reply (deleting a conversation frees its keys) or expire.
+    conn.execute("""
+        CREATE TABLE idempotency_keys (
+            key TEXT PRIMARY KEY,
+            sessionId TEXT NOT NULL,
+            userMessageId TEXT NOT NULL,
+            messageId TEXT NOT NULL,
+            createdAt TEXT NOT NULL,
+            FOREIGN KEY (messageId) REFERENCES messages (id) ON DELETE CASCADE
+        )
+    """)
+    conn.execute("CREATE INDEX idx_idempotency_keys_message ON idempotency_keys (messageId)")
+    conn.execute("CREATE INDEX idx_idempotency_keys_created_at ON idempotency_keys (createdAt)")
+
+
+@migration(9, "cached speech-to-text transcripts")
+def _transcripts(conn: sqlite3.Connection):
+    # Keyed on the SHA-256 of the audio (the same hash the blob store uses)
+    # and the model that produced the text
+    conn.execute("""
+        CREATE TABLE transcripts (
+            hash TEXT NOT NULL,
+            model TEXT NOT NULL,
+            text TEXT NOT NULL,
+            language TEXT,
+            duration REAL NOT NULL,
+            createdAt TEXT NOT NULL,
+            PRIMARY KEY (hash, model)
+        )
+    """)
+
+
+@migration(10, "durable background job queue")
+def _jobs(conn: sqlite3.Connection):
+    # A job is claimable once visibleAt has passed. Claiming pushes
+    # visibleAt out by the visibility timeout, so a job whose worker dies
+    # becomes claimable again; attempts doubles as the claim's fencing token.
+    # key (optional) makes a submission idempotent or coalesces repeats.
+    conn.execute("""
+        CREATE TABLE jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            key TEXT UNIQUE,
+            payload TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            maxAttempts INTEGER NOT NULL,
+            visibleAt TEXT NOT NULL,
+            lastError TEXT,
+            result TEXT,
+            createdAt TEXT NOT NULL,
+            updatedAt TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX idx_jobs_pending ON jobs (priority DESC, visibleAt)
+        WHERE status IN ('queued', 'running')
+    """)
+    conn.execute("CREATE INDEX idx_jobs_finished ON jobs (updatedAt) WHERE status IN ('done', 'failed')")
+
+
+# Trigger snippets counting a message's references to stored blobs
+def _blob_ref(row: str, column: str, delta: str) -> str:
+    return (f"UPDATE blobs SET refs = refs {delta} 1 "
+            f"WHERE {row}.{column} LIKE '{BLOB_URL_PREFIX}%' AND hash = substr({row}.{column}, {len(BLOB_URL_PREFIX) + 1});")
+
+
+@migration(11, "reference counts for blob garbage collection")
+def _blob_refs(conn: sqlite3.Connection):
+    # refs counts the imageUrl/audioUrl columns pointing at each blob; a blob
+    # at zero belongs to no message and is collected by the blobs.gc job
+    conn.execute("ALTER TABLE blobs ADD COLUMN refs INTEGER NOT NULL DEFAULT 0")
+    conn.execute(f"""
+        UPDATE blobs SET refs = counts.refs FROM (
+            SELECT substr(url, {len(BLOB_URL_PREFIX) + 1}) AS hash, COUNT(*) AS refs FROM (
+                SELECT imageUrl AS url FROM messages WHERE imageUrl LIKE '{BLOB_URL_PREFIX}%'
+                UNION ALL
+                SELECT audioUrl FROM messages WHERE audioUrl LIKE '{BLOB_URL_PREFIX}%'
+            ) GROUP BY 1
+        ) AS counts WHERE blobs.hash = counts.hash
+    """)
+    conn.execute("CREATE INDEX idx_blobs_unreferenced ON blobs (hash) WHERE refs = 0")
+
+    for statement in (
+        f"""CREATE TRIGGER messages_blob_refs_insert AFTER INSERT ON messages BEGIN
+            {_blob_ref("new", "imageUrl", "+")}
+            {_blob_ref("new", "audioUrl", "+")}
+        END""",
+        f"""CREATE TRIGGER messages_blob_refs_update AFTER UPDATE OF imageUrl, audioUrl ON messages BEGIN
+            {_blob_ref("old", "imageUrl", "-")}
+            {_blob_ref("old", "audioUrl", "-")}
+            {_blob_ref("new", "imageUrl", "+")}
+            {_blob_ref("new", "audioUrl", "+")}
+        END""",
+        f"""CREATE TRIGGER messages_blob_refs_delete AFTER DELETE ON messages BEGIN
+            {_blob_ref("old", "imageUrl", "-")}
+            {_blob_ref("old", "audioUrl", "-")}
+        END""",
+    ):
+        conn.execute(statement)
@@ -0,0 +1,230 @@
+import logging
+import re
+import time
+from collections import Counter
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from llm_policy import LLMError, LLMPolicy
+
+logger = logging.getLogger(__name__)
+
+# Models a session can ask for, by the name the UI shows, each mapped to
+# "provider/model" targets in order of preference: the model itself, then
+# comparable models from other providers to fall back to
+DEFAULT_MODELS = {
+    "GPT-5.2": ["openai/gpt-5.2", "anthropic/claude-sonnet-4-5-20250929", "gemini/gemini-2.5-pro"],
+    "Claude Sonnet 4.5": ["anthropic/claude-sonnet-4-5-20250929", "openai/gpt-5.2", "gemini/gemini-2.5-pro"],
+    "Gemini 2.5 Pro": ["gemini/gemini-2.5-pro", "openai/gpt-5.2", "anthropic/claude-sonnet-4-5-20250929"],
+}
+# Cheaper, faster models that answer short, simple questions
+DEFAULT_SIMPLE_TARGETS = ["openai/gpt-5-mini", "gemini/gemini-2.5-flash"]
+
+# Distinct unknown model names warned about; further ones are only counted
+MAX_UNKNOWN_LOGGED = 32
+
+# Questions that need the full model whatever their length: code, design and reasoning
+COMPLEX_PATTERN = re.compile(
+    r"```|[{};]|\b(design|architect\w*|implement\w*|optimi[sz]\w*|debug\w*|refactor\w*|algorithm\w*|"
+    r"complexity|trade-?offs?|compare|step[- ]by[- ]step|in detail|write (a|an|the|some)? ?(code|function|program|query|class))\b",
+    re.IGNORECASE
+)
+
+
+class ModelRouter:
+    """
+    Maps the model a request asks for to provider/model targets and picks
+    the order to try them in.
+
+    Only configured targets are used: a model name or "provider/model"
+    that is not in the table gets the default model's targets. Short
+    text-only questions for the default model (at most
+    ``simple_max_tokens``, nothing that looks like code or design work) go
+    to the cheaper ``simple_targets`` first; a model picked explicitly is
+    not overridden. Targets whose circuit is open, or whose recent
+    ``slo_percentile`` latency breaks ``latency_slo``, are moved behind
+    the healthy ones; latency history expires, so a demoted target gets
+    traffic again once it has gone quiet. While a fallback remains, a
+    target gets ``latency_slo`` seconds to start streaming, or
+    ``answer_deadline`` seconds to return a whole answer, before the next
+    one is tried. A long answer takes well over the SLO to complete, so
+    the SLO alone would cancel it just as it was about to arrive.
+    """
+
+    def __init__(self, policy: LLMPolicy, models: Dict[str, List[str]], default_model: str,
+                 simple_targets: List[str], simple_max_tokens: int = 32,
+                 latency_slo: float = 30.0, answer_deadline: float = 90.0,
+                 slo_percentile: float = 95.0, slo_min_samples: int = 10,
+                 count_tokens: Callable[[str], int] = lambda text: len(text) // 4 + 1):
+        self.policy = policy
+        self.models = {name: list(targets) for name, targets in models.items() if targets}
+        self.default_model = default_model if default_model in self.models else next(iter(self.models))
+        self.simple_targets = list(simple_targets)
+        self.simple_max_tokens = simple_max_tokens
+        self.latency_slo = latency_slo
+        self.answer_deadline = answer_deadline
+        self.slo_percentile = slo_percentile
+        self.slo_min_samples = slo_min_samples
+        self.count_tokens = count_tokens
+        self._by_lower = {name.lower(): name for name in self.models}
+        # Only configured targets are ever called, so client input cannot grow per-target state
+        self._configured = {target for targets in self.models.values() for target in targets} | set(self.simple_targets)
+        self._unknown_logged = set()
+        self._stats: Dict[str, Counter] = {}
+
+        # Metrics
+        self.requests = 0
+        self.simple_routed = 0
+        self.rerouted = 0
+        self.fallbacks = 0
+        self.unknown_models = 0
+
+    def _model_name(self, model: Optional[str]) -> Optional[str]:
+        """
+        The configured name a request's model resolves to: a name (any case),
+        None for one of the configured "provider/model" targets, and the
+        default for anything else
+        """
+        name = self._by_lower.get((model or "").lower())
+        if name is not None:
+            return name
+        if model in self._configured:
+            return None
+        if model:
+            self.unknown_models += 1
+            if model not in self._unknown_logged and len(self._unknown_logged) < MAX_UNKNOWN_LOGGED:
+                self._unknown_logged.add(model)
+                logger.warning(f"Unknown model {model!r}, using {self.default_model}")
+        return self.default_model
+
+    def targets(self, model: Optional[str]) -> List[str]:
+        """Targets for a model name or configured "provider/model" target; anything else gets the default's"""
+        name = self._model_name(model)
+        return list(self.models[name]) if name is not None else [model]
+
+    def is_simple(self, message: str, has_attachments: bool = False) -> bool:
+        if has_attachments or not self.simple_targets or not message:
+            return False
+        if COMPLEX_PATTERN.search(message) or message.count("\n") > 2:
+            return False
+        return self.count_tokens(message) <= self.simple_max_tokens
+
+    def within_slo(self, target: str) -> bool:
+        latency = self.policy.latency(target, self.slo_percentile, self.slo_min_samples)
+        return latency is None or latency <= self.latency_slo
+
+    def route(self, model: Optional[str], message: str, has_attachments: bool = False) -> List[str]:
+        """The targets to try for a request, best first"""
+        self.requests += 1
+        name = self._model_name(model)
+        targets = list(self.models[name]) if name is not None else [model]
+        # A model the user picked is respected; only the default gives way to a cheaper one
+        if name == self.default_model and self.is_simple(message, has_attachments):
+            self.simple_routed += 1
+            targets = self.simple_targets + [target for target in targets if target not in self.simple_targets]
+        # Stable: healthy targets keep their configured order
+        ranked = sorted(targets, key=lambda target: (self.policy.breaker(target).state == "open",
+                                                     not self.within_slo(target)))
+        if ranked[0] != targets[0]:
+            self.rerouted += 1
+        return ranked
+
+    def _target_stats(self, target: str) -> Counter:
+        stats = self._stats.get(target)
+        if stats is None:
+            stats = self._stats[target] = Counter()
+        return stats
+
+    def _fall_back(self, targets: List[str], index: int, stats: Counter, error: LLMError) -> bool:
+        """Account for a failed target; whether there is another to try"""
+        stats["failures"] += 1
+        if index == len(targets) - 1:
+            return False
+        stats["fallbacks"] += 1
+        self.fallbacks += 1
+        logger.warning(f"AI request to {targets[index]} failed, falling back to {targets[index + 1]}: {str(error)}")
+        return True
+
+    def _record_success(self, stats: Counter, prompt: str, reply: str, seconds: float):
+        stats["prompt_tokens"] += self.count_tokens(prompt)
+        stats["completion_tokens"] += self.count_tokens(reply)
+        stats["answer_seconds"] += seconds
+
+    async def call(self, targets: List[str], prompt: str,
+                   send: Callable[[str, Optional[float]], Awaitable[str]]) -> str:
+        """
+        Return ``await send(target, deadline)`` from the first target that
+        answers. ``deadline`` is ``answer_deadline`` while a fallback
+        remains, else None (the policy's own deadline).
+        """
+        for index, target in enumerate(targets):
+            stats = self._target_stats(target)
+            stats["requests"] += 1
+            start = time.perf_counter()
+            try:
+                reply = await send(target, self.answer_deadline if index < len(targets) - 1 else None)
+            except LLMError as e:
+                if self._fall_back(targets, index, stats, e):
+                    continue
+                raise
+            self._record_success(stats, prompt, reply, time.perf_counter() - start)
+            return reply
+
+    async def stream(self, targets: List[str], prompt: str,
+                     open_stream: Callable[[str, Optional[float]], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        Like ``call`` for a stream, with the latency SLO as the deadline for
+        its first chunk; a target that fails after that cannot be replaced
+        """
+        for index, target in enumerate(targets):
+            stats = self._target_stats(target)
+            stats["requests"] += 1
+            start = time.perf_counter()
+            chunks = []
+            replies = open_stream(target, self.latency_slo if index < len(targets) - 1 else None)
+            try:
+                async for chunk in replies:
+                    chunks.append(chunk)
+                    yield chunk
+            except LLMError as e:
+                if not chunks and self._fall_back(targets, index, stats, e):
+                    continue
+                if chunks:
+                    stats["failures"] += 1
+                raise
+            finally:
+                close = getattr(replies, "aclose", None)
+                if close is not None:
+                    await close()
+            self._record_success(stats, prompt, "".join(chunks), time.perf_counter() - start)
+            return
+
+    def _target_metrics(self, target: str, stats: Counter) -> dict:
+        def milliseconds(seconds: Optional[float]) -> Optional[float]:
+            return round(seconds * 1000, 1) if seconds is not None else None
+
+        successes = stats["requests"] - stats["failures"]
+        answer_seconds = stats["answer_seconds"]
+        return {
+            "requests": stats["requests"],
+            "failures": stats["failures"],
+            "fallbacks": stats["fallbacks"],
+            "prompt_tokens": stats["prompt_tokens"],
+            "completion_tokens": stats["completion_tokens"],
+            "avg_completion_tokens": round(stats["completion_tokens"] / successes, 1) if successes else 0.0,
+            "tokens_per_second": round(stats["completion_tokens"] / answer_seconds, 1) if answer_seconds else 0.0,
+            "latency_p50_ms": milliseconds(self.policy.latency(target, 50)),
+            "latency_p95_ms": milliseconds(self.policy.latency(target, 95)),
+            "within_slo": self.within_slo(target),
+        }
+
+    def metrics(self) -> dict:
+        return {
+            "default_model": self.default_model,
+            "latency_slo_ms": round(self.latency_slo * 1000),
+            "answer_deadline_ms": round(self.answer_deadline * 1000),
+            "requests": self.requests,
+            "simple_routed": self.simple_routed,
+            "rerouted": self.rerouted,
+            "fallbacks": self.fallbacks,
+            "unknown_models": self.unknown_models,
+            "targets": {target: self._target_metrics(target, stats) for target, stats in self._stats.items()},
+        }
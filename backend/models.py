@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List, Literal
+from typing import Any, Optional, List, Literal
 from datetime import datetime
 import uuid
 
@@ -20,6 +20,10 @@ class SessionCreate(BaseModel):
     model: str = "GPT-5.2"
 
 
+class SessionBulkDelete(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=1000)
+
+
 class Message(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     sessionId: str
@@ -38,6 +42,7 @@ class MessageCreate(BaseModel):
     messageType: Optional[str] = "text"
     imageData: Optional[str] = None  # base64 encoded image
     audioData: Optional[str] = None  # base64 encoded audio
+    bypassCache: bool = False  # skip the response cache for this request
 
 
 class InputHistory(BaseModel):
@@ -50,3 +55,37 @@ class InputHistory(BaseModel):
 class InputHistoryCreate(BaseModel):
     sessionId: str
     input: str
+
+
+class SearchResult(BaseModel):
+    id: str
+    sessionId: str
+    sessionTitle: str
+    kind: Literal["user", "assistant", "input"]
+    timestamp: datetime
+    snippet: str
+    score: float
+
+
+class TranscriptionCreate(BaseModel):
+    audioData: str  # base64 encoded audio or a data URL
+
+
+class Transcript(BaseModel):
+    text: str
+    language: Optional[str] = None
+    duration: float  # seconds of audio
+    hash: str  # SHA-256 of the audio, as in /api/blobs
+    cached: bool = False
+
+
+class Job(BaseModel):
+    id: str
+    kind: str
+    status: Literal["queued", "running", "done", "failed"]
+    attempts: int
+    maxAttempts: int
+    lastError: Optional[str] = None
+    result: Optional[Any] = None  # what the job produced, once done
+    createdAt: datetime
+    updatedAt: datetime
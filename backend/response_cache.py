@@ -0,0 +1,157 @@
+import sqlite3
+import asyncio
+import hashlib
+import re
+import threading
+import time
+import logging
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s?.!]+$")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Canonical form of a prompt so trivially different phrasings share an entry"""
+    return _TRAILING_PUNCTUATION.sub("", _WHITESPACE.sub(" ", prompt.strip().lower()))
+
+
+class ResponseCache:
+    """
+    SQLite-backed cache of LLM responses keyed on normalised prompt, model and
+    system message. The prompt is the one the model receives, conversation
+    context included, so a follow-up such as "and in Java?" only gets an
+    answer given after the same conversation. Entries expire after ``ttl``
+    seconds and the least recently used ones are evicted once
+    ``max_entries`` is exceeded.
+    """
+
+    def __init__(self, db_path: Path, enabled: bool = False,
+                 max_entries: int = 1000, ttl: float = 7 * 24 * 3600):
+        self.db_path = db_path
+        self.enabled = enabled
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        # Rows in the table, counted when it is opened and kept up to date
+        # after, so metrics never touch the database from the event loop
+        self._entries = 0
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Caller holds the lock
+        if self._conn is None:
+            conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    prompt TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    createdAt REAL NOT NULL,
+                    lastAccess REAL NOT NULL,
+                    hits INTEGER DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_last_access ON response_cache (lastAccess)")
+            conn.commit()
+            self._entries = conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def open(self):
+        """Open the cache ahead of the first lookup; blocking, so run it off the event loop"""
+        if self.enabled:
+            with self._lock:
+                self._connection()
+
+    @staticmethod
+    def make_key(prompt: str, model: str, system_message: str) -> str:
+        raw = "\x1f".join([normalize_prompt(prompt), model.lower(), system_message])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _get_sync(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT response, createdAt FROM response_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            response, created_at = row
+            if now - created_at > self.ttl:
+                conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                conn.commit()
+                self._entries -= 1
+                self.expirations += 1
+                self.misses += 1
+                return None
+            conn.execute("UPDATE response_cache SET lastAccess = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+            return response
+
+    def _put_sync(self, key: str, prompt: str, model: str, response: str):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            replaced = conn.execute("SELECT 1 FROM response_cache WHERE key = ?", (key,)).fetchone() is not None
+            conn.execute("""
+                INSERT OR REPLACE INTO response_cache (key, model, prompt, response, createdAt, lastAccess, hits)
+                VALUES (?, ?, ?, ?, ?, ?, 0)
+            """, (key, model, normalize_prompt(prompt), response, now, now))
+            # Evict least recently used entries beyond the size bound
+            cursor = conn.execute("""
+                DELETE FROM response_cache WHERE key IN (
+                    SELECT key FROM response_cache ORDER BY lastAccess DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            conn.commit()
+            self._entries += (0 if replaced else 1) - cursor.rowcount
+            self.stores += 1
+            self.evictions += cursor.rowcount
+
+    async def get(self, prompt: str, model: str, system_message: str) -> Optional[str]:
+        """Return a cached response, or None on a miss"""
+        return await asyncio.to_thread(self._get_sync, self.make_key(prompt, model, system_message))
+
+    async def put(self, prompt: str, model: str, system_message: str, response: str):
+        await asyncio.to_thread(self._put_sync, self.make_key(prompt, model, system_message), prompt, model, response)
+
+    def record_bypass(self):
+        self.bypasses += 1
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": self._entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
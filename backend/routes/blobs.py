@@ -0,0 +1,87 @@
+from fastapi import APIRouter, HTTPException, Request, Response
+from typing import Optional, Tuple
+import asyncio
+import logging
+import re
+from blob_store import blob_store
+from database import BlobDB
+from etags import make_etag, etag_matches, etag_headers, not_modified
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# The content type comes from the client's data URL, so only plain image
+# and audio types are served as such (SVG can carry script); anything else
+# is sent as opaque bytes and, with nosniff, never rendered as a page
+_SERVABLE_TYPE_RE = re.compile(r"^(image/(png|jpeg|gif|webp|avif|bmp)|audio/[\w.+-]+)$")
+NOSNIFF = {"X-Content-Type-Options": "nosniff"}
+
+
+def _media_type(content_type: str) -> str:
+    return content_type if _SERVABLE_TYPE_RE.match(content_type) else "application/octet-stream"
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single ``bytes=`` range into inclusive (start, end).
+    Returns None for an unsatisfiable or unsupported range.
+    """
+    if not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text == "":
+            # Suffix range: the last N bytes
+            length = int(end_text)
+            if length <= 0:
+                return None
+            return max(size - length, 0), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+@router.get("/blobs/{blob_hash}")
+async def get_blob(blob_hash: str, request: Request):
+    """Get a stored image/audio payload by content hash, with range and ETag support"""
+    try:
+        blob = await BlobDB.get(blob_hash)
+        if not blob or not blob_store.exists(blob_hash):
+            raise HTTPException(status_code=404, detail="Blob not found")
+
+        size = blob["size"]
+        # Blobs are immutable, so the content hash is a perfect validator
+        etag = make_etag(blob_hash)
+        if etag_matches(request, etag):
+            response = not_modified(etag, IMMUTABLE)
+            response.headers.update(NOSNIFF)
+            return response
+        headers = etag_headers(etag, IMMUTABLE, {"Accept-Ranges": "bytes", **NOSNIFF})
+        media_type = _media_type(blob["contentType"])
+
+        range_header = request.headers.get("range")
+        if range_header:
+            byte_range = _parse_range(range_header, size)
+            if byte_range is None:
+                return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+            start, end = byte_range
+            data = await asyncio.to_thread(blob_store.read, blob_hash, start, end)
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            return Response(content=data, status_code=206, media_type=media_type, headers=headers)
+
+        data = await asyncio.to_thread(blob_store.read, blob_hash)
+        return Response(content=data, media_type=media_type, headers=headers)
+    except HTTPException:
+        raise
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Blob not found")
+    except Exception as e:
+        logger.error(f"Error fetching blob: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch blob: {str(e)}")
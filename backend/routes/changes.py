@@ -0,0 +1,26 @@
+from fastapi import APIRouter, HTTPException, Query
+import logging
+from database import ChangesDB
+from json_rows import JSONEnvelopeResponse
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get("/changes")
+async def get_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(200, ge=1, le=1000),
+):
+    """
+    Change feed over sessions and input history after ``since`` (0 for
+    everything). Returns {changes, cursor, hasMore}; pass ``cursor`` back as
+    ``since`` to receive only what changed in between.
+    """
+    try:
+        feed = await ChangesDB.get_changes(since, limit)
+        return JSONEnvelopeResponse("changes", feed["items"], {"cursor": feed["cursor"], "hasMore": feed["hasMore"]})
+    except Exception as e:
+        logger.error(f"Error fetching changes: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch changes: {str(e)}")
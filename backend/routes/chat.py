@@ -1,76 +1,494 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Path, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from models import Message, MessageCreate
-from typing import List
+from typing import Awaitable, List, Optional, Tuple
+import asyncio
+import base64
+import json
 import logging
+import os
+import uuid
+from admission import SingleFlight
 from ai_service import ai_service
+from llm_policy import LLMError
+from blob_store import blob_store, blob_url, BLOB_URL_PREFIX
 from datetime import datetime
-from database import MessageDB
+from database import MessageDB, SessionDB, BlobDB, ChangesDB, IdempotencyDB, JobDB
+from job_queue import job_queue, PermanentJobError
+from blob_gc import collect_blobs_soon
+from json_rows import JSONRowsResponse, JSONEnvelopeResponse
+from etags import make_etag, etag_matches, etag_headers, not_modified
+from write_behind import write_queue, WriteOp
+from event_hub import event_hub, publish_session_updated
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Requests with the same Idempotency-Key share one execution while it is in
+# flight; afterwards the stored exchange is replayed for this long
+idempotent_requests = SingleFlight()
+IDEMPOTENCY_KEY_TTL = float(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', '24')) * 3600
+IDEMPOTENCY_KEY_REUSED = "Idempotency-Key was already used for a different session"
+
+Exchange = Tuple[Message, Message]
+
+
+@job_queue.handler("session.stats")
+async def refresh_session_stats(payload: dict):
+    """Recount a session's questions and push the updated session"""
+    await MessageDB.refresh_question_count(payload['sessionId'])
+    await publish_session_updated(payload['sessionId'])
+
+
+def _session_stats_op(session_id: str) -> WriteOp:
+    # One pending recount per session however many messages arrive meanwhile
+    return job_queue.job_op("session.stats", {"sessionId": session_id}, key=f"session.stats:{session_id}",
+                            replace=True)
+
+
+def _refresh_session_stats_later(session_id: str):
+    """Queue the session's stats recount behind the writes submitted so far, without waiting for it"""
+    write_queue.submit_nowait(_session_stats_op(session_id)).add_done_callback(lambda _: job_queue.notify())
+
+
+@job_queue.handler("idempotency.prune", priority=-10)
+async def prune_idempotency_keys(payload: dict) -> dict:
+    return {"deleted": await IdempotencyDB.prune(IDEMPOTENCY_KEY_TTL)}
+
+job_queue.every("idempotency.prune", 3600)
+
+
+async def _prepare_user_message(message_input: MessageCreate) -> Tuple[Message, List[WriteOp]]:
+    """
+    Build the user's message and the writes that persist it. Media payloads
+    go to the blob store so only references end up in the messages table.
+    """
+    ops: List[WriteOp] = []
+    
+    async def store_media(data: Optional[str]) -> Optional[str]:
+        if not data:
+            return None
+        blob_hash, content_type, size = await asyncio.to_thread(blob_store.put_data_url, data)
+        ops.append((BlobDB.create, (blob_hash, content_type, size)))
+        return blob_url(blob_hash)
+    
+    user_message = Message(
+        sessionId=message_input.sessionId,
+        type="user",
+        content=message_input.message,
+        messageType=message_input.messageType or "text",
+        imageUrl=await store_media(message_input.imageData),
+        audioUrl=await store_media(message_input.audioData)
+    )
+    ops.append((MessageDB.create, (user_message.dict(),)))
+    return user_message, ops
+
+
+async def _save_exchange(session_id: str, user_message: Message, user_ops: List[WriteOp], ai_message: Message,
+                         idempotency_key: Optional[str] = None):
+    """
+    Persist the user message, the reply and the idempotency key as one
+    group-committed unit, then push the messages to WebSocket subscribers. A
+    key that is already stored fails the whole unit. The job that updates the
+    session's stats is written behind it: it joins the same commit when it
+    can, but the response does not wait for it.
+    """
+    ops = [
+        *user_ops,
+        (MessageDB.create, (ai_message.dict(),))
+    ]
+    if idempotency_key:
+        ops.append((IdempotencyDB.create, (idempotency_key, session_id, user_message.id, ai_message.id)))
+    saved = write_queue.submit(*ops)
+    _refresh_session_stats_later(session_id)
+    await saved
+    logger.info(f"Saved chat exchange for session {session_id}")
+    for message in (user_message, ai_message):
+        event_hub.publish("message.created", jsonable_encoder(message), session_id=session_id)
+
+
+async def _stored_exchange(idempotency_key: str) -> Optional[Exchange]:
+    exchange = await IdempotencyDB.get_exchange(idempotency_key)
+    if exchange is None:
+        return None
+    logger.info(f"Replaying chat exchange for idempotency key {idempotency_key}")
+    return Message(**exchange['user']), Message(**exchange['reply'])
+
+
+async def _require_session(session_id: str):
+    """404 for a missing or deleted session, before anything is asked of the AI"""
+    if await SessionDB.get_version(session_id) is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+
+def _check_session(exchange: Exchange, session_id: str) -> Exchange:
+    if exchange[0].sessionId != session_id:
+        raise HTTPException(status_code=422, detail=IDEMPOTENCY_KEY_REUSED)
+    return exchange
+
+
+def _llm_failure(e: LLMError) -> HTTPException:
+    """429 when at capacity, 503 while the provider's circuit is open, 504 on deadline, otherwise 502"""
+    logger.error(f"AI request failed: {str(e)}")
+    headers = {"Retry-After": str(e.retry_after)} if e.retry_after else None
+    return HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+
+
+async def _exchange(message_input: MessageCreate, idempotency_key: Optional[str] = None) -> Exchange:
+    """Ask the AI and save the user message with its reply"""
+    user_message, user_ops = await _prepare_user_message(message_input)
+    
+    # Get AI response
+    ai_response_text = await ai_service.get_response(
+        session_id=message_input.sessionId,
+        user_message=message_input.message,
+        model=message_input.model,
+        image_data=message_input.imageData,
+        audio_data=message_input.audioData,
+        bypass_cache=message_input.bypassCache
+    )
+    
+    # Save both messages and update session question count together
+    ai_message = Message(
+        sessionId=message_input.sessionId,
+        type="assistant",
+        content=ai_response_text,
+        messageType="text"
+    )
+    await _save_exchange(message_input.sessionId, user_message, user_ops, ai_message, idempotency_key)
+    return user_message, ai_message
+
+
+async def _media_data(url: Optional[str]) -> Optional[str]:
+    """The data URL of media stored with a message, for asking the AI about it later"""
+    if not url:
+        return None
+    blob_hash = url[len(BLOB_URL_PREFIX):]
+    blob = await BlobDB.get(blob_hash)
+    if blob is None or not blob_store.exists(blob_hash):
+        raise PermanentJobError(f"Media {blob_hash} is no longer stored")
+    raw = await asyncio.to_thread(blob_store.read, blob_hash)
+    return f"data:{blob['contentType']};base64,{base64.b64encode(raw).decode()}"
+
+
+@job_queue.handler("chat.reply", priority=10)
+async def reply_to_message(payload: dict) -> dict:
+    """Ask the AI about a queued user message and save the reply"""
+    session_id = payload['sessionId']
+    result = {"messageId": payload['messageId'], "replyId": payload['replyId']}
+    # A previous attempt may have saved the reply before it was interrupted
+    if await MessageDB.exists(payload['replyId']):
+        return result
+    if await SessionDB.get_version(session_id) is None:
+        raise PermanentJobError(f"Session {session_id} no longer exists")
+    
+    ai_response_text = await ai_service.get_response(
+        session_id=session_id,
+        user_message=payload['message'],
+        model=payload['model'],
+        image_data=await _media_data(payload['imageUrl']),
+        audio_data=await _media_data(payload['audioUrl']),
+        bypass_cache=payload['bypassCache']
+    )
+    ai_message = Message(
+        id=payload['replyId'],
+        sessionId=session_id,
+        type="assistant",
+        content=ai_response_text,
+        messageType="text"
+    )
+    try:
+        await write_queue.submit((MessageDB.create, (ai_message.dict(),)))
+    except Exception:
+        # Deleted while the AI was answering: the reply has nowhere to go
+        if await SessionDB.get_version(session_id) is None:
+            raise PermanentJobError(f"Session {session_id} no longer exists")
+        raise
+    _refresh_session_stats_later(session_id)
+    logger.info(f"Saved queued reply for session {session_id}")
+    event_hub.publish("message.created", jsonable_encoder(ai_message), session_id=session_id)
+    return result
+
+
+async def _queue_exchange(message_input: MessageCreate, key: Optional[str]) -> dict:
+    """Save the user message and queue the job that replies to it; returns the job"""
+    if key:
+        job = await JobDB.get_by_key(key)
+        if job is not None:
+            return job
+    
+    user_message, user_ops = await _prepare_user_message(message_input)
+    payload = {
+        "sessionId": message_input.sessionId,
+        "messageId": user_message.id,
+        "replyId": str(uuid.uuid4()),
+        "message": message_input.message,
+        "model": message_input.model,
+        "imageUrl": user_message.imageUrl,
+        "audioUrl": user_message.audioUrl,
+        "bypassCache": message_input.bypassCache,
+    }
+    results = await write_queue.submit(*user_ops, job_queue.job_op("chat.reply", payload, key=key))
+    job_queue.notify()
+    event_hub.publish("message.created", jsonable_encoder(user_message), session_id=message_input.sessionId)
+    return await JobDB.get(results[-1])
+
+
+async def _accept_message(message_input: MessageCreate, idempotency_key: Optional[str]) -> ORJSONResponse:
+    """
+    202 for a message whose reply is left to the job queue, with the ids of
+    the job, the user message and the reply to come
+    """
+    if idempotency_key:
+        key = f"chat.reply:{idempotency_key}"
+        job = await idempotent_requests.do(("chat.reply", idempotency_key), lambda: _queue_exchange(message_input, key))
+    else:
+        job = await _queue_exchange(message_input, None)
+    payload = json.loads(job['payload'])
+    if payload['sessionId'] != message_input.sessionId:
+        raise HTTPException(status_code=422, detail=IDEMPOTENCY_KEY_REUSED)
+    return ORJSONResponse(
+        status_code=202,
+        content={
+            "jobId": job['id'],
+            "status": job['status'],
+            "messageId": payload['messageId'],
+            "replyId": payload['replyId'],
+        },
+        headers={"Location": f"/api/jobs/{job['id']}", "Preference-Applied": "respond-async"},
+    )
+
 
 @router.post("/chat", response_model=Message)
-async def send_message(message_input: MessageCreate):
-    """Send a message to AI and get response"""
+async def send_message(message_input: MessageCreate, idempotency_key: Optional[str] = Header(None, max_length=255),
+                       prefer: Optional[str] = Header(None)):
+    """
+    Send a message to AI and get response. Requests repeating an
+    Idempotency-Key get the first request's reply, without asking the AI
+    or storing the messages again.
+    
+    With ``Prefer: respond-async`` the user message is saved and 202 is
+    returned at once; the reply is produced by a background job (see
+    /api/jobs/{id}) and pushed as a ``message.created`` event.
+    """
     try:
-        # Save user message
-        user_message = Message(
-            sessionId=message_input.sessionId,
-            type="user",
-            content=message_input.message,
-            messageType=message_input.messageType or "text",
-            imageUrl=message_input.imageData if message_input.imageData else None
-        )
-        await MessageDB.create(user_message.dict())
-        logger.info(f"Saved user message for session {message_input.sessionId}")
+        await _require_session(message_input.sessionId)
+        if prefer and "respond-async" in prefer.lower():
+            return await _accept_message(message_input, idempotency_key)
+        if not idempotency_key:
+            return (await _exchange(message_input))[1]
         
-        # Get AI response
-        ai_response_text = await ai_service.get_response(
+        async def once() -> Exchange:
+            return await _stored_exchange(idempotency_key) or await _exchange(message_input, idempotency_key)
+        
+        exchange = await idempotent_requests.do(idempotency_key, once)
+        return _check_session(exchange, message_input.sessionId)[1]
+        
+    except HTTPException:
+        raise
+    except LLMError as e:
+        raise _llm_failure(e)
+    except Exception as e:
+        logger.error(f"Error in chat: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to process message: {str(e)}")
+
+
+def _sse(event: str, data) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+async def _stream_exchange(message_input: MessageCreate, user_message: Message, user_ops: List[WriteOp],
+                           chunks: asyncio.Queue, idempotency_key: Optional[str]) -> Exchange:
+    """
+    Stream the reply into ``chunks`` (None when finished) and save the
+    exchange. Runs as its own task, so the reply is still saved, and can be
+    replayed by a retry, if the client disconnects mid-stream.
+    """
+    # The reply's id is fixed up front so pushed tokens can be matched to it
+    reply_id = str(uuid.uuid4())
+    parts = []
+    try:
+        async for chunk in ai_service.stream_response(
             session_id=message_input.sessionId,
             user_message=message_input.message,
             model=message_input.model,
             image_data=message_input.imageData,
-            audio_data=message_input.audioData
-        )
+            audio_data=message_input.audioData,
+            bypass_cache=message_input.bypassCache
+        ):
+            parts.append(chunk)
+            event_hub.publish(
+                "message.token",
+                {"sessionId": message_input.sessionId, "messageId": reply_id, "token": chunk},
+                session_id=message_input.sessionId,
+                droppable=True
+            )
+            chunks.put_nowait(chunk)
         
-        # Save AI response
+        # Persist the assembled reply together with the user message
         ai_message = Message(
+            id=reply_id,
             sessionId=message_input.sessionId,
             type="assistant",
-            content=ai_response_text,
+            content="".join(parts),
             messageType="text"
         )
-        await MessageDB.create(ai_message.dict())
-        logger.info(f"Saved AI response for session {message_input.sessionId}")
-        
-        # Update session question count
-        await MessageDB.increment_question_count(message_input.sessionId)
+        await _save_exchange(message_input.sessionId, user_message, user_ops, ai_message, idempotency_key)
+        return user_message, ai_message
+    finally:
+        chunks.put_nowait(None)
+
+
+async def _replayed_events(exchange: Awaitable[Exchange], session_id: str):
+    """The events of an exchange another request produced, with the reply as a single token"""
+    try:
+        user_message, ai_message = _check_session(await exchange, session_id)
+    except HTTPException as e:
+        yield _sse("error", {"detail": e.detail})
+        return
+    except Exception as e:
+        logger.error(f"Error in chat stream: {str(e)}")
+        yield _sse("error", {"detail": f"Failed to process message: {str(e)}"})
+        return
+    yield _sse("message", user_message)
+    yield _sse("token", {"token": ai_message.content})
+    yield _sse("done", ai_message)
+
+
+async def _completed(exchange: Exchange) -> Exchange:
+    return exchange
+
+
+@router.post("/chat/stream")
+async def stream_message(message_input: MessageCreate, idempotency_key: Optional[str] = Header(None, max_length=255)):
+    """
+    Send a message to AI and stream the response as server-sent events:
+    ``message`` (the user message), ``token`` per chunk, then ``done`` once
+    both messages are saved, or ``error``. Repeating an Idempotency-Key
+    replays the first request's exchange, waiting for it if still running.
+    """
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    try:
+        await _require_session(message_input.sessionId)
+        if idempotency_key:
+            flight = idempotent_requests.get(idempotency_key)
+            stored = await _stored_exchange(idempotency_key) if flight is None else None
+            if stored:
+                return StreamingResponse(_replayed_events(_completed(stored), message_input.sessionId),
+                                         media_type="text/event-stream", headers=headers)
         
-        return ai_message
+        ai_service.limiter.check()
+        user_message, user_ops = await _prepare_user_message(message_input)
         
+        # Another request with this key may have started while the media was stored
+        flight = idempotent_requests.get(idempotency_key) if idempotency_key else None
+        if flight is not None:
+            return StreamingResponse(_replayed_events(idempotent_requests.follow(flight), message_input.sessionId),
+                                     media_type="text/event-stream", headers=headers)
+    except HTTPException:
+        raise
+    except LLMError as e:
+        raise _llm_failure(e)
     except Exception as e:
-        logger.error(f"Error in chat: {str(e)}")
+        logger.error(f"Error in chat stream: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to process message: {str(e)}")
+    
+    chunks: asyncio.Queue = asyncio.Queue()
+    work = _stream_exchange(message_input, user_message, user_ops, chunks, idempotency_key)
+    if idempotency_key:
+        task = idempotent_requests.start(idempotency_key, work)
+    else:
+        task = asyncio.get_running_loop().create_task(work)
+        # Failures reach the client as an error event; nothing else waits on the task
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+    
+    async def events():
+        yield _sse("message", user_message)
+        try:
+            while (chunk := await chunks.get()) is not None:
+                yield _sse("token", {"token": chunk})
+            _, ai_message = await asyncio.shield(task)
+            yield _sse("done", ai_message)
+        except LLMError as e:
+            logger.error(f"AI request failed: {str(e)}")
+            yield _sse("error", {"detail": str(e), "status": e.status_code})
+        except Exception as e:
+            logger.error(f"Error in chat stream: {str(e)}")
+            yield _sse("error", {"detail": f"Failed to process message: {str(e)}"})
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
 
 
 @router.get("/chat/{session_id}", response_model=List[Message])
-async def get_messages(session_id: str):
-    """Get all messages for a session"""
+async def get_messages(
+    session_id: str,
+    request: Request,
+    limit: int = Query(100, ge=1, le=500),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+):
+    """Get a session's messages oldest-first; defaults to the most recent page (see X-Next-Cursor)"""
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'after', not both")
     try:
-        messages = await MessageDB.get_by_session(session_id)
-        return [Message(**msg) for msg in messages]
+        # The session's version covers its messages, so an unchanged conversation
+        # is answered without touching the messages table
+        version = await SessionDB.get_version(session_id)
+        etag = make_etag(session_id, version) if version is not None else None
+        if etag and etag_matches(request, etag):
+            return not_modified(etag)
+        messages, next_cursor = await MessageDB.get_page(session_id, limit, before=before, after=after, as_json=True)
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+        if etag:
+            headers = etag_headers(etag, extra=headers)
+        return JSONRowsResponse((msg["json"] for msg in messages), headers=headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching messages: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch messages: {str(e)}")
 
 
+@router.get("/chat/{session_id}/since/{cursor}")
+async def get_messages_since(
+    session_id: str,
+    cursor: int = Path(..., ge=0),
+    limit: int = Query(500, ge=1, le=1000),
+):
+    """
+    Get the messages added or changed after ``cursor`` (0 for all of them).
+    Returns {messages, cursor, reset, hasMore}: pass ``cursor`` back next
+    time; ``reset`` means messages were deleted and the local copy should be
+    replaced by this listing.
+    """
+    try:
+        delta = await ChangesDB.get_session_messages_since(session_id, cursor, limit)
+        if delta is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        return JSONEnvelopeResponse("messages", delta["items"], {
+            "cursor": delta["cursor"],
+            "reset": delta["reset"],
+            "hasMore": delta["hasMore"],
+        })
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching message changes: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch messages: {str(e)}")
+
+
 @router.delete("/chat/{session_id}")
 async def delete_messages(session_id: str):
     """Delete all messages for a session"""
     try:
         deleted_count = await MessageDB.delete_by_session(session_id)
+        ai_service.context_builder.invalidate(session_id)
+        await publish_session_updated(session_id)
+        if deleted_count:
+            await collect_blobs_soon()
         logger.info(f"Deleted {deleted_count} messages for session {session_id}")
         return {"success": True, "deleted_count": deleted_count}
     except Exception as e:
@@ -0,0 +1,68 @@
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+import asyncio
+import logging
+import os
+import orjson
+from event_hub import event_hub, RESYNC, CLOSE
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# A client that cannot take a single frame for this long is considered gone
+SEND_TIMEOUT = float(os.environ.get('WS_SEND_TIMEOUT', '10'))
+
+
+@router.websocket("/ws")
+async def events(websocket: WebSocket):
+    """
+    Push channel for message.created, message.token, session.updated,
+    session.deleted and resync events. Message events are limited to the
+    sessions given as ``session_id`` query parameters (all sessions if none);
+    the client can change that by sending {"subscribe": id} or
+    {"unsubscribe": id}.
+    """
+    await websocket.accept()
+    subscriber = event_hub.subscribe(websocket.query_params.getlist("session_id"))
+
+    async def send():
+        while True:
+            payload = await subscriber.queue.get()
+            if payload is CLOSE:
+                await websocket.close(code=1001)
+                return
+            if payload is RESYNC:
+                subscriber.lagging = False
+            await asyncio.wait_for(websocket.send_text(payload), SEND_TIMEOUT)
+
+    async def receive():
+        while True:
+            try:
+                command = orjson.loads(await websocket.receive_text())
+            except orjson.JSONDecodeError:
+                continue
+            if not isinstance(command, dict):
+                continue
+            if isinstance(command.get("subscribe"), str):
+                if subscriber.sessions is None:
+                    subscriber.sessions = set()
+                subscriber.sessions.add(command["subscribe"])
+            if isinstance(command.get("unsubscribe"), str) and subscriber.sessions is not None:
+                subscriber.sessions.discard(command["unsubscribe"])
+
+    tasks = [asyncio.create_task(send()), asyncio.create_task(receive())]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            error = task.exception()
+            if isinstance(error, asyncio.TimeoutError):
+                logger.warning("Closing WebSocket client that stopped reading")
+                await websocket.close(code=1008)
+            elif error is not None and not isinstance(error, WebSocketDisconnect):
+                logger.error(f"WebSocket error: {str(error)}")
+    finally:
+        # Unsubscribe before awaiting anything: a cancelled handler may not get further
+        event_hub.unsubscribe(subscriber)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
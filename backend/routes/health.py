@@ -0,0 +1,40 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import ORJSONResponse
+import logging
+from ai_service import ai_service
+from database import ping
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get("/health/live")
+async def liveness():
+    """The process is up and serving HTTP; says nothing about its dependencies"""
+    return {"status": "ok"}
+
+
+@router.get("/health/ready")
+async def readiness(request: Request):
+    """
+    Startup has finished and the database answers queries: 200 when the app
+    can take traffic, 503 while it is starting, shutting down or cannot reach
+    the database. ``llm_sdk`` reports the background SDK import but does not
+    gate readiness, since the app is usable without AI.
+    """
+    state = request.app.state
+    body = {
+        "status": state.status,
+        "schema_version": state.schema_version,
+        "llm_sdk": ai_service.sdk_state,
+    }
+    if state.status != "ready":
+        return ORJSONResponse(body, status_code=503)
+    try:
+        await ping()
+    except Exception as e:
+        logger.error(f"Readiness check failed: {str(e)}")
+        body.update(status="unavailable", detail=f"Database unavailable: {str(e)}")
+        return ORJSONResponse(body, status_code=503)
+    return body
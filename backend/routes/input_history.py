@@ -1,8 +1,11 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from models import InputHistory, InputHistoryCreate
 from typing import List
 import logging
 from database import InputHistoryDB
+from json_rows import JSONRowsResponse
+from write_behind import write_queue
+from input_suggest import input_suggestions
 
 logger = logging.getLogger(__name__)
 
@@ -14,8 +17,10 @@ async def save_input(input_data: InputHistoryCreate):
     """Save user input to history"""
     try:
         input_history = InputHistory(**input_data.dict())
-        await InputHistoryDB.create(input_history.dict())
-        logger.info(f"Saved input to history for session {input_data.sessionId}")
+        # Written behind: committed with the next batch, reads flush it first
+        write_queue.submit_nowait((InputHistoryDB.create, (input_history.dict(),)))
+        input_suggestions.add(input_history.input, input_history.timestamp.timestamp())
+        logger.info(f"Saved input history for session {input_data.sessionId}")
         return {"success": True}
     except Exception as e:
         logger.error(f"Error saving input history: {str(e)}")
@@ -26,6 +31,7 @@ async def save_input(input_data: InputHistoryCreate):
 async def get_input_history():
     """Get all input history"""
     try:
+        await write_queue.flush()
         history = await InputHistoryDB.get_all()
         return history
     except Exception as e:
@@ -33,12 +39,27 @@ async def get_input_history():
         raise HTTPException(status_code=500, detail=f"Failed to fetch history: {str(e)}")
 
 
+@router.get("/input-history/suggest", response_model=List[str])
+async def suggest_inputs(
+    prefix: str = Query(..., min_length=1, max_length=500),
+    limit: int = Query(8, ge=1, le=20),
+):
+    """Autocomplete previous inputs starting with ``prefix``, most frequent and recent first"""
+    try:
+        await input_suggestions.ensure_built()
+        return input_suggestions.suggest(prefix, limit)
+    except Exception as e:
+        logger.error(f"Error suggesting inputs: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to suggest inputs: {str(e)}")
+
+
 @router.get("/input-history/{session_id}", response_model=List[InputHistory])
 async def get_session_input_history(session_id: str):
     """Get input history for a specific session"""
     try:
-        history = await InputHistoryDB.get_by_session(session_id)
-        return [InputHistory(**item) for item in history]
+        await write_queue.flush()
+        history = await InputHistoryDB.get_by_session_json(session_id)
+        return JSONRowsResponse(history)
     except Exception as e:
         logger.error(f"Error fetching session input history: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch history: {str(e)}")
@@ -0,0 +1,23 @@
+from fastapi import APIRouter, HTTPException
+import json
+import logging
+from models import Job
+from database import JobDB
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get("/jobs/{job_id}", response_model=Job)
+async def get_job(job_id: str):
+    """Get the status of a background job, e.g. the reply to a message sent with ``Prefer: respond-async``"""
+    try:
+        job = await JobDB.get(job_id)
+    except Exception as e:
+        logger.error(f"Error fetching job: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch job: {str(e)}")
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return Job(**job)
@@ -0,0 +1,39 @@
+from fastapi import APIRouter
+import logging
+from database import pool_metrics
+from ai_service import ai_service
+from write_behind import write_queue
+from session_purge import session_purger
+from search_indexer import search_indexer
+from input_suggest import input_suggestions
+from event_hub import event_hub
+from job_queue import job_queue
+from routes.chat import idempotent_requests
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """Get runtime metrics for backend resources"""
+    return {
+        "db_pool": pool_metrics(),
+        "response_cache": ai_service.response_cache.metrics(),
+        "image_preprocessing": ai_service.image_preprocessor.metrics(),
+        "speech": ai_service.transcriber.metrics(),
+        "context": ai_service.context_builder.metrics(),
+        "write_behind": write_queue.metrics(),
+        "session_purge": session_purger.metrics(),
+        "search_index": search_indexer.metrics(),
+        "jobs": job_queue.metrics(),
+        "input_suggestions": input_suggestions.metrics(),
+        "websocket": event_hub.metrics(),
+        "llm_admission": ai_service.limiter.metrics(),
+        "llm_policy": ai_service.policy.metrics(),
+        "llm_routing": ai_service.router.metrics(),
+        "llm_coalescing": ai_service.flights.metrics(),
+        "llm_transport": ai_service.transport.metrics(),
+        "idempotent_requests": idempotent_requests.metrics(),
+    }
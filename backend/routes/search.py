@@ -0,0 +1,31 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import ORJSONResponse
+from models import SearchResult
+from typing import List, Literal, Optional
+import logging
+from database import SearchDB
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get("/search", response_model=List[SearchResult])
+async def search(
+    q: str = Query(..., min_length=1, max_length=500),
+    session_id: Optional[str] = None,
+    kind: Optional[List[Literal["user", "assistant", "input"]]] = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+):
+    """Search messages and input history, best matches first (see X-Next-Cursor)"""
+    try:
+        results, next_cursor = await SearchDB.search(q, limit, session_id=session_id, kinds=kind, cursor=cursor)
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+        # Results are built from our own rows; skip re-validating them
+        return ORJSONResponse(results, headers=headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error searching: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to search: {str(e)}")
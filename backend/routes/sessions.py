@@ -1,9 +1,19 @@
-from fastapi import APIRouter, HTTPException
-from models import Session, SessionCreate
-from typing import List
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
+from models import Session, SessionCreate, SessionBulkDelete
+from typing import List, Optional
 from datetime import datetime
 import logging
 from database import SessionDB
+from json_rows import JSONRowsResponse
+from etags import make_etag, etag_matches, etag_headers, not_modified
+from ai_service import ai_service
+from write_behind import write_queue
+from session_purge import session_purger
+from blob_gc import collect_blobs_soon
+from input_suggest import input_suggestions
+from event_hub import event_hub, publish_session_updated
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +26,7 @@ async def create_session(session_input: SessionCreate):
     try:
         session = Session(**session_input.dict())
         await SessionDB.create(session.dict())
+        event_hub.publish("session.updated", jsonable_encoder(session))
         logger.info(f"Created new session: {session.id}")
         return session
     except Exception as e:
@@ -24,24 +35,44 @@ async def create_session(session_input: SessionCreate):
 
 
 @router.get("/sessions", response_model=List[Session])
-async def get_sessions():
-    """Get all sessions"""
+async def get_sessions(
+    request: Request,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+):
+    """Get sessions newest-first, one keyset page at a time (see X-Next-Cursor)"""
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'after', not both")
     try:
-        sessions = await SessionDB.get_all()
-        return [Session(**session) for session in sessions]
+        # Read the version first: a write racing the page read then only costs a refetch
+        etag = make_etag("sessions", await SessionDB.get_list_version())
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        sessions, next_cursor = await SessionDB.get_page(limit, before=before, after=after, as_json=True)
+        headers = etag_headers(etag, extra={"X-Next-Cursor": next_cursor} if next_cursor else None)
+        return JSONRowsResponse((session["json"] for session in sessions), headers=headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error fetching sessions: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch sessions: {str(e)}")
 
 
 @router.get("/sessions/{session_id}", response_model=Session)
-async def get_session(session_id: str):
+async def get_session(session_id: str, request: Request):
     """Get a specific session by ID"""
     try:
+        version = await SessionDB.get_version(session_id)
+        if version is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        etag = make_etag(session_id, version)
+        if etag_matches(request, etag):
+            return not_modified(etag)
         session = await SessionDB.get_by_id(session_id)
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
-        return Session(**session)
+        return ORJSONResponse(jsonable_encoder(Session(**session)), headers=etag_headers(etag))
     except HTTPException:
         raise
     except Exception as e:
@@ -49,12 +80,41 @@ async def get_session(session_id: str):
         raise HTTPException(status_code=500, detail=f"Failed to fetch session: {str(e)}")
 
 
+async def _delete_sessions(session_ids: List[str]):
+    """Delete sessions in one transaction; large ones are purged in the background"""
+    # Land queued writes first so none of them target a session that no longer exists
+    await write_queue.flush()
+    deleted, deferred = await SessionDB.delete_many(session_ids, session_purger.chunk_size)
+    for session_id in deleted + deferred:
+        ai_service.context_builder.invalidate(session_id)
+        event_hub.publish("session.deleted", {"id": session_id})
+    session_purger.schedule(deferred)
+    if deleted or deferred:
+        # Their inputs should no longer be suggested
+        input_suggestions.reset()
+    if deleted:
+        await collect_blobs_soon()
+    return deleted, deferred
+
+
+@router.delete("/sessions")
+async def delete_sessions(request: SessionBulkDelete):
+    """Delete many sessions at once"""
+    try:
+        deleted, deferred = await _delete_sessions(request.ids)
+        logger.info(f"Deleted {len(deleted) + len(deferred)} of {len(request.ids)} sessions")
+        return {"success": True, "deleted": len(deleted) + len(deferred), "purging": len(deferred)}
+    except Exception as e:
+        logger.error(f"Error deleting sessions: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to delete sessions: {str(e)}")
+
+
 @router.delete("/sessions/{session_id}")
 async def delete_session(session_id: str):
     """Delete a session"""
     try:
-        deleted = await SessionDB.delete(session_id)
-        if not deleted:
+        deleted, deferred = await _delete_sessions([session_id])
+        if not deleted and not deferred:
             raise HTTPException(status_code=404, detail="Session not found")
         
         logger.info(f"Deleted session: {session_id}")
@@ -71,6 +131,7 @@ async def update_session_stats(session_id: str, questions_asked: int, duration:
     """Update session statistics"""
     try:
         await SessionDB.update_stats(session_id, questions_asked, duration)
+        await publish_session_updated(session_id)
         return {"success": True}
     except Exception as e:
         logger.error(f"Error updating session stats: {str(e)}")
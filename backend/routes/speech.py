@@ -0,0 +1,111 @@
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+import asyncio
+import binascii
+import logging
+import os
+import orjson
+from models import Transcript, TranscriptionCreate
+from ai_service import ai_service
+from speech import SpeechUnavailable
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Partial transcripts are produced at most this often while audio streams in
+PARTIAL_INTERVAL = float(os.environ.get('STT_PARTIAL_INTERVAL', '1.0'))
+
+
+def _event(event_type: str, data) -> str:
+    return orjson.dumps({"type": event_type, "data": data}).decode()
+
+
+@router.post("/transcribe", response_model=Transcript)
+async def transcribe(request: TranscriptionCreate):
+    """Transcribe a recording on this machine; repeated audio is answered from the cache"""
+    try:
+        return await ai_service.transcriber.transcribe(request.audioData)
+    except SpeechUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except (ValueError, binascii.Error) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid audio: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error transcribing audio: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to transcribe audio: {str(e)}")
+
+
+@router.websocket("/transcribe/stream")
+async def transcribe_stream(websocket: WebSocket):
+    """
+    Streaming transcription. The client sends the recording as binary frames
+    in order (e.g. MediaRecorder chunks) and {"type": "end"} when it stops;
+    the server answers with partial events ({text, committed, duration})
+    while audio arrives, then one final event (a Transcript) and closes.
+    Errors are sent as {"type": "error", "data": {detail}}.
+    """
+    await websocket.accept()
+    transcriber = ai_service.transcriber
+    if not transcriber.available:
+        await websocket.send_text(_event("error", {"detail": "Speech-to-text is not available"}))
+        await websocket.close(code=1011)
+        return
+    stream = transcriber.stream()
+    # Set for new audio and for the end of the recording
+    changed = asyncio.Event()
+    ended = asyncio.Event()
+
+    async def receive():
+        while not ended.is_set():
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes"):
+                stream.feed(message["bytes"])
+                changed.set()
+            elif message.get("text"):
+                try:
+                    command = orjson.loads(message["text"])
+                except orjson.JSONDecodeError:
+                    continue
+                if isinstance(command, dict) and command.get("type") == "end":
+                    ended.set()
+                    changed.set()
+
+    async def transcribe():
+        loop = asyncio.get_running_loop()
+        while True:
+            await changed.wait()
+            if ended.is_set():
+                await websocket.send_text(_event("final", await stream.finish()))
+                return
+            changed.clear()
+            started = loop.time()
+            try:
+                partial = await stream.update()
+            except Exception as e:
+                # A chunk can end mid-frame; the next pass decodes more of it
+                logger.debug(f"Partial transcription failed: {str(e)}")
+            else:
+                await websocket.send_text(_event("partial", partial))
+            try:
+                await asyncio.wait_for(ended.wait(), max(0.0, PARTIAL_INTERVAL - (loop.time() - started)))
+            except asyncio.TimeoutError:
+                pass
+
+    tasks = [asyncio.create_task(receive()), asyncio.create_task(transcribe())]
+    try:
+        # receive() returns at "end" and transcribe() then sends the final transcript
+        await asyncio.gather(*tasks)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    except ValueError as e:
+        await websocket.send_text(_event("error", {"detail": str(e)}))
+        await websocket.close(code=1009)
+    except Exception as e:
+        logger.error(f"Error streaming transcription: {str(e)}")
+        await websocket.send_text(_event("error", {"detail": f"Failed to transcribe audio: {str(e)}"}))
+        await websocket.close(code=1011)
+    finally:
+        for task in tasks:
+            task.cancel()
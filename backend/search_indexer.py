@@ -0,0 +1,64 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+from database import SearchDB
+
+logger = logging.getLogger(__name__)
+
+
+class SearchIndexer:
+    """
+    Builds the full-text index for rows that existed before it was created,
+    one chunk per short write so the app stays responsive on large
+    databases. New rows are indexed by triggers; progress is stored in the
+    database, so an interrupted backfill continues on the next start.
+    """
+
+    def __init__(self, chunk_size: int = 500, pause: float = 0.01):
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.remaining = 0
+        self.indexed = 0
+
+    async def start(self):
+        self.remaining = await SearchDB.backfill_remaining()
+        if self.remaining:
+            logger.info(f"Indexing {self.remaining} existing rows for search")
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        try:
+            while True:
+                indexed = await SearchDB.backfill_chunk(self.chunk_size)
+                if not indexed:
+                    break
+                self.indexed += indexed
+                self.remaining = max(0, self.remaining - indexed)
+                await asyncio.sleep(self.pause)
+            self.remaining = 0
+            logger.info(f"Search index backfill complete ({self.indexed} rows)")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error building search index: {str(e)}")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def metrics(self) -> dict:
+        return {
+            "backfilling": self._task is not None and not self._task.done(),
+            "backfill_remaining": self.remaining,
+            "backfill_indexed": self.indexed,
+        }
+
+
+# Global indexer started with the app
+search_indexer = SearchIndexer(chunk_size=int(os.environ.get('SEARCH_BACKFILL_CHUNK', '500')))
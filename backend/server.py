@@ -1,19 +1,71 @@
-from fastapi import FastAPI, APIRouter
 from dotenv import load_dotenv
-from starlette.middleware.cors import CORSMiddleware
-import os
-import logging
 from pathlib import Path
 
+# Load .env before the backend modules: their singletons read settings on import
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+from fastapi import FastAPI, APIRouter  # noqa: E402
+from fastapi.responses import ORJSONResponse  # noqa: E402
+from starlette.middleware.cors import CORSMiddleware  # noqa: E402
+import asyncio  # noqa: E402
+import os  # noqa: E402
+import logging  # noqa: E402
+from contextlib import asynccontextmanager  # noqa: E402
+
 # Import route modules
-from routes import sessions, chat, input_history
+from routes import sessions, chat, input_history, metrics, blobs, search, changes, events, health, speech, jobs  # noqa: E402
+from database import init_db, open_pool, close_pool  # noqa: E402
+from ai_service import ai_service  # noqa: E402
+from write_behind import write_queue  # noqa: E402
+from session_purge import session_purger  # noqa: E402
+from search_indexer import search_indexer  # noqa: E402
+from event_hub import event_hub  # noqa: E402
+from job_queue import job_queue  # noqa: E402
 
 
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Migrations run here rather than on import, off the event loop
+    app.state.schema_version = await asyncio.to_thread(init_db)
+    # The database connection pool lives for the lifetime of the app
+    open_pool()
+    # Finish deleting large sessions left over from the last run
+    await session_purger.start()
+    # Index rows that predate full-text search
+    await search_indexer.start()
+    # Pick up jobs left queued or interrupted by the last run
+    await job_queue.start()
+    # Count cached responses now rather than on the first lookup
+    await asyncio.to_thread(ai_service.response_cache.open)
+    # Import the LLM SDK and load the tokenizer in the background so neither
+    # startup nor the first chat waits for them
+    preload = asyncio.gather(
+        asyncio.get_running_loop().run_in_executor(None, ai_service.preload),
+        asyncio.get_running_loop().run_in_executor(None, ai_service.context_builder.load_tokenizer)
+    )
+    app.state.status = "ready"
+    yield
+    app.state.status = "stopping"
+    await preload
+    event_hub.close()
+    # Interrupted jobs go back on the queue; their writes still need the write queue
+    await job_queue.close()
+    # Commit queued writes before the pool goes away
+    await write_queue.close()
+    await session_purger.close()
+    await search_indexer.close()
+    ai_service.response_cache.close()
+    await ai_service.transport.aclose()
+    ai_service.image_preprocessor.shutdown()
+    ai_service.transcriber.shutdown()
+    close_pool()
+
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+app.state.status = "starting"
+app.state.schema_version = None
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -28,6 +80,14 @@ async def root():
 api_router.include_router(sessions.router, tags=["sessions"])
 api_router.include_router(chat.router, tags=["chat"])
 api_router.include_router(input_history.router, tags=["input-history"])
+api_router.include_router(metrics.router, tags=["metrics"])
+api_router.include_router(blobs.router, tags=["blobs"])
+api_router.include_router(search.router, tags=["search"])
+api_router.include_router(changes.router, tags=["changes"])
+api_router.include_router(events.router, tags=["events"])
+api_router.include_router(health.router, tags=["health"])
+api_router.include_router(speech.router, tags=["speech"])
+api_router.include_router(jobs.router, tags=["jobs"])
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -38,6 +98,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Retry-After", "Location"],
 )
 
 # Configure logging
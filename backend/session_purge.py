@@ -0,0 +1,61 @@
+import asyncio
+import logging
+import os
+from typing import Dict, Iterable
+from database import SessionDB
+from blob_gc import collect_blobs_soon
+
+logger = logging.getLogger(__name__)
+
+
+class SessionPurger:
+    """
+    Removes sessions marked deleted a chunk at a time in the background.
+    Each chunk is its own short write, so chat writes queued on the writer
+    thread get in between chunks instead of waiting for one huge DELETE.
+    Marked sessions survive restarts and are resumed by ``start``. Blobs
+    left unreferenced are removed afterwards by the ``blobs.gc`` job.
+    """
+
+    def __init__(self, chunk_size: int = 500, pause: float = 0.01):
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def start(self):
+        """Resume purges left unfinished by a previous run"""
+        self.schedule(await SessionDB.get_pending_purges())
+
+    def schedule(self, session_ids: Iterable[str]):
+        for session_id in session_ids:
+            if session_id not in self._tasks:
+                self._tasks[session_id] = asyncio.get_running_loop().create_task(self._purge(session_id))
+
+    async def _purge(self, session_id: str):
+        chunks = 0
+        try:
+            while not await SessionDB.purge_chunk(session_id, self.chunk_size):
+                chunks += 1
+                await asyncio.sleep(self.pause)
+            logger.info(f"Purged deleted session {session_id} in {chunks + 1} chunks")
+            await collect_blobs_soon()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error purging session {session_id}: {str(e)}")
+        finally:
+            self._tasks.pop(session_id, None)
+
+    async def close(self):
+        """Stop purging; unfinished sessions stay marked and resume on next start"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def metrics(self) -> dict:
+        return {"sessions_purging": len(self._tasks)}
+
+
+# Global purger shared by the session routes
+session_purger = SessionPurger(chunk_size=int(os.environ.get('SESSION_DELETE_CHUNK', '500')))
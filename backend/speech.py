@@ -0,0 +1,248 @@
+import io
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+from admission import SingleFlight
+from blob_store import decode_data_url
+from database import TranscriptDB
+
+logger = logging.getLogger(__name__)
+
+# Whisper models take 16 kHz mono audio
+SAMPLE_RATE = 16000
+
+# The model of a worker process, loaded by its first job
+_model = None
+
+
+class SpeechUnavailable(Exception):
+    """faster-whisper is not installed, so audio cannot be transcribed"""
+
+
+def _load_model(model: str, compute_type: str, cpu_threads: int):
+    global _model
+    if _model is None:
+        # Never fall back to downloading: the model has to be on disk already
+        os.environ["HF_HUB_OFFLINE"] = "1"
+        from faster_whisper import WhisperModel
+        _model = WhisperModel(model, device="cpu", compute_type=compute_type,
+                              cpu_threads=cpu_threads, local_files_only=True)
+    return _model
+
+
+def transcribe(raw: bytes, offset: float, model: str, compute_type: str = "int8", cpu_threads: int = 2,
+               language: Optional[str] = None, prompt: Optional[str] = None) -> dict:
+    """
+    Transcribe encoded audio (anything ffmpeg reads: webm/opus, wav, mp3...)
+    from ``offset`` seconds on. Runs in a worker process, so it only takes
+    and returns plain data.
+
+    Returns:
+        {segments: [(start, end, text)], duration, language, seconds}
+    """
+    # Imported here so the API process never loads the model or its runtime
+    from faster_whisper import decode_audio
+
+    start = time.perf_counter()
+    whisper = _load_model(model, compute_type, cpu_threads)
+    audio = decode_audio(io.BytesIO(raw), sampling_rate=SAMPLE_RATE)
+    remaining = audio[int(offset * SAMPLE_RATE):]
+    segments = []
+    detected = language
+    # Less than 0.1s cannot hold a word
+    if len(remaining) >= SAMPLE_RATE // 10:
+        # Greedy decoding and VAD keep latency low; ``prompt`` carries the
+        # text before ``offset`` so the continuation reads on from it
+        pieces, info = whisper.transcribe(remaining, language=language, beam_size=1, vad_filter=True,
+                                          condition_on_previous_text=False, initial_prompt=prompt or None)
+        segments = [(offset + piece.start, offset + piece.end, piece.text.strip()) for piece in pieces]
+        detected = info.language
+    return {
+        "segments": segments,
+        "duration": len(audio) / SAMPLE_RATE,
+        "language": detected,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+class SpeechTranscriber:
+    """
+    On-device speech-to-text: faster-whisper on the CPU in a process pool,
+    so decoding and inference never hold the event loop's GIL. The model is
+    only ever loaded from local files and audio never leaves the machine.
+    Transcripts are cached in the database by the SHA-256 of the audio (its
+    blob hash) and the model, and concurrent requests for the same audio
+    share one transcription.
+    """
+
+    def __init__(self, model: str = "base.en", workers: int = 1, cpu_threads: int = 2,
+                 compute_type: str = "int8", language: Optional[str] = None,
+                 max_bytes: int = 25 * 1024 * 1024, stable_margin: float = 2.0):
+        self.model = model
+        self.workers = max(1, workers)
+        self.cpu_threads = max(1, cpu_threads)
+        self.compute_type = compute_type
+        self.language = language or None
+        self.max_bytes = max_bytes
+        self.stable_margin = stable_margin
+        self.flights = SingleFlight()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._available: Optional[bool] = None
+
+        # Metrics
+        self.transcriptions = 0
+        self.passes = 0
+        self.failures = 0
+        self.cache_hits = 0
+        self.audio_seconds = 0.0
+        self.seconds = 0.0
+
+    @property
+    def available(self) -> bool:
+        if self._available is None:
+            self._available = importlib.util.find_spec("faster_whisper") is not None
+            if not self._available:
+                logger.warning("faster-whisper is not installed; audio messages will not be transcribed")
+        return self._available
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def run(self, raw: bytes, offset: float = 0.0, prompt: Optional[str] = None) -> dict:
+        """One transcription pass in the worker pool; see ``transcribe``"""
+        if not self.available:
+            raise SpeechUnavailable("Speech-to-text is not available: install faster-whisper and a local model")
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(
+                self._get_executor(), transcribe, raw, offset, self.model,
+                self.compute_type, self.cpu_threads, self.language, prompt
+            )
+        except Exception:
+            self.failures += 1
+            raise
+        self.passes += 1
+        self.seconds += result["seconds"]
+        return result
+
+    async def cached(self, audio_hash: str) -> Optional[dict]:
+        transcript = await TranscriptDB.get(audio_hash, self.model)
+        if transcript is not None:
+            self.cache_hits += 1
+            transcript.update(hash=audio_hash, cached=True)
+        return transcript
+
+    async def store(self, audio_hash: str, text: str, language: Optional[str], duration: float) -> dict:
+        self.transcriptions += 1
+        self.audio_seconds += duration
+        await TranscriptDB.put(audio_hash, self.model, text, language, duration)
+        return {"text": text, "language": language, "duration": duration, "hash": audio_hash, "cached": False}
+
+    async def transcribe(self, audio_data: str) -> dict:
+        """
+        Transcribe base64 audio (or a data URL)
+
+        Returns:
+            {text, language, duration, hash, cached}
+        """
+        raw, _ = decode_data_url(audio_data)
+        return await self.transcribe_bytes(raw)
+
+    async def transcribe_bytes(self, raw: bytes) -> dict:
+        if len(raw) > self.max_bytes:
+            raise ValueError(f"Audio is larger than {self.max_bytes} bytes")
+        audio_hash = hashlib.sha256(raw).hexdigest()
+        transcript = await self.cached(audio_hash)
+        if transcript is not None:
+            return transcript
+
+        async def run() -> dict:
+            result = await self.run(raw)
+            text = " ".join(text for _, _, text in result["segments"] if text)
+            return await self.store(audio_hash, text, result["language"], result["duration"])
+        return await self.flights.do(audio_hash, run)
+
+    def stream(self) -> "TranscriptionStream":
+        return TranscriptionStream(self)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def metrics(self) -> dict:
+        return {
+            "available": self.available,
+            "model": self.model,
+            "transcriptions": self.transcriptions,
+            "passes": self.passes,
+            "failures": self.failures,
+            "cache_hits": self.cache_hits,
+            "audio_seconds": round(self.audio_seconds, 1),
+            # Below 1.0 is faster than real time
+            "real_time_factor": round(self.seconds / self.audio_seconds, 3) if self.audio_seconds else None,
+        }
+
+
+class TranscriptionStream:
+    """
+    Transcript of audio that arrives in chunks while the user is still
+    speaking. Each ``update`` transcribes only the audio after the committed
+    text: segments that end more than ``stable_margin`` seconds before the
+    end of the audio so far are committed, and the rest is a tentative tail
+    that later passes may revise. ``finish`` commits everything and caches
+    the transcript under the hash of the whole recording.
+    """
+
+    def __init__(self, transcriber: SpeechTranscriber):
+        self.transcriber = transcriber
+        self.buffer = bytearray()
+        self.committed: List[str] = []
+        self.committed_until = 0.0
+        self.tail = ""
+        self.duration = 0.0
+        self.language: Optional[str] = None
+
+    def feed(self, chunk: bytes):
+        if len(self.buffer) + len(chunk) > self.transcriber.max_bytes:
+            raise ValueError(f"Audio is larger than {self.transcriber.max_bytes} bytes")
+        self.buffer.extend(chunk)
+
+    @property
+    def text(self) -> str:
+        return " ".join(part for part in (*self.committed, self.tail) if part)
+
+    async def update(self, final: bool = False) -> dict:
+        """Transcribe what has arrived; returns {text, committed, duration}"""
+        prompt = " ".join(self.committed)[-200:]
+        result = await self.transcriber.run(bytes(self.buffer), self.committed_until, prompt)
+        self.duration = result["duration"]
+        self.language = result["language"] or self.language
+        stable_until = self.duration if final else self.duration - self.transcriber.stable_margin
+        tail = []
+        for start, end, text in result["segments"]:
+            if end <= stable_until and not tail:
+                if text:
+                    self.committed.append(text)
+                self.committed_until = end
+            elif text:
+                tail.append(text)
+        self.tail = " ".join(tail)
+        return {"text": self.text, "committed": " ".join(self.committed), "duration": self.duration}
+
+    async def finish(self) -> dict:
+        """The final transcript as {text, language, duration, hash, cached}"""
+        raw = bytes(self.buffer)
+        audio_hash = hashlib.sha256(raw).hexdigest()
+        transcript = await self.transcriber.cached(audio_hash)
+        if transcript is not None:
+            return transcript
+        await self.update(final=True)
+        return await self.transcriber.store(audio_hash, self.text, self.language, self.duration)
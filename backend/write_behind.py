@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Any, Callable, Deque, List, Optional, Tuple
+from database import run_db
+
+logger = logging.getLogger(__name__)
+
+# One write: a DB task (db_writer-wrapped function) and its arguments
+WriteOp = Tuple[Callable, tuple]
+
+
+class WriteBehindQueue:
+    """
+    Group-commits database writes.
+
+    Each ``submit`` is a unit: its operations are applied together inside a
+    savepoint, so a request's writes land atomically. Units arriving within
+    ``window`` seconds of each other share one transaction and one fsync on
+    the writer thread. A unit that fails is rolled back to its savepoint
+    without affecting the others in the batch.
+
+    Units are queued when they are submitted and applied in that order.
+    ``submit`` resolves once the batch is committed. ``submit_nowait`` is
+    write-behind: it returns immediately, and ``flush``/``close`` guarantee
+    queued writes are committed before shutdown completes.
+    """
+
+    def __init__(self, window: float = 0.005, max_batch: int = 256):
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self._pending: Deque[Tuple[List[WriteOp], asyncio.Future]] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._closed = False
+
+        # Metrics
+        self.batches = 0
+        self.units = 0
+        self.failed_units = 0
+        self.largest_batch = 0
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    def _enqueue(self, ops: List[WriteOp]) -> asyncio.Future:
+        if self._closed:
+            raise RuntimeError("Write queue is closed")
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((ops, future))
+        self._wakeup.set()
+        return future
+
+    def submit(self, *ops: WriteOp) -> "asyncio.Future[List[Any]]":
+        """Apply ``ops`` atomically in the next group commit; await for their results"""
+        return self._enqueue(list(ops))
+
+    def submit_nowait(self, *ops: WriteOp) -> asyncio.Future:
+        """Queue ``ops`` without waiting for the commit; failures are logged"""
+        future = self._enqueue(list(ops))
+        future.add_done_callback(self._log_failure)
+        return future
+
+    @staticmethod
+    def _log_failure(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Write-behind unit failed: {str(future.exception())}")
+
+    async def flush(self):
+        """Wait until everything queued so far has been committed"""
+        if self._worker is not None and not self._worker.done():
+            # Units are applied in order, so an empty unit completes after all earlier ones
+            await self.submit()
+
+    async def close(self):
+        """Commit all queued writes and stop the worker"""
+        await self.flush()
+        self._closed = True
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    @staticmethod
+    def _apply_batch(conn, units: List[List[WriteOp]]) -> List[Tuple[bool, Any]]:
+        """Runs on the writer thread: every unit in one transaction, each in its own savepoint"""
+        outcomes = []
+        conn.execute("BEGIN IMMEDIATE")
+        for ops in units:
+            conn.execute("SAVEPOINT unit")
+            try:
+                results = [task.sync(conn, *args) for task, args in ops]
+                conn.execute("RELEASE unit")
+                outcomes.append((True, results))
+            except Exception as e:
+                conn.execute("ROLLBACK TO unit")
+                conn.execute("RELEASE unit")
+                outcomes.append((False, e))
+        return outcomes
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending:
+                if len(self._pending) < self.max_batch and self.window > 0:
+                    # Give concurrent requests a moment to join this commit
+                    await asyncio.sleep(self.window)
+                batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+                try:
+                    outcomes = await run_db(self._apply_batch, [ops for ops, _ in batch], write=True)
+                except Exception as e:
+                    logger.error(f"Write-behind batch of {len(batch)} failed: {str(e)}")
+                    outcomes = [(False, e)] * len(batch)
+
+                self.batches += 1
+                self.units += len(batch)
+                self.largest_batch = max(self.largest_batch, len(batch))
+                for (_, future), (ok, value) in zip(batch, outcomes):
+                    if not ok:
+                        self.failed_units += 1
+                    if future.done():
+                        continue
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+
+    def metrics(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "units": self.units,
+            "failed_units": self.failed_units,
+            "avg_units_per_commit": round(self.units / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+        }
+
+
+# Global write queue shared by the route handlers
+write_queue = WriteBehindQueue(
+    window=float(os.environ.get('WRITE_BATCH_WINDOW_MS', '5')) / 1000,
+    max_batch=int(os.environ.get('WRITE_BATCH_MAX', '256')),
+)
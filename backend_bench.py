@@ -0,0 +1,676 @@
+#!/usr/bin/env python3
+"""
+Backend Benchmarks for "In" AI Interview Assistant
+Runs in-process against a throwaway SQLite database; no server or network needed.
+
+Usage:
+    python backend_bench.py [benchmark ...]
+"""
+
+import asyncio
+import base64
+import io
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from pathlib import Path
+from urllib.error import URLError
+from urllib.request import urlopen
+
+# Point the backend at a scratch database before it is imported
+BENCH_DIR = tempfile.mkdtemp(prefix="in_bench_")
+os.environ.setdefault('IN_DB_PATH', str(Path(BENCH_DIR) / "bench.db"))
+BACKEND_DIR = Path(__file__).parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+import database  # noqa: E402
+from database import SessionDB, MessageDB  # noqa: E402
+from write_behind import WriteBehindQueue  # noqa: E402
+
+# Time from spawning the backend to /api/health/ready answering 200; the
+# Electron launcher opens the window at that point
+STARTUP_TARGET_MS = float(os.environ.get('STARTUP_TARGET_MS', '1500'))
+# Deferred until first use, so they must not appear in the startup import graph
+LAZY_IMPORTS = ('emergentintegrations', 'litellm', 'openai', 'PIL')
+
+database.init_db()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(latencies_ms):
+    return {
+        'count': len(latencies_ms),
+        'p50_ms': round(percentile(latencies_ms, 50), 2),
+        'p95_ms': round(percentile(latencies_ms, 95), 2),
+        'p99_ms': round(percentile(latencies_ms, 99), 2),
+        'max_ms': round(max(latencies_ms), 2) if latencies_ms else 0.0,
+        'mean_ms': round(statistics.mean(latencies_ms), 2) if latencies_ms else 0.0,
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def spawn_server(args, ready_path, cwd, env=None):
+    """
+    Run ``args`` (with ``{port}`` filled in) until the block exits, after
+    ``ready_path`` answers 200. Yields (port, milliseconds until ready).
+    """
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen([arg.format(port=port) for arg in args], cwd=cwd, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                with urlopen(f"http://127.0.0.1:{port}{ready_path}", timeout=1) as response:
+                    if response.status == 200:
+                        break
+            except (URLError, ConnectionError):
+                pass
+            if process.poll() is not None:
+                raise RuntimeError(f"{args[0]} exited with code {process.returncode} during startup")
+            time.sleep(0.01)
+        yield port, (time.perf_counter() - start) * 1000
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+class BackendBenchmark:
+    def __init__(self):
+        self.results = {}
+
+    def record(self, name, result):
+        self.results[name] = result
+        print(f"[BENCH] {name}: {result}")
+
+    async def _new_session(self):
+        now = datetime.utcnow()
+        session = {'id': str(uuid.uuid4()), 'title': 'Bench', 'date': now, 'createdAt': now, 'updatedAt': now}
+        await SessionDB.create(session)
+        return session['id']
+
+    async def _chat_traffic(self, mode, clients=32, requests_per_client=10,
+                            llm_latency=0.02, fsync_stall=0.002):
+        """
+        Simulate concurrent POST /api/chat handlers: persist the user message,
+        await a fake LLM, persist the reply and bump the question count.
+        ``mode`` is 'inline' (DB calls block the event loop, as before the DB
+        executor existed), 'executor' (one commit per write on the writer
+        thread) or 'group_commit' (the request's writes queued as one unit on
+        the write-behind queue).
+        ``fsync_stall`` adds a fixed delay to every commit to emulate a slow
+        disk, and a probe coroutine measures how late the loop wakes it up.
+        """
+        def stalled(fn):
+            def run(conn, *args):
+                result = fn(conn, *args)
+                time.sleep(fsync_stall)
+                return result
+            return run
+
+        async def call(task, *args):
+            if mode == 'inline':
+                return database.run_sync(stalled(task.sync), *args)
+            return await database.run_db(stalled(task.sync), *args, write=True)
+
+        queue = WriteBehindQueue()
+        queue._apply_batch = stalled(WriteBehindQueue._apply_batch)
+
+        session_ids = [await self._new_session() for _ in range(clients)]
+        latencies = []
+        loop_lag = []
+        done = asyncio.Event()
+
+        async def probe(interval=0.005):
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(interval)
+                loop_lag.append((time.perf_counter() - start - interval) * 1000)
+
+        async def client(session_id):
+            for _ in range(requests_per_client):
+                start = time.perf_counter()
+                user_message = {
+                    'id': str(uuid.uuid4()), 'sessionId': session_id, 'type': 'user',
+                    'content': 'Explain the CAP theorem', 'timestamp': datetime.utcnow()
+                }
+                ai_message = {
+                    'id': str(uuid.uuid4()), 'sessionId': session_id, 'type': 'assistant',
+                    'content': 'Consistency, availability, partition tolerance...' * 20,
+                    'timestamp': datetime.utcnow()
+                }
+                if mode == 'group_commit':
+                    await asyncio.sleep(llm_latency)
+                    await queue.submit(
+                        (MessageDB.create, (user_message,)),
+                        (MessageDB.create, (ai_message,)),
+                        (MessageDB.increment_question_count, (session_id,))
+                    )
+                else:
+                    await call(MessageDB.create, user_message)
+                    await asyncio.sleep(llm_latency)
+                    await call(MessageDB.create, ai_message)
+                    await call(MessageDB.increment_question_count, session_id)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        probe_task = asyncio.create_task(probe())
+        await asyncio.gather(*(client(sid) for sid in session_ids))
+        done.set()
+        await probe_task
+        await queue.close()
+        return {'chat': summarize(latencies), 'loop_lag': summarize(loop_lag)}
+
+    def bench_chat_latency(self):
+        """p99 latency of concurrent chat requests: DB inline, on the DB executor, and group-committed"""
+        for mode in ('inline', 'executor', 'group_commit'):
+            self.record(f'chat_latency.{mode}', asyncio.run(self._chat_traffic(mode)))
+        database.close_pool()
+
+    @staticmethod
+    def _synthetic_screenshot(width, height, seed):
+        """PNG data URL resembling a desktop screenshot: flat panels, text-like runs, one photo region"""
+        from PIL import Image, ImageDraw
+
+        rng = random.Random(seed)
+        img = Image.new("RGB", (width, height), (24, 26, 31))
+        draw = ImageDraw.Draw(img)
+        for _ in range(40):
+            x, y = rng.randrange(width), rng.randrange(height)
+            draw.rectangle([x, y, x + rng.randrange(80, 600), y + rng.randrange(30, 300)],
+                           fill=tuple(rng.randrange(20, 240) for _ in range(3)))
+        for line in range(0, height, 22):
+            x = rng.randrange(0, 200)
+            while x < width - 40:
+                run = rng.randrange(10, 90)
+                draw.rectangle([x, line + 6, x + run, line + 16], fill=(200, 200, 205))
+                x += run + rng.randrange(6, 20)
+        photo = Image.effect_noise((width // 3, height // 3), 60).convert("RGB")
+        img.paste(photo, (width // 2, height // 2))
+        out = io.BytesIO()
+        img.save(out, format="PNG")
+        return "data:image/png;base64," + base64.b64encode(out.getvalue()).decode()
+
+    async def _queued_chat_traffic(self, mode, clients=16, requests_per_client=5, llm_latency=0.2):
+        """
+        POST /api/chat as seen by the client: 'inline' saves the user message,
+        waits for the (fake) LLM and saves the reply before answering;
+        'queued' saves the user message with a reply job and answers at once,
+        the job queue's workers doing the rest. Also reports how long queued
+        replies took to be saved.
+        """
+        from job_queue import JobQueue
+        from write_behind import write_queue
+
+        jobs = JobQueue(workers=8)
+        saved = {}
+
+        @jobs.handler("bench.reply", priority=10)
+        async def reply(payload):
+            await asyncio.sleep(llm_latency)
+            ai_message = {'id': payload['replyId'], 'sessionId': payload['sessionId'], 'type': 'assistant',
+                          'content': 'Consistency, availability, partition tolerance...', 'timestamp': datetime.utcnow()}
+            await write_queue.submit((MessageDB.create, (ai_message,)),
+                                     (MessageDB.refresh_question_count, (payload['sessionId'],)))
+            saved[payload['replyId']] = time.perf_counter()
+
+        session_ids = [await self._new_session() for _ in range(clients)]
+        latencies = []
+        sent = {}
+        if mode == 'queued':
+            await jobs.start()
+
+        async def client(session_id):
+            for _ in range(requests_per_client):
+                start = time.perf_counter()
+                user_message = {'id': str(uuid.uuid4()), 'sessionId': session_id, 'type': 'user',
+                                'content': 'Explain the CAP theorem', 'timestamp': datetime.utcnow()}
+                reply_id = str(uuid.uuid4())
+                if mode == 'queued':
+                    await write_queue.submit((MessageDB.create, (user_message,)),
+                                             jobs.job_op("bench.reply", {'sessionId': session_id, 'replyId': reply_id}))
+                    jobs.notify()
+                    sent[reply_id] = start
+                else:
+                    await write_queue.submit((MessageDB.create, (user_message,)))
+                    await reply({'sessionId': session_id, 'replyId': reply_id})
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        await asyncio.gather(*(client(sid) for sid in session_ids))
+        result = {'request': summarize(latencies)}
+        if mode == 'queued':
+            while len(saved) < len(sent):
+                await asyncio.sleep(0.01)
+            result['reply_saved'] = summarize([(saved[key] - sent[key]) * 1000 for key in sent])
+            await jobs.close()
+        await write_queue.flush()
+        return result
+
+    def bench_job_queue(self):
+        """Request latency of chat answered inline vs. with the reply left to the background job queue"""
+        async def run():
+            from write_behind import write_queue
+            results = {mode: await self._queued_chat_traffic(mode) for mode in ('inline', 'queued')}
+            await write_queue.close()
+            return results
+
+        for mode, result in asyncio.run(run()).items():
+            self.record(f'job_queue.{mode}', result)
+        database.close_pool()
+
+    def bench_image_preprocessing(self, uplink_mbps=10.0):
+        """Upload bytes and upload time saved per screenshot by the vision preprocessing stage"""
+        from image_processing import ImagePreprocessor
+
+        sizes = [(1920, 1080), (2560, 1440), (2880, 1800), (3840, 2160)]
+        images = [self._synthetic_screenshot(w, h, seed) for seed, (w, h) in enumerate(sizes)]
+        preprocessor = ImagePreprocessor(workers=2)
+
+        async def process_all():
+            results = []
+            for image in images:
+                start = time.perf_counter()
+                encoded = await preprocessor.process(image)
+                results.append((image, encoded, time.perf_counter() - start))
+            return results
+
+        try:
+            results = asyncio.run(process_all())
+        finally:
+            preprocessor.shutdown()
+
+        bytes_per_second = uplink_mbps * 1_000_000 / 8
+        for (width, height), (image, encoded, seconds) in zip(sizes, results):
+            sent_before = len(image.split(",", 1)[1])
+            sent_after = len(encoded)
+            saved_upload = (sent_before - sent_after) / bytes_per_second
+            self.record(f'image_preprocessing.{width}x{height}', {
+                'upload_bytes_before': sent_before,
+                'upload_bytes_after': sent_after,
+                'bytes_saved_pct': round(100 * (1 - sent_after / sent_before), 1),
+                'preprocess_ms': round(seconds * 1000, 1),
+                f'upload_ms_saved_at_{uplink_mbps:g}mbps': round(saved_upload * 1000, 1),
+            })
+
+    def bench_input_suggest(self, inputs=100_000, queries=20_000):
+        """Autocomplete latency over a large input history, including broad one-letter prefixes"""
+        from input_suggest import InputSuggestions
+
+        rng = random.Random(7)
+        openers = ['what is', 'how do you', 'explain', 'why would', 'tell me about', 'describe', 'can you']
+        topics = ['binary search', 'hash maps', 'tcp handshake', 'react hooks', 'python generators',
+                  'database indexes', 'load balancing', 'garbage collection', 'rest vs grpc', 'dependency injection']
+        now = datetime.utcnow()
+        conn = database.get_connection()
+        conn.execute("INSERT INTO sessions (id, title, date, createdAt, updatedAt) VALUES ('bench', 'Bench', ?, ?, ?)",
+                     (now.isoformat(),) * 3)
+        conn.executemany(
+            "INSERT INTO input_history (id, sessionId, input, timestamp) VALUES (?, 'bench', ?, ?)",
+            ((str(uuid.uuid4()),
+              f"{rng.choice(openers)} {rng.choice(topics)} {rng.randrange(inputs // 20)}",
+              datetime.fromtimestamp(now.timestamp() - rng.random() * 90 * 86400).isoformat())
+             for _ in range(inputs))
+        )
+        conn.commit()
+        conn.close()
+
+        index = InputSuggestions()
+        start = time.perf_counter()
+        asyncio.run(index.ensure_built())
+        build_ms = (time.perf_counter() - start) * 1000
+
+        samples = [f"{rng.choice(openers)} {rng.choice(topics)} {rng.randrange(inputs // 20)}" for _ in range(queries)]
+        prefixes = [sample[:rng.randint(1, len(sample))] for sample in samples]
+        suggest_ms, add_ms = [], []
+        for prefix, sample in zip(prefixes, samples):
+            start = time.perf_counter()
+            index.suggest(prefix)
+            suggest_ms.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            index.add(sample)
+            add_ms.append((time.perf_counter() - start) * 1000)
+
+        self.record('input_suggest', {
+            'inputs': inputs,
+            'distinct': index.metrics()['inputs'],
+            'build_ms': round(build_ms, 1),
+            'suggest': summarize(suggest_ms),
+            'add': summarize(add_ms),
+        })
+        database.close_pool()
+
+    def bench_serialization(self, messages=10_000, repeats=5):
+        """Cost of turning 10k stored messages into a JSON body: model validation + json vs orjson vs SQLite-rendered rows"""
+        import json
+        import orjson
+        from fastapi.routing import serialize_response
+        from fastapi.utils import create_response_field
+        from json_rows import JSONRowsResponse
+        from models import Message
+        from typing import List
+
+        conn = database.get_connection()
+        conn.execute("INSERT INTO sessions (id, title, date, createdAt, updatedAt) VALUES ('serial', 'Bench', ?, ?, ?)",
+                     (datetime.utcnow().isoformat(),) * 3)
+        conn.executemany(
+            "INSERT INTO messages (id, sessionId, type, content, timestamp) VALUES (?, 'serial', ?, ?, ?)",
+            ((str(uuid.uuid4()), 'user' if i % 2 else 'assistant',
+              "A typical interview answer covering complexity, trade-offs and an example. " * 6,
+              datetime.utcnow().isoformat()) for i in range(messages))
+        )
+        conn.commit()
+        select = "SELECT * FROM messages WHERE sessionId = 'serial' ORDER BY timestamp"
+        select_json = f"SELECT {database.MESSAGE_JSON} FROM messages WHERE sessionId = 'serial' ORDER BY timestamp"
+        field = create_response_field(name='messages', type_=List[Message])
+
+        def models_json():
+            # What a response_model route did: dict -> model -> validate again -> stdlib json
+            models = [Message(**dict(row)) for row in conn.execute(select)]
+            content = asyncio.run(serialize_response(field=field, response_content=models))
+            return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+        def dicts_orjson():
+            return orjson.dumps([dict(row) for row in conn.execute(select)])
+
+        def sqlite_rows():
+            return JSONRowsResponse(row[0] for row in conn.execute(select_json)).body
+
+        bodies = {}
+        for name, fn in (('models_json', models_json), ('dicts_orjson', dicts_orjson), ('sqlite_rows', sqlite_rows)):
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                bodies[name] = fn()
+                timings.append((time.perf_counter() - start) * 1000)
+            self.record(f'serialization.{name}', {'messages': messages, 'best_ms': round(min(timings), 1),
+                                                  'bytes': len(bodies[name])})
+        conn.close()
+        assert json.loads(bodies['models_json']) == json.loads(bodies['sqlite_rows']) == json.loads(bodies['dicts_orjson'])
+
+    def bench_incremental_sync(self, messages=2_000, new_messages=10, repeats=20):
+        """Reopening a long session: full re-download vs the delta since the last sync cursor"""
+        from database import ChangesDB
+        from json_rows import JSONRowsResponse, JSONEnvelopeResponse
+
+        async def scenario():
+            session_id = await self._new_session()
+            now = datetime.utcnow()
+            conn = database.get_connection()
+            conn.executemany(
+                "INSERT INTO messages (id, sessionId, type, content, timestamp) VALUES (?, ?, 'assistant', ?, ?)",
+                ((str(uuid.uuid4()), session_id, "An answer of typical length for an interview question. " * 8,
+                  now.isoformat()) for _ in range(messages))
+            )
+            conn.commit()
+            cursor = (await ChangesDB.get_session_messages_since(session_id, 0, messages))['cursor']
+            conn.executemany(
+                "INSERT INTO messages (id, sessionId, type, content, timestamp) VALUES (?, ?, 'user', 'follow-up', ?)",
+                ((str(uuid.uuid4()), session_id, now.isoformat()) for _ in range(new_messages))
+            )
+            conn.commit()
+            conn.close()
+
+            async def full():
+                page, _ = await MessageDB.get_page(session_id, messages + new_messages, as_json=True)
+                return JSONRowsResponse(item['json'] for item in page).body
+
+            async def delta():
+                changes = await ChangesDB.get_session_messages_since(session_id, cursor, 500)
+                return JSONEnvelopeResponse('messages', changes['items'], {'cursor': changes['cursor']}).body
+
+            for name, fn in (('full', full), ('delta', delta)):
+                timings = []
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    body = await fn()
+                    timings.append((time.perf_counter() - start) * 1000)
+                self.record(f'incremental_sync.{name}', {'messages': messages + new_messages, 'bytes': len(body),
+                                                         'p50_ms': round(percentile(timings, 50), 2)})
+
+        asyncio.run(scenario())
+        database.close_pool()
+
+    def bench_startup(self, runs=3, top=8):
+        """
+        Cold start as the Electron launcher sees it: ``-X importtime`` for
+        ``import server`` (which backend imports dominate, and that the LLM
+        SDK and PIL stay out of it), then time-to-ready of a real uvicorn
+        process against STARTUP_TARGET_MS.
+        """
+        env = dict(os.environ, IN_DB_PATH=str(Path(BENCH_DIR) / "startup.db"), PYTHONDONTWRITEBYTECODE="1")
+        profile = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import server"],
+            cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+        )
+        imports = {}
+        for line in profile.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line or "cumulative" in line:
+                continue
+            _, self_us, cumulative_us, name = (part.strip() for part in line.replace("import time:", "|").split("|"))
+            imports[name] = (int(self_us), int(cumulative_us))
+        packages = {}
+        for name, (self_us, _) in imports.items():
+            root = name.split(".")[0]
+            packages[root] = packages.get(root, 0) + self_us
+        heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+        self.record('startup.import_server', {
+            'import_ms': round(imports['server'][1] / 1000, 1),
+            'heaviest_ms': {root: round(us / 1000, 1) for root, us in heaviest},
+            'lazy_imports_loaded': sorted(name for name in imports if name.split(".")[0] in LAZY_IMPORTS),
+        })
+
+        timings = []
+        for _ in range(runs):
+            command = [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", "{port}"]
+            with spawn_server(command, "/api/health/ready", BACKEND_DIR, env) as (_, ready_ms):
+                timings.append(ready_ms)
+        # The first run also creates and migrates the database
+        self.record('startup.time_to_ready', {
+            'first_run_ms': round(timings[0], 1),
+            'best_ms': round(min(timings), 1),
+            'target_ms': STARTUP_TARGET_MS,
+            'meets_target': max(timings) <= STARTUP_TARGET_MS,
+        })
+
+    def bench_llm_policy(self, requests=200, concurrency=8):
+        """
+        Deadlines, retries, circuit breaking and hedging against
+        fake_llm_server.py with injected faults: success rate, latency and
+        upstream load with a bare policy vs the tuned one.
+        """
+        import aiohttp
+        from collections import Counter
+        from llm_policy import LLMError, LLMPolicy
+
+        class UpstreamError(Exception):
+            def __init__(self, status):
+                super().__init__(f"HTTP {status}")
+                self.status_code = status
+
+        # POST /fault only changes the keys it is given, so every scenario sets them all
+        healthy = {'latency_ms': 30, 'tail_ms': 0, 'tail_rate': 0, 'error_rate': 0,
+                   'error_status': 503, 'hang_rate': 0, 'stall_rate': 0}
+        bare = dict(max_attempts=1, breaker_threshold=10**9, hedge=False)
+        scenarios = [
+            ('tail_latency', dict(healthy, tail_ms=1500, tail_rate=0.05),
+             bare, dict(max_attempts=1, hedge=True, hedge_min_delay=0.05)),
+            ('flaky', dict(healthy, error_rate=0.2),
+             bare, dict(max_attempts=4, base_delay=0.02, max_delay=0.2, hedge=False)),
+            ('hangs', dict(healthy, hang_rate=0.05),
+             dict(bare, attempt_timeout=5, deadline=5), dict(attempt_timeout=0.3, deadline=3, base_delay=0.02, hedge=False)),
+            ('outage', dict(healthy, error_rate=1.0),
+             dict(bare, max_attempts=3, base_delay=0.02),
+             dict(max_attempts=3, base_delay=0.02, breaker_threshold=5, breaker_reset=60, hedge=False)),
+        ]
+
+        async def scenario(base, faults, settings):
+            async with aiohttp.ClientSession() as http:
+                async with http.post(f"{base}/fault", json=faults) as response:
+                    response.raise_for_status()
+                policy = LLMPolicy(**settings)
+
+                async def send(hedged):
+                    body = {'model': 'fake', 'messages': [{'role': 'user', 'content': 'Explain the CAP theorem'}]}
+                    async with http.post(f"{base}/v1/chat/completions", json=body) as response:
+                        if response.status != 200:
+                            raise UpstreamError(response.status)
+                        return (await response.json())['choices'][0]['message']['content']
+
+                latencies, outcomes = [], Counter()
+                slots = asyncio.Semaphore(concurrency)
+
+                async def request():
+                    async with slots:
+                        start = time.perf_counter()
+                        try:
+                            await policy.call('fake', send)
+                            outcomes['ok'] += 1
+                        except LLMError as e:
+                            outcomes[type(e).__name__] += 1
+                        latencies.append((time.perf_counter() - start) * 1000)
+
+                await asyncio.gather(*(request() for _ in range(requests)))
+                async with http.get(f"{base}/stats") as response:
+                    upstream = (await response.json())['requests']
+            metrics = policy.metrics()
+            return {
+                'success_pct': round(100 * outcomes['ok'] / requests, 1),
+                'errors': {name: count for name, count in outcomes.items() if name != 'ok'},
+                'p50_ms': round(percentile(latencies, 50), 1),
+                'p99_ms': round(percentile(latencies, 99), 1),
+                'upstream_requests': upstream,
+                'retries': metrics['retries'],
+                'hedges': metrics['hedges'],
+                'breaker': metrics['providers']['fake']['state'],
+            }
+
+        command = [sys.executable, "fake_llm_server.py", "--port", "{port}"]
+        with spawn_server(command, "/health", Path(__file__).parent) as (port, _):
+            for name, faults, off, on in scenarios:
+                for label, settings in (('bare', off), ('policy', on)):
+                    self.record(f'llm_policy.{name}.{label}', asyncio.run(scenario(f"http://127.0.0.1:{port}", faults, settings)))
+
+    def bench_model_routing(self, requests=80, concurrency=8):
+        """
+        ModelRouter against three fake_llm_server.py instances standing in for
+        a primary model, a fallback provider and a cheap model: latency with
+        simple questions sent to the cheap model, and with the primary
+        breaking its latency SLO, compared with always using the primary.
+        """
+        import aiohttp
+        from llm_policy import LLMPolicy
+        from model_router import ModelRouter
+
+        class UpstreamError(Exception):
+            def __init__(self, status):
+                super().__init__(f"HTTP {status}")
+                self.status_code = status
+
+        prompts = ['What is a closure?', 'Design a rate limiter for a distributed API gateway',
+                   'What does ACID stand for?', 'Implement an LRU cache and explain its complexity']
+        healthy = {'tail_ms': 0, 'tail_rate': 0, 'error_rate': 0, 'hang_rate': 0, 'stall_rate': 0}
+        scenarios = [
+            # name, latency_ms per server, simple routing, latency SLO (also the whole-answer deadline)
+            ('simple_questions', {'primary': 400, 'fallback': 400, 'mini': 80}, True, 30.0),
+            ('primary_over_slo', {'primary': 1200, 'fallback': 300, 'mini': 80}, False, 0.6),
+        ]
+
+        async def scenario(ports, latencies, simple, slo, routed):
+            async with aiohttp.ClientSession() as http:
+                for name, port in ports.items():
+                    async with http.post(f"http://127.0.0.1:{port}/fault",
+                                         json=dict(healthy, latency_ms=latencies[name])) as response:
+                        response.raise_for_status()
+                policy = LLMPolicy(hedge=False, base_delay=0.02)
+                router = ModelRouter(policy, {'Model': ['fake/primary', 'fake/fallback'] if routed else ['fake/primary']},
+                                     'Model', ['fake/mini'] if simple and routed else [], latency_slo=slo,
+                                     answer_deadline=slo)
+
+                async def send(target, deadline):
+                    url = f"http://127.0.0.1:{ports[target.split('/')[1]]}/v1/chat/completions"
+
+                    async def attempt(hedged):
+                        async with http.post(url, json={'model': target, 'messages': [{'role': 'user', 'content': 'q'}]}) as response:
+                            if response.status != 200:
+                                raise UpstreamError(response.status)
+                            return (await response.json())['choices'][0]['message']['content']
+                    return await policy.call(target, attempt, deadline=deadline)
+
+                latencies_ms = []
+                slots = asyncio.Semaphore(concurrency)
+
+                async def request(i):
+                    async with slots:
+                        prompt = prompts[i % len(prompts)]
+                        start = time.perf_counter()
+                        await router.call(router.route('Model', prompt), prompt, send)
+                        latencies_ms.append((time.perf_counter() - start) * 1000)
+
+                await asyncio.gather(*(request(i) for i in range(requests)))
+            metrics = router.metrics()
+            return {
+                'mean_ms': round(statistics.mean(latencies_ms), 1),
+                'p50_ms': round(percentile(latencies_ms, 50), 1),
+                'p95_ms': round(percentile(latencies_ms, 95), 1),
+                'served_by': {target: stats['requests'] - stats['failures'] for target, stats in metrics['targets'].items()},
+                'rerouted': metrics['rerouted'],
+                'fallbacks': metrics['fallbacks'],
+            }
+
+        command = [sys.executable, "fake_llm_server.py", "--port", "{port}"]
+        with ExitStack() as stack:
+            ports = {name: stack.enter_context(spawn_server(command, "/health", Path(__file__).parent))[0]
+                     for name in ('primary', 'fallback', 'mini')}
+            for name, latencies, simple, slo in scenarios:
+                for label, routed in (('primary_only', False), ('routed', True)):
+                    self.record(f'model_routing.{name}.{label}',
+                                asyncio.run(scenario(ports, latencies, simple, slo, routed)))
+
+    def run(self, names=None):
+        benchmarks = {
+            'chat_latency': self.bench_chat_latency,
+            'image_preprocessing': self.bench_image_preprocessing,
+            'input_suggest': self.bench_input_suggest,
+            'serialization': self.bench_serialization,
+            'incremental_sync': self.bench_incremental_sync,
+            'startup': self.bench_startup,
+            'llm_policy': self.bench_llm_policy,
+            'model_routing': self.bench_model_routing,
+            'job_queue': self.bench_job_queue,
+        }
+        for name in names or benchmarks:
+            benchmarks[name]()
+        return self.results
+
+
+if __name__ == "__main__":
+    try:
+        BackendBenchmark().run(sys.argv[1:] or None)
+    finally:
+        shutil.rmtree(BENCH_DIR, ignore_errors=True)
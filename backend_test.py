@@ -10,6 +10,13 @@ import base64
 import uuid
 from datetime import datetime
 import os
+import sys
+import asyncio
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -334,6 +341,572 @@ class BackendTester:
         except Exception as e:
             self.log_test('gpt_integration', 'technical_response', 'FAIL', f"Exception: {str(e)}")
     
+    def test_query_plans(self):
+        """Check hot DB queries are served by indexes (runs in-process on a scratch database)"""
+        print("\n=== Testing Query Plans ===")
+        
+        try:
+            os.environ['IN_DB_PATH'] = str(Path(tempfile.mkdtemp(prefix="in_plans_")) / "plans.db")
+            sys.path.insert(0, str(Path(__file__).parent / "backend"))
+            import database
+            from database import SessionDB, MessageDB, InputHistoryDB, ChangesDB, IdempotencyDB, TranscriptDB, JobDB, BlobDB
+            database.init_db()
+            
+            # Capture the SQL the DB layer actually executes
+            statements = []
+            database.close_pool()
+            database.open_pool(on_connect=lambda conn: conn.set_trace_callback(statements.append))
+            
+            async def exercise():
+                now = datetime.utcnow()
+                session_id = str(uuid.uuid4())
+                await SessionDB.create({'id': session_id, 'title': 'Plans', 'date': now, 'createdAt': now, 'updatedAt': now})
+                await MessageDB.create({'id': str(uuid.uuid4()), 'sessionId': session_id, 'type': 'user', 'content': 'hi', 'timestamp': now})
+                await InputHistoryDB.create({'id': str(uuid.uuid4()), 'sessionId': session_id, 'input': 'hi', 'timestamp': now})
+                
+                async def capture(query):
+                    statements.clear()
+                    await query
+                    return list(statements)
+                
+                return {
+                    'sessions.get_all': await capture(SessionDB.get_all()),
+                    'sessions.get_page': await capture(SessionDB.get_page(10)),
+                    'sessions.get_page_json': await capture(SessionDB.get_page(10, as_json=True)),
+                    'messages.get_by_session': await capture(MessageDB.get_by_session(session_id)),
+                    'messages.get_page': await capture(MessageDB.get_page(session_id, 10)),
+                    'messages.get_page_json': await capture(MessageDB.get_page(session_id, 10, as_json=True)),
+                    'input_history.get_all': await capture(InputHistoryDB.get_all()),
+                    'input_history.get_by_session': await capture(InputHistoryDB.get_by_session(session_id)),
+                    'changes.get_session_messages_since': await capture(ChangesDB.get_session_messages_since(session_id, 0)),
+                    'changes.get_changes': await capture(ChangesDB.get_changes(10**9)),
+                    'idempotency.get_exchange': await capture(IdempotencyDB.get_exchange('plans')),
+                    'transcripts.get': await capture(TranscriptDB.get('0' * 64, 'base.en')),
+                    'jobs.get_by_key': await capture(JobDB.get_by_key('plans')),
+                    'jobs.next_visible_at': await capture(JobDB.next_visible_at()),
+                    'blobs.get_unreferenced': await capture(BlobDB.get_unreferenced('', 500)),
+                    'blobs.get_known': await capture(BlobDB.get_known(['0' * 64])),
+                }
+            
+            paths = asyncio.run(exercise())
+            with database.get_pool().connection() as conn:
+                for name, sqls in paths.items():
+                    selects = [sql for sql in sqls if sql.lstrip().upper().startswith('SELECT')]
+                    plan = [row['detail'] for sql in selects for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+                    # A table SCAN without an index, or a temp b-tree sort, means the query no longer uses its index
+                    bad = [step for step in plan
+                           if (step.startswith('SCAN') and 'USING' not in step and 'INDEX' not in step)
+                           or 'TEMP B-TREE' in step]
+                    if not selects:
+                        self.log_test('query_plans', name, 'FAIL', "No SELECT captured")
+                    elif bad:
+                        self.log_test('query_plans', name, 'FAIL', f"Unindexed plan: {plan}")
+                    else:
+                        self.log_test('query_plans', name, 'PASS', f"Plan: {plan}")
+            database.close_pool()
+        except Exception as e:
+            self.log_test('query_plans', 'explain', 'FAIL', f"Exception: {str(e)}")
+    
+    def test_llm_transport(self):
+        """Check LLM HTTP connections are pooled, reused and evicted (runs against fake_llm_server.py)"""
+        print("\n=== Testing LLM Transport ===")
+        
+        try:
+            sys.path.insert(0, str(Path(__file__).parent / "backend"))
+            from backend_bench import spawn_server
+            from llm_transport import SharedTransport
+            
+            body = {'model': 'fake', 'messages': [{'role': 'user', 'content': 'hi'}]}
+            
+            async def exercise(base, transport, requests, pause=0.0, concurrency=1):
+                client = transport.open()
+                slots = asyncio.Semaphore(concurrency)
+                
+                async def call():
+                    async with slots:
+                        response = await client.post(f"{base}/v1/chat/completions", json=body)
+                        response.raise_for_status()
+                        await asyncio.sleep(pause)
+                
+                await asyncio.gather(*(call() for _ in range(requests)))
+                metrics = transport.metrics()
+                await transport.aclose()
+                return metrics
+            
+            command = [sys.executable, "fake_llm_server.py", "--port", "{port}", "--latency-ms", "5"]
+            with spawn_server(command, "/health", Path(__file__).parent) as (port, _):
+                base = f"http://127.0.0.1:{port}"
+                
+                metrics = asyncio.run(exercise(base, SharedTransport(), 10))
+                if metrics['misses'] == 1 and metrics['hits'] == 9 and metrics['evictions'] == 0:
+                    self.log_test('llm_transport', 'reuse', 'PASS', f"One connection for 10 sequential calls: {metrics}")
+                else:
+                    self.log_test('llm_transport', 'reuse', 'FAIL', f"Expected 1 miss and 9 hits: {metrics}")
+                
+                metrics = asyncio.run(exercise(base, SharedTransport(keepalive_expiry=0.05), 3, pause=0.2))
+                if metrics['misses'] == 3 and metrics['evictions'] >= 2:
+                    self.log_test('llm_transport', 'keepalive_expiry', 'PASS', f"Idle connections expire: {metrics}")
+                else:
+                    self.log_test('llm_transport', 'keepalive_expiry', 'FAIL', f"Expected every call to reconnect: {metrics}")
+                
+                metrics = asyncio.run(exercise(base, SharedTransport(max_keepalive=1), 8, concurrency=4))
+                if metrics['pooled'] <= 1 and metrics['evictions'] == metrics['misses'] - metrics['pooled'] > 0:
+                    self.log_test('llm_transport', 'keepalive_bound', 'PASS', f"Idle connections beyond the bound close: {metrics}")
+                else:
+                    self.log_test('llm_transport', 'keepalive_bound', 'FAIL', f"Expected at most 1 pooled connection: {metrics}")
+        except Exception as e:
+            self.log_test('llm_transport', 'pooling', 'FAIL', f"Exception: {str(e)}")
+    
+    def _scratch_database(self, prefix):
+        """Point the backend's DB layer at a new, migrated database (for in-process tests)"""
+        path = Path(tempfile.mkdtemp(prefix=prefix)) / "test.db"
+        os.environ['IN_DB_PATH'] = str(path)
+        sys.path.insert(0, str(Path(__file__).parent / "backend"))
+        import database
+        database.close_pool()
+        # An earlier test may have imported it already, with the path set then
+        database.DB_PATH = path
+        database.init_db()
+        database.open_pool()
+        return database
+    
+    def test_job_queue(self):
+        """Check job leases, fencing tokens and retries (in-process)"""
+        print("\n=== Testing Job Queue ===")
+        
+        try:
+            database = self._scratch_database("in_jobs_")
+            from database import JobDB
+            from job_queue import JobQueue, PermanentJobError, _timestamp
+            from write_behind import write_queue
+            
+            queue = JobQueue(workers=1, visibility_timeout=0.3, base_delay=0.05)
+            calls = {'flaky': 0, 'broken': 0}
+            
+            @queue.handler("test.lease")
+            async def lease(payload):
+                return None
+            
+            @queue.handler("test.last_attempt", max_attempts=1)
+            async def last_attempt(payload):
+                return None
+            
+            @queue.handler("test.flaky")
+            async def flaky(payload):
+                calls['flaky'] += 1
+                if calls['flaky'] == 1:
+                    raise RuntimeError("transient failure")
+                return {'value': payload['value']}
+            
+            @queue.handler("test.broken")
+            async def broken(payload):
+                calls['broken'] += 1
+                raise PermanentJobError("cannot succeed")
+            
+            async def wait_for(job_id, status, timeout=5.0):
+                deadline = asyncio.get_running_loop().time() + timeout
+                while (job := await JobDB.get(job_id))['status'] != status:
+                    if asyncio.get_running_loop().time() > deadline:
+                        break
+                    await asyncio.sleep(0.02)
+                return job
+            
+            async def exercise():
+                results = {}
+                
+                # Claims made by hand, standing in for two workers
+                job_id = await queue.enqueue("test.lease")
+                first = await JobDB.claim(_timestamp(0.2))
+                results['hidden'] = first['id'] == job_id and await JobDB.claim(_timestamp(0.2)) is None
+                await asyncio.sleep(0.3)
+                second = await JobDB.claim(_timestamp(60))
+                results['redelivered'] = (second['id'], second['attempts']) == (job_id, 2)
+                results['fenced'] = {
+                    'extend': await JobDB.extend(job_id, first['attempts'], _timestamp(60)),
+                    'complete_stale': await JobDB.complete(job_id, first['attempts'], None),
+                    'complete_current': await JobDB.complete(job_id, second['attempts'], None),
+                }
+                
+                job_id = await queue.enqueue("test.last_attempt")
+                await JobDB.claim(_timestamp(0.1))
+                await asyncio.sleep(0.2)
+                results['reclaimed'] = await JobDB.claim(_timestamp(60))
+                results['expired'] = await JobDB.get(job_id)
+                
+                # Jobs run by the queue's own worker
+                await queue.start()
+                results['retried'] = await wait_for(await queue.enqueue("test.flaky", {'value': 42}), 'done')
+                results['permanent'] = await wait_for(await queue.enqueue("test.broken"), 'failed')
+                results['metrics'] = queue.metrics()
+                await queue.close()
+                await write_queue.flush()
+                return results
+            
+            results = asyncio.run(exercise())
+            database.close_pool()
+            
+            if results['hidden'] and results['redelivered']:
+                self.log_test('jobs', 'lease', 'PASS', "A claimed job is hidden until its lease lapses, then redelivered")
+            else:
+                self.log_test('jobs', 'lease', 'FAIL', f"hidden={results['hidden']}, redelivered={results['redelivered']}")
+            
+            if results['fenced'] == {'extend': False, 'complete_stale': False, 'complete_current': True}:
+                self.log_test('jobs', 'fencing', 'PASS', "Only the latest attempt can extend or complete the job")
+            else:
+                self.log_test('jobs', 'fencing', 'FAIL', f"Stale attempt was not fenced off: {results['fenced']}")
+            
+            expired = results['expired']
+            if results['reclaimed'] is None and expired['status'] == 'failed' and 'Lease expired' in (expired['lastError'] or ''):
+                self.log_test('jobs', 'lease_on_last_attempt', 'PASS', "A lapsed lease on the last attempt fails the job")
+            else:
+                self.log_test('jobs', 'lease_on_last_attempt', 'FAIL', f"Expected a failed job: {expired}")
+            
+            retried = results['retried']
+            if retried['status'] == 'done' and retried['attempts'] == 2 and json.loads(retried['result']) == {'value': 42}:
+                self.log_test('jobs', 'retry', 'PASS', "A failed attempt is retried and its result stored")
+            else:
+                self.log_test('jobs', 'retry', 'FAIL', f"Expected done after 2 attempts: {retried}")
+            
+            permanent = results['permanent']
+            if permanent['status'] == 'failed' and permanent['attempts'] == 1 and calls['broken'] == 1:
+                self.log_test('jobs', 'permanent_failure', 'PASS', "A PermanentJobError is not retried")
+            else:
+                self.log_test('jobs', 'permanent_failure', 'FAIL', f"Expected one failed attempt: {permanent}, {results['metrics']}")
+        except Exception as e:
+            self.log_test('jobs', 'queue', 'FAIL', f"Exception: {str(e)}")
+    
+    def test_input_suggestions(self):
+        """Check a reset during a rebuild keeps deleted inputs out of suggestions (in-process)"""
+        print("\n=== Testing Input Suggestions ===")
+        
+        try:
+            database = self._scratch_database("in_suggest_")
+            from database import SessionDB, InputHistoryDB
+            from input_suggest import InputSuggestions
+            
+            async def exercise():
+                now = datetime.utcnow()
+                kept, deleted = str(uuid.uuid4()), str(uuid.uuid4())
+                for session_id, text in ((kept, 'how do hash maps work'), (deleted, 'how do heaps work')):
+                    await SessionDB.create({'id': session_id, 'title': text, 'date': now, 'createdAt': now, 'updatedAt': now})
+                    await InputHistoryDB.create({'id': str(uuid.uuid4()), 'sessionId': session_id, 'input': text, 'timestamp': now})
+                
+                suggestions = InputSuggestions()
+                build = asyncio.create_task(suggestions.ensure_built())
+                # Let the build read the inputs, then hold the event loop so the
+                # delete and reset (as DELETE /api/sessions does them) land before it resumes
+                await asyncio.sleep(0)
+                time.sleep(0.1)
+                database.run_sync(SessionDB.delete_many.sync, [deleted])
+                suggestions.reset()
+                await build
+                await suggestions.ensure_built()
+                return suggestions.suggest('how do'), suggestions.metrics()
+            
+            suggested, metrics = asyncio.run(exercise())
+            database.close_pool()
+            
+            if suggested == ['how do hash maps work']:
+                self.log_test('input_suggestions', 'reset_during_build', 'PASS', f"Deleted inputs are not suggested: {metrics}")
+            else:
+                self.log_test('input_suggestions', 'reset_during_build', 'FAIL', f"Suggested {suggested} after deleting a session")
+        except Exception as e:
+            self.log_test('input_suggestions', 'index', 'FAIL', f"Exception: {str(e)}")
+    
+    def test_blob_gc(self):
+        """Check blob GC removes old files without a row and keeps referenced or recent ones (in-process)"""
+        print("\n=== Testing Blob GC ===")
+        
+        try:
+            database = self._scratch_database("in_blob_gc_")
+            from database import SessionDB, MessageDB, BlobDB
+            from blob_store import blob_store, blob_url
+            from blob_gc import collect_blobs, GRACE_SECONDS
+            
+            async def exercise():
+                now = datetime.utcnow()
+                session_id = str(uuid.uuid4())
+                await SessionDB.create({'id': session_id, 'title': 'Blobs', 'date': now, 'createdAt': now, 'updatedAt': now})
+                blobs = {name: blob_store.put(f"{name} {uuid.uuid4()}".encode()) for name in ('referenced', 'orphan', 'recent_orphan')}
+                await BlobDB.create(blobs['referenced'], 'image/png', 1)
+                await MessageDB.create({'id': str(uuid.uuid4()), 'sessionId': session_id, 'type': 'user', 'content': 'see image',
+                                        'timestamp': now, 'imageUrl': blob_url(blobs['referenced'])})
+                # As if stored before the grace period, e.g. by a migration that then rolled back
+                stored = time.time() - 2 * GRACE_SECONDS
+                for name in ('referenced', 'orphan'):
+                    os.utime(blob_store.path_for(blobs[name]), (stored, stored))
+                result = await collect_blobs({})
+                return result, {name: blob_store.exists(blob_hash) for name, blob_hash in blobs.items()}
+            
+            result, exists = asyncio.run(exercise())
+            database.close_pool()
+            
+            if exists == {'referenced': True, 'orphan': False, 'recent_orphan': True} and result['orphans'] >= 1:
+                self.log_test('blob_gc', 'orphaned_files', 'PASS', f"Only the old file without a row was removed: {result}")
+            else:
+                self.log_test('blob_gc', 'orphaned_files', 'FAIL', f"Unexpected files left {exists}: {result}")
+        except Exception as e:
+            self.log_test('blob_gc', 'sweep', 'FAIL', f"Exception: {str(e)}")
+    
+    @contextmanager
+    def _local_backend(self, prefix):
+        """Run the backend on a new scratch database, without an LLM key; yields its API base URL"""
+        from backend_bench import spawn_server
+        scratch = Path(tempfile.mkdtemp(prefix=prefix))
+        env = {**os.environ, 'IN_DB_PATH': str(scratch / "test.db"),
+               'RESPONSE_CACHE_PATH': str(scratch / "response_cache.db"), 'EMERGENT_LLM_KEY': ''}
+        command = [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", "{port}"]
+        with spawn_server(command, "/api/health/ready", Path(__file__).parent / "backend", env) as (port, _):
+            yield f"http://127.0.0.1:{port}/api"
+    
+    def test_idempotent_chat(self):
+        """Check repeated Idempotency-Keys replay the first exchange (runs a local backend)"""
+        print("\n=== Testing Idempotent Chat ===")
+        
+        try:
+            with self._local_backend("in_idempotency_") as api:
+                session_id = self.session.post(f"{api}/sessions", json={"title": "Idempotency"}).json()['id']
+                other_id = self.session.post(f"{api}/sessions", json={"title": "Other"}).json()['id']
+                message = {"sessionId": session_id, "message": "What is a mutex?", "model": "GPT-5.2"}
+                
+                def send(key, body=message, prefer=None):
+                    headers = {"Idempotency-Key": key}
+                    if prefer:
+                        headers["Prefer"] = prefer
+                    return self.session.post(f"{api}/chat", json=body, headers=headers)
+                
+                first, repeat = send("replay-1"), send("replay-1")
+                stored = self.session.get(f"{api}/chat/{session_id}").json()
+                if first.status_code == repeat.status_code == 200 and first.json() == repeat.json() and len(stored) == 2:
+                    self.log_test('idempotency', 'replay', 'PASS', "A repeated key returns the first reply and stores nothing new")
+                else:
+                    self.log_test('idempotency', 'replay', 'FAIL', f"HTTP {first.status_code}/{repeat.status_code}, {len(stored)} messages stored")
+                
+                with ThreadPoolExecutor(max_workers=4) as pool:
+                    concurrent = list(pool.map(lambda _: send("replay-2"), range(4)))
+                stored = self.session.get(f"{api}/chat/{session_id}").json()
+                replies = {response.json()['id'] for response in concurrent if response.status_code == 200}
+                if len(replies) == 1 and all(r.status_code == 200 for r in concurrent) and len(stored) == 4:
+                    self.log_test('idempotency', 'concurrent_replay', 'PASS', "Concurrent repeats share one exchange")
+                else:
+                    self.log_test('idempotency', 'concurrent_replay', 'FAIL', f"{len(replies)} distinct replies, {len(stored)} messages stored")
+                
+                reused = send("replay-1", {**message, "sessionId": other_id})
+                if reused.status_code == 422:
+                    self.log_test('idempotency', 'other_session', 'PASS', "A key reused for another session is rejected")
+                else:
+                    self.log_test('idempotency', 'other_session', 'FAIL', f"Expected 422, got HTTP {reused.status_code}")
+                
+                accepted, repeat = send("replay-3", prefer="respond-async"), send("replay-3", prefer="respond-async")
+                if accepted.status_code == repeat.status_code == 202 and accepted.json()['jobId'] == repeat.json()['jobId']:
+                    self.log_test('idempotency', 'async_replay', 'PASS', "A repeated respond-async request returns the same job")
+                else:
+                    self.log_test('idempotency', 'async_replay', 'FAIL', f"HTTP {accepted.status_code}/{repeat.status_code}: {accepted.text} {repeat.text}")
+        except Exception as e:
+            self.log_test('idempotency', 'chat', 'FAIL', f"Exception: {str(e)}")
+    
+    def test_keyset_pagination(self):
+        """Check X-Next-Cursor walks sessions and messages without gaps or repeats (runs a local backend)"""
+        print("\n=== Testing Keyset Pagination ===")
+        
+        try:
+            with self._local_backend("in_cursors_") as api:
+                for i in range(5):
+                    self.session.post(f"{api}/sessions", json={"title": f"Session {i}"})
+                
+                def walk(url, limit):
+                    pages, params = [], {"limit": limit}
+                    while True:
+                        response = self.session.get(url, params=params)
+                        response.raise_for_status()
+                        pages.append([row['id'] for row in response.json()])
+                        cursor = response.headers.get('X-Next-Cursor')
+                        if not cursor:
+                            return pages
+                        params = {"limit": limit, "before": cursor}
+                
+                everything = [row['id'] for row in self.session.get(f"{api}/sessions").json()]
+                pages = walk(f"{api}/sessions", 2)
+                if [len(page) for page in pages] == [2, 2, 1] and sum(pages, []) == everything:
+                    self.log_test('pagination', 'sessions', 'PASS', "Pages of 2 cover all 5 sessions, newest first")
+                else:
+                    self.log_test('pagination', 'sessions', 'FAIL', f"Pages {pages} do not match {everything}")
+                
+                session_id = everything[0]
+                for i in range(3):
+                    self.session.post(f"{api}/chat", json={"sessionId": session_id, "message": f"Question {i}", "model": "GPT-5.2"})
+                everything = [row['id'] for row in self.session.get(f"{api}/chat/{session_id}").json()]
+                pages = walk(f"{api}/chat/{session_id}", 4)
+                # Each page is oldest first, and the cursor leads to older messages
+                if [len(page) for page in pages] == [4, 2] and sum(reversed(pages), []) == everything:
+                    self.log_test('pagination', 'messages', 'PASS', "Pages of 4 cover all 6 messages, latest page first")
+                else:
+                    self.log_test('pagination', 'messages', 'FAIL', f"Pages {pages} do not match {everything}")
+        except Exception as e:
+            self.log_test('pagination', 'cursors', 'FAIL', f"Exception: {str(e)}")
+    
+    def test_conditional_gets(self):
+        """Check ETags answer unchanged lists with 304 and change with the data (runs a local backend)"""
+        print("\n=== Testing Conditional GETs ===")
+        
+        try:
+            with self._local_backend("in_etags_") as api:
+                session_id = self.session.post(f"{api}/sessions", json={"title": "ETags"}).json()['id']
+                
+                def revalidate(url):
+                    etag = self.session.get(url).headers.get('ETag')
+                    return etag, self.session.get(url, headers={"If-None-Match": etag}).status_code
+                
+                sessions_etag, status = revalidate(f"{api}/sessions")
+                if sessions_etag and status == 304:
+                    self.log_test('etags', 'sessions_304', 'PASS', "Unchanged session list answered with 304")
+                else:
+                    self.log_test('etags', 'sessions_304', 'FAIL', f"ETag {sessions_etag}, HTTP {status}")
+                
+                messages_etag, status = revalidate(f"{api}/chat/{session_id}")
+                session_etag = self.session.get(f"{api}/sessions/{session_id}").headers.get('ETag')
+                if messages_etag and status == 304 and session_etag == messages_etag:
+                    self.log_test('etags', 'messages_304', 'PASS', "Unchanged messages answered with 304, same ETag as the session")
+                else:
+                    self.log_test('etags', 'messages_304', 'FAIL', f"ETag {messages_etag} (session {session_etag}), HTTP {status}")
+                
+                self.session.post(f"{api}/sessions", json={"title": "Another"})
+                self.session.post(f"{api}/chat", json={"sessionId": session_id, "message": "What is a deadlock?", "model": "GPT-5.2"})
+                changed = {
+                    'sessions': self.session.get(f"{api}/sessions", headers={"If-None-Match": sessions_etag}),
+                    'messages': self.session.get(f"{api}/chat/{session_id}", headers={"If-None-Match": messages_etag}),
+                }
+                statuses = {name: response.status_code for name, response in changed.items()}
+                if statuses == {'sessions': 200, 'messages': 200} and len(changed['messages'].json()) == 2:
+                    self.log_test('etags', 'changed', 'PASS', "A stale ETag gets the new listing")
+                else:
+                    self.log_test('etags', 'changed', 'FAIL', f"Expected 200 for stale ETags: {statuses}")
+        except Exception as e:
+            self.log_test('etags', 'conditional', 'FAIL', f"Exception: {str(e)}")
+    
+    def test_change_feeds(self):
+        """Check /changes and /since/ return only what changed after a cursor (runs a local backend)"""
+        print("\n=== Testing Change Feeds ===")
+        
+        try:
+            with self._local_backend("in_changes_") as api:
+                start = self.session.get(f"{api}/changes", params={"since": 0}).json()['cursor']
+                session_id = self.session.post(f"{api}/sessions", json={"title": "Changes"}).json()['id']
+                self.session.post(f"{api}/input-history", json={"sessionId": session_id, "input": "What is a race condition?"})
+                # Input history is written behind; its reads wait for the write
+                self.session.get(f"{api}/input-history")
+                
+                feed = self.session.get(f"{api}/changes", params={"since": start}).json()
+                kinds = [(change['kind'], change['id'] if change['kind'] != 'input' else change['data']['sessionId'])
+                         for change in feed['changes']]
+                seqs = [change['seq'] for change in feed['changes']]
+                if kinds == [('session', session_id), ('input', session_id)] and seqs == sorted(seqs) and feed['cursor'] == seqs[-1]:
+                    self.log_test('changes', 'since', 'PASS', "Only the session and input added after the cursor, in order")
+                else:
+                    self.log_test('changes', 'since', 'FAIL', f"Unexpected feed after {start}: {feed}")
+                
+                paged = self.session.get(f"{api}/changes", params={"since": start, "limit": 1}).json()
+                rest = self.session.get(f"{api}/changes", params={"since": paged['cursor']}).json()
+                idle = self.session.get(f"{api}/changes", params={"since": feed['cursor']}).json()
+                if paged['hasMore'] and [c['seq'] for c in paged['changes'] + rest['changes']] == seqs and not idle['changes']:
+                    self.log_test('changes', 'has_more', 'PASS', "hasMore pages resume from the cursor; nothing new gives an empty feed")
+                else:
+                    self.log_test('changes', 'has_more', 'FAIL', f"Paged {paged}, rest {rest}, idle {idle}")
+                
+                self.session.delete(f"{api}/sessions/{session_id}")
+                deleted = self.session.get(f"{api}/changes", params={"since": feed['cursor']}).json()
+                if ('session_deleted', session_id) in [(change['kind'], change['id']) for change in deleted['changes']]:
+                    self.log_test('changes', 'session_deleted', 'PASS', "A deleted session appears as session_deleted")
+                else:
+                    self.log_test('changes', 'session_deleted', 'FAIL', f"No session_deleted change: {deleted}")
+                
+                session_id = self.session.post(f"{api}/sessions", json={"title": "Messages"}).json()['id']
+                since_url = f"{api}/chat/{session_id}/since"
+                ask = {"sessionId": session_id, "message": "What is a semaphore?", "model": "GPT-5.2"}
+                self.session.post(f"{api}/chat", json=ask)
+                first = self.session.get(f"{since_url}/0").json()
+                unchanged = self.session.get(f"{since_url}/{first['cursor']}").json()
+                self.session.post(f"{api}/chat", json=ask)
+                added = self.session.get(f"{since_url}/{first['cursor']}").json()
+                if (len(first['messages']) == 2 and not unchanged['messages'] and not unchanged['reset']
+                        and len(added['messages']) == 2 and added['cursor'] > first['cursor']
+                        and not {m['id'] for m in added['messages']} & {m['id'] for m in first['messages']}):
+                    self.log_test('changes', 'messages_since', 'PASS', "Each call returns only the messages added after its cursor")
+                else:
+                    self.log_test('changes', 'messages_since', 'FAIL', f"first {first}, unchanged {unchanged}, added {added}")
+                
+                self.session.delete(f"{api}/chat/{session_id}")
+                cleared = self.session.get(f"{since_url}/{added['cursor']}").json()
+                if cleared['reset'] and not cleared['messages']:
+                    self.log_test('changes', 'messages_reset', 'PASS', "Deleted messages make the next sync a reset")
+                else:
+                    self.log_test('changes', 'messages_reset', 'FAIL', f"Expected an empty reset: {cleared}")
+        except Exception as e:
+            self.log_test('changes', 'feeds', 'FAIL', f"Exception: {str(e)}")
+    
+    def test_write_behind(self):
+        """Check queued writes commit in order, fail alone and are flushed on close (in-process)"""
+        print("\n=== Testing Write-Behind Queue ===")
+        
+        try:
+            database = self._scratch_database("in_write_behind_")
+            from database import SessionDB, InputHistoryDB, MessageDB
+            from write_behind import WriteBehindQueue
+            
+            async def exercise():
+                # A long window so nothing commits before the checks below
+                queue = WriteBehindQueue(window=0.2)
+                now = datetime.utcnow()
+                session_id = str(uuid.uuid4())
+                await SessionDB.create({'id': session_id, 'title': 'Write-behind', 'date': now, 'createdAt': now, 'updatedAt': now})
+                
+                def history(text):
+                    return (InputHistoryDB.create, ({'id': str(uuid.uuid4()), 'sessionId': session_id, 'input': text, 'timestamp': now},))
+                
+                queue.submit_nowait(history('first'), (SessionDB.update_stats, (session_id, 1, '1m')))
+                # Fails on the foreign key; must not take the other units with it
+                failing = queue.submit_nowait((MessageDB.create, ({'id': str(uuid.uuid4()), 'sessionId': 'missing', 'type': 'user', 'content': 'x', 'timestamp': now},)))
+                queue.submit_nowait(history('second'), (SessionDB.update_stats, (session_id, 2, '2m')))
+                before = {'pending': queue.metrics()['pending'], 'rows': len(await InputHistoryDB.get_by_session(session_id))}
+                
+                await queue.flush()
+                flushed = {
+                    'inputs': sorted(row['input'] for row in await InputHistoryDB.get_by_session(session_id)),
+                    'questions': (await SessionDB.get_by_id(session_id))['questionsAsked'],
+                    'failed': failing.exception() is not None,
+                    'metrics': queue.metrics(),
+                }
+                
+                queue.submit_nowait(history('third'))
+                await queue.close()
+                closed = len(await InputHistoryDB.get_by_session(session_id))
+                return before, flushed, closed
+            
+            before, flushed, closed = asyncio.run(exercise())
+            database.close_pool()
+            
+            if before == {'pending': 3, 'rows': 0}:
+                self.log_test('write_behind', 'submit_nowait', 'PASS', "Returns before the write commits")
+            else:
+                self.log_test('write_behind', 'submit_nowait', 'FAIL', f"Expected 3 pending units and no rows yet: {before}")
+            
+            if flushed['inputs'] == ['first', 'second'] and flushed['questions'] == 2:
+                self.log_test('write_behind', 'flush_order', 'PASS', "flush commits queued units in submission order")
+            else:
+                self.log_test('write_behind', 'flush_order', 'FAIL', f"Expected both inputs and the later stats: {flushed}")
+            
+            if flushed['failed'] and flushed['metrics']['failed_units'] == 1 and flushed['metrics']['batches'] == 1:
+                self.log_test('write_behind', 'unit_isolation', 'PASS', f"A failing unit rolls back alone: {flushed['metrics']}")
+            else:
+                self.log_test('write_behind', 'unit_isolation', 'FAIL', f"Expected one failed unit in a shared commit: {flushed}")
+            
+            if closed == 3:
+                self.log_test('write_behind', 'close', 'PASS', "close commits writes still queued")
+            else:
+                self.log_test('write_behind', 'close', 'FAIL', f"Expected 3 rows after close, got {closed}")
+        except Exception as e:
+            self.log_test('write_behind', 'queue', 'FAIL', f"Exception: {str(e)}")
+    
     def cleanup_test_data(self):
         """Clean up test session if it was created"""
         if self.test_session_id:
@@ -356,6 +929,16 @@ class BackendTester:
         self.test_chat_api()
         self.test_input_history_api()
         self.test_gpt_integration()
+        self.test_query_plans()
+        self.test_llm_transport()
+        self.test_keyset_pagination()
+        self.test_conditional_gets()
+        self.test_change_feeds()
+        self.test_write_behind()
+        self.test_job_queue()
+        self.test_input_suggestions()
+        self.test_blob_gc()
+        self.test_idempotent_chat()
         
         # Clean up
         self.cleanup_test_data()
@@ -44,6 +44,17 @@ if errorlevel 1 (
     pip install --no-cache-dir fastapi uvicorn python-dotenv pydantic motor pymongo aiohttp Pillow
 )
 
+REM Fetch the tokenizer once so the app counts tokens offline
+echo.
+echo Fetching the o200k_base tokenizer...
+if not exist tokenizers mkdir tokenizers
+set TIKTOKEN_CACHE_DIR=%CD%\tokenizers
+python -c "import tiktoken; tiktoken.get_encoding('o200k_base')"
+if errorlevel 1 (
+    echo WARNING: Could not fetch the tokenizer, token counts will be estimated...
+)
+set TIKTOKEN_CACHE_DIR=
+
 REM Install emergentintegrations separately
 echo.
 echo Installing emergentintegrations...
@@ -60,7 +71,7 @@ if errorlevel 1 goto error
 
 echo.
 echo [5/5] Building Backend Executable...
-pyinstaller --onefile --name server --hidden-import=emergentintegrations --hidden-import=motor --hidden-import=pymongo --collect-all emergentintegrations server.py
+pyinstaller --onefile --name server --hidden-import=emergentintegrations --hidden-import=motor --hidden-import=pymongo --collect-all emergentintegrations --hidden-import=tiktoken_ext.openai_public --hidden-import=tiktoken_ext --add-data "tokenizers;tokenizers" server.py
 if errorlevel 1 goto error
 
 echo.
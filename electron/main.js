@@ -9,6 +9,8 @@ let backendProcess;
 // Backend server configuration
 const BACKEND_PORT = 8001;
 const BACKEND_HOST = 'localhost';
+// Give up waiting for readiness after this long and open the window anyway
+const BACKEND_READY_TIMEOUT_MS = 30000;
 
 function createWindow() {
   mainWindow = new BrowserWindow({
@@ -62,7 +64,7 @@ function startBackend() {
   const options = {
     hostname: BACKEND_HOST,
     port: BACKEND_PORT,
-    path: '/api/',
+    path: '/api/health/live',
     method: 'GET',
     timeout: 1000
   };
@@ -111,6 +113,41 @@ function startBackend() {
   req.end();
 }
 
+// Resolve once /api/health/ready answers 200 (startup done, database reachable)
+function waitForBackend() {
+  const http = require('http');
+  const deadline = Date.now() + BACKEND_READY_TIMEOUT_MS;
+
+  return new Promise((resolve) => {
+    const poll = () => {
+      const retry = () => {
+        if (Date.now() >= deadline) {
+          console.warn('Backend not ready after', BACKEND_READY_TIMEOUT_MS, 'ms; opening window anyway');
+          resolve(false);
+        } else {
+          setTimeout(poll, 100);
+        }
+      };
+      const req = http.get({
+        hostname: BACKEND_HOST,
+        port: BACKEND_PORT,
+        path: '/api/health/ready',
+        timeout: 1000
+      }, (res) => {
+        res.resume();
+        if (res.statusCode === 200) {
+          resolve(true);
+        } else {
+          retry();
+        }
+      });
+      req.on('timeout', () => req.destroy());
+      req.on('error', retry);
+    };
+    poll();
+  });
+}
+
 function stopBackend() {
   if (backendProcess) {
     console.log('Stopping backend server...');
@@ -124,10 +161,10 @@ app.whenReady().then(() => {
   // Start backend first
   startBackend();
 
-  // Wait a bit for backend to start, then create window
-  setTimeout(() => {
+  // Open the window as soon as the backend reports ready
+  waitForBackend().then(() => {
     createWindow();
-  }, 2000);
+  });
 
   app.on('activate', () => {
     if (BrowserWindow.getAllWindows().length === 0) {
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Fake OpenAI-compatible LLM server for "In" AI Interview Assistant
+Serves /v1/chat/completions (plain and streamed) with injectable latency
+and failures, for exercising the backend's timeout, retry, circuit-breaker
+and hedging policy without a real provider.
+
+Usage:
+    python fake_llm_server.py [--port 8900] [--latency-ms 200] [--tail-ms 3000 --tail-rate 0.05]
+                              [--error-rate 0.1 --error-status 503] [--hang-rate 0.01]
+
+Faults can also be changed at runtime with POST /fault (same names, JSON
+body) and counters read from GET /stats.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI()
+
+# Current fault injection settings; see parse_args for their meaning
+FAULTS = {
+    "latency_ms": 200.0,
+    "tail_ms": 0.0,
+    "tail_rate": 0.0,
+    "error_rate": 0.0,
+    "error_status": 503,
+    "hang_rate": 0.0,
+    "stall_rate": 0.0,
+    "chunks": 8,
+    "chunk_delay_ms": 20.0,
+}
+STATS = {"requests": 0, "errors": 0, "hangs": 0, "stalls": 0, "tails": 0, "completed": 0}
+
+
+async def _delay():
+    """Sleep for the configured latency, or forever for an injected hang"""
+    if random.random() < FAULTS["hang_rate"]:
+        STATS["hangs"] += 1
+        await asyncio.Event().wait()
+    latency = FAULTS["latency_ms"]
+    if random.random() < FAULTS["tail_rate"]:
+        STATS["tails"] += 1
+        latency = FAULTS["tail_ms"]
+    await asyncio.sleep(latency / 1000)
+
+
+def _reply(messages: list) -> str:
+    last = messages[-1].get("content", "") if messages else ""
+    if isinstance(last, list):
+        last = " ".join(part.get("text", "") for part in last if isinstance(part, dict))
+    return f"Fake answer to: {str(last)[:200]}"
+
+
+def _completion(model: str, content: str) -> dict:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": len(content.split()), "total_tokens": 10 + len(content.split())},
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    STATS["requests"] += 1
+    await _delay()
+    if random.random() < FAULTS["error_rate"]:
+        STATS["errors"] += 1
+        status = int(FAULTS["error_status"])
+        return JSONResponse({"error": {"message": f"Injected failure ({status})", "type": "fake_error"}},
+                            status_code=status)
+    model = body.get("model", "fake")
+    content = _reply(body.get("messages", []))
+    if not body.get("stream"):
+        STATS["completed"] += 1
+        return _completion(model, content)
+
+    words = content.split(" ")
+    size = max(1, -(-len(words) // max(1, int(FAULTS["chunks"]))))
+    parts = [" ".join(words[i:i + size]) + (" " if i + size < len(words) else "") for i in range(0, len(words), size)]
+    stall = random.random() < FAULTS["stall_rate"]
+
+    async def events():
+        for index, part in enumerate(parts):
+            if stall and index == len(parts) // 2:
+                STATS["stalls"] += 1
+                await asyncio.Event().wait()
+            chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {"content": part}, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(FAULTS["chunk_delay_ms"] / 1000)
+        STATS["completed"] += 1
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/fault")
+async def set_faults(request: Request):
+    """Change fault settings; unknown keys are rejected. Also resets the counters."""
+    changes = await request.json()
+    unknown = set(changes) - set(FAULTS)
+    if unknown:
+        return JSONResponse({"detail": f"Unknown settings: {sorted(unknown)}"}, status_code=400)
+    FAULTS.update(changes)
+    for key in STATS:
+        STATS[key] = 0
+    return FAULTS
+
+
+@app.get("/stats")
+async def get_stats():
+    return {"faults": FAULTS, **STATS}
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=FAULTS["latency_ms"], help="latency of a normal response")
+    parser.add_argument("--tail-ms", type=float, default=FAULTS["tail_ms"], help="latency of a slow (tail) response")
+    parser.add_argument("--tail-rate", type=float, default=FAULTS["tail_rate"], help="fraction of slow responses")
+    parser.add_argument("--error-rate", type=float, default=FAULTS["error_rate"], help="fraction answered with an error")
+    parser.add_argument("--error-status", type=int, default=FAULTS["error_status"], help="HTTP status of injected errors")
+    parser.add_argument("--hang-rate", type=float, default=FAULTS["hang_rate"], help="fraction that never answer")
+    parser.add_argument("--stall-rate", type=float, default=FAULTS["stall_rate"], help="fraction of streams that stop mid-reply")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    FAULTS.update({key: getattr(args, key) for key in FAULTS if hasattr(args, key)})
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -1,10 +1,13 @@
 import React, { useState, useRef, useEffect } from 'react';
 import { Send, Minimize2, X, Settings as SettingsIcon, History as HistoryIcon, Image as ImageIcon, Mic, Loader2 } from 'lucide-react';
-import { chatAPI, inputHistoryAPI } from '../services/api';
+import { chatAPI, inputHistoryAPI, resolveMediaUrl } from '../services/api';
 import { toast } from 'sonner';
 
 const DesktopApp = ({ sessionId, opacity, onClose, onOpenSettings, onOpenHistory }) => {
   const [messages, setMessages] = useState([]);
+  // Cursor for the page of messages before the oldest one shown; null once all are loaded
+  const [olderCursor, setOlderCursor] = useState(null);
+  const [isLoadingOlder, setIsLoadingOlder] = useState(false);
   const [inputValue, setInputValue] = useState('');
   const [isMinimized, setIsMinimized] = useState(false);
   const [isLoading, setIsLoading] = useState(false);
@@ -16,20 +19,37 @@ const DesktopApp = ({ sessionId, opacity, onClose, onOpenSettings, onOpenHistory
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
   };
 
+  // Follow the newest message (and its streamed tokens), not older pages loaded above it
+  const lastMessage = messages[messages.length - 1];
   useEffect(() => {
     scrollToBottom();
-  }, [messages]);
+  }, [lastMessage]);
 
   const loadMessages = async () => {
     try {
-      const msgs = await chatAPI.getMessages(sessionId);
-      setMessages(msgs);
+      const { items, nextCursor } = await chatAPI.getMessagesPage(sessionId);
+      setMessages(items);
+      setOlderCursor(nextCursor);
     } catch (error) {
       console.error('Error loading messages:', error);
       toast.error('Failed to load conversation history');
     }
   };
 
+  const loadOlderMessages = async () => {
+    setIsLoadingOlder(true);
+    try {
+      const { items, nextCursor } = await chatAPI.getMessagesPage(sessionId, { before: olderCursor });
+      setMessages((prev) => [...items, ...prev]);
+      setOlderCursor(nextCursor);
+    } catch (error) {
+      console.error('Error loading older messages:', error);
+      toast.error('Failed to load earlier messages');
+    } finally {
+      setIsLoadingOlder(false);
+    }
+  };
+
   useEffect(() => {
     if (sessionId) {
       loadMessages();
@@ -54,6 +74,7 @@ const DesktopApp = ({ sessionId, opacity, onClose, onOpenSettings, onOpenHistory
 
     const messageText = inputValue.trim() || 'Please analyze this image';
     setIsLoading(true);
+    const streamingId = `stream${Date.now()}`;
 
     try {
       // Save to input history
@@ -71,21 +92,26 @@ const DesktopApp = ({ sessionId, opacity, onClose, onOpenSettings, onOpenHistory
       setMessages((prev) => [...prev, newUserMessage]);
       setInputValue('');
       
-      // Send to API
-      const aiResponse = await chatAPI.sendMessage(
-        sessionId,
-        messageText,
-        'GPT-5.2',
-        selectedImage ? 'image' : 'text',
-        selectedImage,
-        null
-      );
-
-      setMessages((prev) => [...prev, aiResponse]);
+      // Stream the reply into a placeholder message as tokens arrive
+      setMessages((prev) => [...prev, { id: streamingId, type: 'assistant', content: '', timestamp: new Date().toISOString() }]);
+      const aiResponse = await chatAPI.streamMessage(sessionId, messageText, {
+        model: 'GPT-5.2',
+        messageType: selectedImage ? 'image' : 'text',
+        imageData: selectedImage,
+        onToken: (token) => {
+          setMessages((prev) => prev.map((msg) => (
+            msg.id === streamingId ? { ...msg, content: msg.content + token } : msg
+          )));
+        }
+      });
+
+      setMessages((prev) => prev.map((msg) => (msg.id === streamingId ? aiResponse : msg)));
       setSelectedImage(null);
       toast.success('AI response received!');
     } catch (error) {
       console.error('Error sending message:', error);
+      // Drop the placeholder if nothing was streamed into it
+      setMessages((prev) => prev.filter((msg) => msg.id !== streamingId || msg.content));
       toast.error('Failed to send message. Please try again.');
     } finally {
       setIsLoading(false);
@@ -155,6 +181,17 @@ const DesktopApp = ({ sessionId, opacity, onClose, onOpenSettings, onOpenHistory
             <p className="text-xs mt-2">Ask questions, share images, or practice answers</p>
           </div>
         )}
+        {olderCursor && (
+          <div className="text-center">
+            <button
+              onClick={loadOlderMessages}
+              disabled={isLoadingOlder}
+              className="text-xs text-cyan-400 hover:text-cyan-300 disabled:opacity-50"
+            >
+              {isLoadingOlder ? 'Loading…' : 'Load earlier messages'}
+            </button>
+          </div>
+        )}
         {messages.map((message) => (
           <div
             key={message.id}
@@ -169,7 +206,7 @@ const DesktopApp = ({ sessionId, opacity, onClose, onOpenSettings, onOpenHistory
             >
               {message.imageUrl && (
                 <img 
-                  src={message.imageUrl} 
+                  src={resolveMediaUrl(message.imageUrl)} 
                   alt="Uploaded" 
                   className="rounded mb-2 max-w-full h-auto"
                 />
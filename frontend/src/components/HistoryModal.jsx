@@ -1,13 +1,17 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { X, Clock, MessageSquare, Loader2 } from 'lucide-react';
 import { Dialog, DialogContent, DialogHeader, DialogTitle } from './ui/dialog';
 import { ScrollArea } from './ui/scroll-area';
-import { sessionsAPI } from '../services/api';
+import { sessionsAPI, eventsAPI } from '../services/api';
 import { toast } from 'sonner';
 
 const HistoryModal = ({ isOpen, onClose, onLoadSession }) => {
   const [sessions, setSessions] = useState([]);
   const [isLoading, setIsLoading] = useState(false);
+  // Cursor for the next (older) page of sessions; null once all are loaded
+  const [nextCursor, setNextCursor] = useState(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
+  const listEndRef = useRef(null);
 
   useEffect(() => {
     if (isOpen) {
@@ -15,11 +19,28 @@ const HistoryModal = ({ isOpen, onClose, onLoadSession }) => {
     }
   }, [isOpen]);
 
+  // Keep the open list current from pushed events instead of polling
+  useEffect(() => {
+    if (!isOpen) return undefined;
+    return eventsAPI.subscribe(({ type, data }) => {
+      if (type === 'session.updated') {
+        setSessions((current) => (current.some((session) => session.id === data.id)
+          ? current.map((session) => (session.id === data.id ? data : session))
+          : [data, ...current]));
+      } else if (type === 'session.deleted') {
+        setSessions((current) => current.filter((session) => session.id !== data.id));
+      } else if (type === 'resync') {
+        loadSessions();
+      }
+    });
+  }, [isOpen]);
+
   const loadSessions = async () => {
     setIsLoading(true);
     try {
-      const data = await sessionsAPI.getAll();
-      setSessions(data);
+      const { items, nextCursor: cursor } = await sessionsAPI.getPage();
+      setSessions(items);
+      setNextCursor(cursor);
     } catch (error) {
       console.error('Error loading sessions:', error);
       toast.error('Failed to load session history');
@@ -28,6 +49,34 @@ const HistoryModal = ({ isOpen, onClose, onLoadSession }) => {
     }
   };
 
+  const loadMoreSessions = async () => {
+    if (!nextCursor || isLoadingMore) return;
+    setIsLoadingMore(true);
+    try {
+      const { items, nextCursor: cursor } = await sessionsAPI.getPage({ before: nextCursor });
+      // A session pushed by an event may already be in the list
+      setSessions((current) => [...current, ...items.filter((item) => !current.some((session) => session.id === item.id))]);
+      setNextCursor(cursor);
+    } catch (error) {
+      console.error('Error loading sessions:', error);
+      toast.error('Failed to load older sessions');
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
+  // Load the next page when the end of the list scrolls into view
+  useEffect(() => {
+    const node = listEndRef.current;
+    if (!node || !nextCursor || isLoadingMore) return undefined;
+    const observer = new IntersectionObserver((entries) => {
+      if (entries.some((entry) => entry.isIntersecting)) loadMoreSessions();
+    });
+    observer.observe(node);
+    return () => observer.disconnect();
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [nextCursor, isLoadingMore, sessions.length]);
+
   const formatDate = (dateString) => {
     const date = new Date(dateString);
     return date.toLocaleDateString() + ' ' + date.toLocaleTimeString();
@@ -87,6 +136,11 @@ const HistoryModal = ({ isOpen, onClose, onLoadSession }) => {
                   </div>
                 </div>
               ))}
+              {nextCursor && (
+                <div ref={listEndRef} className="flex items-center justify-center py-3">
+                  <Loader2 className={`w-5 h-5 text-cyan-400 ${isLoadingMore ? 'animate-spin' : 'opacity-0'}`} />
+                </div>
+              )}
             </div>
           )}
         </ScrollArea>
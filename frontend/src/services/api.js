@@ -7,6 +7,9 @@ const API = `${BACKEND_URL}/api`;
 console.log('Backend URL:', BACKEND_URL);
 console.log('API URL:', API);
 
+// Message media is stored as a backend-relative blob reference (/api/blobs/<hash>)
+export const resolveMediaUrl = (url) => (url && url.startsWith('/api/') ? `${BACKEND_URL}${url}` : url);
+
 // Sessions API
 export const sessionsAPI = {
   create: async (title, model = 'GPT-5.2') => {
@@ -21,9 +24,22 @@ export const sessionsAPI = {
     }
   },
   
+  // Every session, newest first, following X-Next-Cursor page by page
   getAll: async () => {
-    const response = await axios.get(`${API}/sessions`);
-    return response.data;
+    const sessions = [];
+    let before = null;
+    do {
+      const { items, nextCursor } = await sessionsAPI.getPage({ limit: 200, before });
+      sessions.push(...items);
+      before = nextCursor;
+    } while (before);
+    return sessions;
+  },
+  
+  // Keyset pagination: pass the returned nextCursor as `before` to load older sessions
+  getPage: async ({ limit = 50, before = null, after = null } = {}) => {
+    const response = await axios.get(`${API}/sessions`, { params: { limit, before, after } });
+    return { items: response.data, nextCursor: response.headers['x-next-cursor'] || null };
   },
   
   getById: async (sessionId) => {
@@ -36,6 +52,11 @@ export const sessionsAPI = {
     return response.data;
   },
   
+  deleteMany: async (sessionIds) => {
+    const response = await axios.delete(`${API}/sessions`, { data: { ids: sessionIds } });
+    return response.data;
+  },
+  
   updateStats: async (sessionId, questionsAsked, duration) => {
     const response = await axios.patch(`${API}/sessions/${sessionId}/update-stats`, {
       questions_asked: questionsAsked,
@@ -47,7 +68,9 @@ export const sessionsAPI = {
 
 // Chat API
 export const chatAPI = {
-  sendMessage: async (sessionId, message, model = 'GPT-5.2', messageType = 'text', imageData = null, audioData = null) => {
+  // Pass the same idempotencyKey when retrying so the message is only answered and saved once
+  sendMessage: async (sessionId, message, model = 'GPT-5.2', messageType = 'text', imageData = null, audioData = null,
+                      idempotencyKey = crypto.randomUUID()) => {
     const response = await axios.post(`${API}/chat`, {
       sessionId,
       message,
@@ -55,12 +78,90 @@ export const chatAPI = {
       messageType,
       imageData,
       audioData
-    });
+    }, { headers: { 'Idempotency-Key': idempotencyKey } });
+    return response.data;
+  },
+  
+  // Saves the message and returns at once with { jobId, messageId, replyId };
+  // the reply arrives as a message.created event or via jobsAPI.wait
+  queueMessage: async (sessionId, message, { model = 'GPT-5.2', messageType = 'text', imageData = null, audioData = null,
+                                             idempotencyKey = crypto.randomUUID() } = {}) => {
+    const response = await axios.post(`${API}/chat`, {
+      sessionId,
+      message,
+      model,
+      messageType,
+      imageData,
+      audioData
+    }, { headers: { 'Idempotency-Key': idempotencyKey, Prefer: 'respond-async' } });
     return response.data;
   },
   
+  // Streams the reply over server-sent events; onToken receives each chunk as it arrives.
+  // Resolves with the saved assistant message.
+  streamMessage: async (sessionId, message, { model = 'GPT-5.2', messageType = 'text', imageData = null, audioData = null, onToken,
+                                              idempotencyKey = crypto.randomUUID() } = {}) => {
+    const response = await fetch(`${API}/chat/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', 'Idempotency-Key': idempotencyKey },
+      body: JSON.stringify({ sessionId, message, model, messageType, imageData, audioData })
+    });
+    if (response.status === 429) {
+      throw new Error(`AI is busy; try again in ${response.headers.get('Retry-After') || 1}s`);
+    }
+    if (!response.ok) {
+      throw new Error(`Chat stream failed with HTTP ${response.status}`);
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let result = null;
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const raw = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        const event = /^event: (.*)$/m.exec(raw)?.[1];
+        const data = JSON.parse(/^data: (.*)$/m.exec(raw)?.[1] || 'null');
+        if (event === 'token') {
+          onToken?.(data.token);
+        } else if (event === 'done') {
+          result = data;
+        } else if (event === 'error') {
+          throw new Error(data.detail);
+        }
+      }
+    }
+    if (!result) {
+      throw new Error('Chat stream ended before the reply was saved');
+    }
+    return result;
+  },
+  
+  // Every message of a session, oldest first, following X-Next-Cursor page by page
   getMessages: async (sessionId) => {
-    const response = await axios.get(`${API}/chat/${sessionId}`);
+    let messages = [];
+    let before = null;
+    do {
+      const { items, nextCursor } = await chatAPI.getMessagesPage(sessionId, { limit: 500, before });
+      messages = [...items, ...messages];
+      before = nextCursor;
+    } while (before);
+    return messages;
+  },
+  
+  // Keyset pagination: pass the returned nextCursor as `before` to load older messages
+  getMessagesPage: async (sessionId, { limit = 100, before = null, after = null } = {}) => {
+    const response = await axios.get(`${API}/chat/${sessionId}`, { params: { limit, before, after } });
+    return { items: response.data, nextCursor: response.headers['x-next-cursor'] || null };
+  },
+  
+  getMessagesSince: async (sessionId, cursor = 0, limit = 500) => {
+    const response = await axios.get(`${API}/chat/${sessionId}/since/${cursor}`, { params: { limit } });
     return response.data;
   },
   
@@ -88,5 +189,123 @@ export const inputHistoryAPI = {
   getBySession: async (sessionId) => {
     const response = await axios.get(`${API}/input-history/${sessionId}`);
     return response.data;
+  },
+  
+  suggest: async (prefix, limit = 8) => {
+    const response = await axios.get(`${API}/input-history/suggest`, { params: { prefix, limit } });
+    return response.data;
+  }
+};
+
+// Changes API
+export const changesAPI = {
+  getChanges: async (since = 0, limit = 200) => {
+    const response = await axios.get(`${API}/changes`, { params: { since, limit } });
+    return response.data;
+  }
+};
+
+// Search API
+export const searchAPI = {
+  search: async (q, { sessionId, kind, limit = 20, cursor } = {}) => {
+    const response = await axios.get(`${API}/search`, {
+      params: { q, session_id: sessionId, kind, limit, cursor },
+      paramsSerializer: { indexes: null }
+    });
+    return { items: response.data, nextCursor: response.headers['x-next-cursor'] || null };
+  }
+};
+
+// Events API
+export const eventsAPI = {
+  // Calls onEvent({ type, data }) for every pushed event; reconnects until the
+  // returned unsubscribe function is called
+  subscribe: (onEvent, { sessionIds = [] } = {}) => {
+    const url = new URL(`${API.replace(/^http/, 'ws')}/ws`);
+    sessionIds.forEach((id) => url.searchParams.append('session_id', id));
+    let socket = null;
+    let closed = false;
+    let retryDelay = 1000;
+    
+    const connect = () => {
+      socket = new WebSocket(url.toString());
+      socket.onopen = () => { retryDelay = 1000; };
+      socket.onmessage = (message) => onEvent(JSON.parse(message.data));
+      socket.onclose = () => {
+        if (closed) return;
+        // Events may have been missed while disconnected
+        onEvent({ type: 'resync', data: { reason: 'reconnected' } });
+        setTimeout(connect, retryDelay);
+        retryDelay = Math.min(retryDelay * 2, 30000);
+      };
+    };
+    connect();
+    
+    return () => {
+      closed = true;
+      socket.close();
+    };
+  }
+};
+
+// Background jobs, e.g. the reply to a queued message
+export const jobsAPI = {
+  get: async (jobId) => {
+    const response = await axios.get(`${API}/jobs/${jobId}`);
+    return response.data;
+  },
+  
+  // Poll until the job is done (resolves with its result) or has failed
+  wait: async (jobId, { interval = 500 } = {}) => {
+    while (true) {
+      const job = await jobsAPI.get(jobId);
+      if (job.status === 'done') return job.result;
+      if (job.status === 'failed') throw new Error(job.lastError || 'Job failed');
+      await new Promise((resolve) => setTimeout(resolve, interval));
+    }
+  }
+};
+
+// Speech-to-text runs on this machine; audio is never sent elsewhere
+export const speechAPI = {
+  // Transcribe a whole recording (base64 or data URL)
+  transcribe: async (audioData) => {
+    try {
+      const response = await axios.post(`${API}/transcribe`, { audioData });
+      return response.data;
+    } catch (error) {
+      console.error('Error transcribing audio:', error);
+      throw error;
+    }
+  },
+  
+  // Transcribe while recording: pass each chunk (e.g. MediaRecorder's
+  // dataavailable Blob) to send(); onPartial(text) is called as the
+  // transcript grows and end() resolves to the final transcript
+  stream: ({ onPartial } = {}) => {
+    const socket = new WebSocket(`${API.replace(/^http/, 'ws')}/transcribe/stream`);
+    const pending = [];
+    let settle;
+    const final = new Promise((resolve, reject) => { settle = { resolve, reject }; });
+    
+    socket.onopen = () => pending.splice(0).forEach((data) => socket.send(data));
+    socket.onmessage = (message) => {
+      const { type, data } = JSON.parse(message.data);
+      if (type === 'partial') onPartial?.(data.text);
+      else if (type === 'final') settle.resolve(data);
+      else if (type === 'error') settle.reject(new Error(data.detail));
+    };
+    // No effect once the final transcript has arrived
+    socket.onclose = () => settle.reject(new Error('Transcription stream closed'));
+    
+    const send = (data) => (socket.readyState === WebSocket.OPEN ? socket.send(data) : pending.push(data));
+    return {
+      send,
+      end: () => {
+        send(JSON.stringify({ type: 'end' }));
+        return final;
+      },
+      close: () => socket.close()
+    };
   }
 };